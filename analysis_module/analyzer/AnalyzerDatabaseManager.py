@@ -57,7 +57,7 @@ class AnalyzerDatabaseManager(object):
             filter_dict = {"$and": filter_dict_elems}
         
         # set up elements to group by (service call fields and temporal aggregation window)
-        group_dict = {col: "$%s" % col for col in self._config.service_call_fields}
+        group_dict = {self._config.service_call_key_field: "$%s" % self._config.service_call_key_field}
         group_dict[self._config.timestamp_field] = {
             "$subtract": [
                 "$%s" % self._config.timestamp_field,
@@ -67,14 +67,14 @@ class AnalyzerDatabaseManager(object):
         res = clean_data.aggregate([
             {'$project': project_dict},
             {'$match': filter_dict},
-            {'$group': {
+            {'$group': self._add_service_call_fields({
                 "_id": group_dict,
                 "request_count": {"$sum": 1},
                 "mean_request_size": {"$avg": "$requestSize"},
                 "mean_response_size": {"$avg": "$responseSize"},
                 "mean_client_duration": {"$avg": "$totalDuration"},
                 "mean_producer_duration": {"$avg": "$producerDurationProducerView"},
-                "request_ids": {"$push": "$_id"}}}],
+                "request_ids": {"$push": "$_id"}})}],
             allowDiskUse=True, maxTimeMS=14400000)
         
         return self._generate_dataframe(list(res))
@@ -95,14 +95,14 @@ class AnalyzerDatabaseManager(object):
             filter_dict["$or"] = data.to_dict(orient="records")
         
         # set up elements to group by (service call fields and temporal aggregation window)
-        group_dict = {col: "$%s" % col for col in self._config.service_call_fields}
+        group_dict = {self._config.service_call_key_field: "$%s" % self._config.service_call_key_field}
         
         res = clean_data.aggregate([
             {'$project': project_dict},
             {'$match': filter_dict},
-            {'$group': {
+            {'$group': self._add_service_call_fields({
                 "_id": group_dict,
-                self._config.timestamp_field: {"$min": "$%s" % self._config.timestamp_field}}}],
+                self._config.timestamp_field: {"$min": "$%s" % self._config.timestamp_field}})}],
             allowDiskUse=True, maxTimeMS=14400000)
         
         res = list(res)
@@ -170,7 +170,7 @@ class AnalyzerDatabaseManager(object):
             filter_dict = {}
         
         # set up elements to group by (service call fields and temporal aggregation window)
-        group_dict = {col: "$%s" % col for col in self._config.service_call_fields}
+        group_dict = {self._config.service_call_key_field: "$%s" % self._config.service_call_key_field}
         group_dict[self._config.timestamp_field] = {
             "$subtract": [
                 "$%s" % self._config.timestamp_field,
@@ -181,10 +181,10 @@ class AnalyzerDatabaseManager(object):
         res = clean_data.aggregate([
             {'$project': project_dict},
             {'$match': filter_dict},
-            {'$group': {
+            {'$group': self._add_service_call_fields({
                 "_id": group_dict,
                 'count': {'$sum': 1},
-                "request_ids": {"$push": "$_id"}}}],
+                "request_ids": {"$push": "$_id"}})}],
             allowDiskUse=True, maxTimeMS=14400000)
         
         return self._generate_dataframe(list(res))
@@ -213,7 +213,7 @@ class AnalyzerDatabaseManager(object):
             filter_dict = {"$and": filter_dict_elems}
         
         # set up elements to group by (service call fields and temporal aggregation window)
-        group_dict = {col: "$%s" % col for col in self._config.service_call_fields}
+        group_dict = {self._config.service_call_key_field: "$%s" % self._config.service_call_key_field}
         group_dict[self._config.timestamp_field] = {
             "$subtract": [
                 "$%s" % self._config.timestamp_field,
@@ -224,9 +224,9 @@ class AnalyzerDatabaseManager(object):
         res = clean_data.aggregate([
             {'$project': project_dict},
             {'$match': filter_dict},
-            {'$group': {"_id": group_dict,
-                        'message_id_count': {'$sum': 1},
-                        "request_ids": {"$push": "$_id"}}},
+            {'$group': self._add_service_call_fields({"_id": group_dict,
+                                                      'message_id_count': {'$sum': 1},
+                                                      "request_ids": {"$push": "$_id"}})},
             {'$match': {'message_id_count': {"$gt": 1}}}],
             allowDiskUse=True, maxTimeMS=14400000)
         
@@ -256,7 +256,7 @@ class AnalyzerDatabaseManager(object):
             filter_dict = {"$and": filter_dict_elems}
         
         # set up elements to group by (service call fields and temporal aggregation window)
-        group_dict = {col: "$%s" % col for col in self._config.service_call_fields}
+        group_dict = {self._config.service_call_key_field: "$%s" % self._config.service_call_key_field}
         group_dict[self._config.timestamp_field] = {
             "$subtract": [
                 "$%s" % self._config.timestamp_field,
@@ -266,18 +266,18 @@ class AnalyzerDatabaseManager(object):
         res = clean_data.aggregate([
             {'$project': project_dict},
             {'$match': filter_dict},
-            {'$group': {"_id": group_dict,
-                        'request_count': {'$sum': 1},
-                        "docs": {"$push":
-                                 {relevant_metric: "$%s" % relevant_metric,
-                                  "id": "$_id"}}}},
+            {'$group': self._add_service_call_fields({"_id": group_dict,
+                                                      'request_count': {'$sum': 1},
+                                                      "docs": {"$push":
+                                                               {relevant_metric: "$%s" % relevant_metric,
+                                                                "id": "$_id"}}})},
             {"$unwind": "$docs"},
             {'$match': {'docs.%s' % relevant_metric: {"$lt": threshold}}},
-            {'$group': {"_id": "$_id",
-                        'erroneous_count': {'$sum': 1},
-                        'avg_erroneous_diff': {'$avg': '$docs.%s' % relevant_metric},
-                        "request_count": {"$first": "$request_count"},
-                        "request_ids": {"$push": "$docs.id"}}}
+            {'$group': self._add_service_call_fields({"_id": "$_id",
+                                                      'erroneous_count': {'$sum': 1},
+                                                      'avg_erroneous_diff': {'$avg': '$docs.%s' % relevant_metric},
+                                                      "request_count": {"$first": "$request_count"},
+                                                      "request_ids": {"$push": "$docs.id"}})}
 
         ], allowDiskUse=True, maxTimeMS=14400000)
         
@@ -492,13 +492,27 @@ class AnalyzerDatabaseManager(object):
             project_dict[col] = {"$ifNull": ["$%s" % field1, "$%s" % field2]}
         for col in self._config.relevant_cols_general:
             project_dict[col] = "$%s" % col
+        # serviceCallKey is stored by the corrector, for older documents it is built from the service call fields
+        key_parts = []
+        for col in self._config.service_call_fields:
+            if key_parts:
+                key_parts.append("/")
+            key_parts.append({"$ifNull": [project_dict[col], ""]})
+        project_dict[self._config.service_call_key_field] = {
+            "$ifNull": ["$%s" % self._config.service_call_key_field, {"$concat": key_parts}]}
         return project_dict
+
+    def _add_service_call_fields(self, group_stage):
+        # Data is grouped by the service call key only, the service call fields are taken from the first document
+        for col in self._config.service_call_fields:
+            group_stage[col] = {"$first": "$%s" % col}
+        return group_stage
     
     def _generate_dataframe(self, result):
         data = pd.DataFrame(result)
         if len(data) > 0:
             data = pd.concat([data, pd.DataFrame(list(data["_id"]))], axis=1)
-            data = data.drop(["_id"], axis=1)
+            data = data.drop(["_id", self._config.service_call_key_field], axis=1)
             data.loc[:, self._config.timestamp_field] = pd.to_datetime(data.loc[:, self._config.timestamp_field], unit='ms')
 
             for col in self._config.service_call_fields:
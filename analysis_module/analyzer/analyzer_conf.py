@@ -3,6 +3,8 @@ timestamp_field = 'requestInTs'
 service_call_fields = ["clientMemberClass", "clientMemberCode", "clientXRoadInstance", "clientSubsystemCode", "serviceCode",
                        "serviceVersion", "serviceMemberClass", "serviceMemberCode", "serviceXRoadInstance",
                        "serviceSubsystemCode"]
+# Service call fields joined with '/', stored in clean_data by the corrector
+service_call_key_field = 'serviceCallKey'
 
 # Fields to query from the database
 
@@ -0,0 +1,249 @@
+""" Fake Security Server - Collector Module Benchmark
+
+Local stand-in for the getSecurityServerOperationalData service of X-Road security servers.
+Every simulated server produces records_per_second records and answers with a multipart response
+holding the gzipped operational-monitoring-data.json.gz attachment, at most page_records records per response.
+Latency and failure rate are configurable per server.
+
+Usage example:
+
+> python3 -m collector_module.benchmark.fake_security_server --port 8080 --records-per-second 5 --latency 0.1
+
+GET /stats returns the counters of the served requests as JSON, GET /stats?reset=1 also resets them.
+"""
+
+import argparse
+import gzip
+import json
+import math
+import random
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+BOUNDARY = 'xroadBenchmarkBoundary0123456789'
+
+DEFAULT_PROFILE = {
+    # Records produced by the server per second
+    'records_per_second': 1.0,
+    # Maximum number of records returned by one query, security server default is 10000
+    'page_records': 10000,
+    # Seconds waited before the response
+    'latency': 0.0,
+    # Share of the queries answered with HTTP 500
+    'failure_rate': 0.0,
+}
+
+SOAP_RESPONSE = """<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/"
+ xmlns:om="http://x-road.eu/xsd/op-monitoring.xsd"><SOAP-ENV:Body>
+<om:getSecurityServerOperationalDataResponse>
+<om:recordsCount>{records_count}</om:recordsCount>
+<om:records><xop:Include xmlns:xop="http://www.w3.org/2004/08/xop/include" href="cid:operational-monitoring-data.json.gz"/></om:records>
+{next_records_from}</om:getSecurityServerOperationalDataResponse>
+</SOAP-ENV:Body></SOAP-ENV:Envelope>"""
+
+SOAP_FAULT = """<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/"><SOAP-ENV:Body>
+<SOAP-ENV:Fault><faultcode>Server.ServerProxy.Benchmark</faultcode><faultstring>Simulated failure</faultstring></SOAP-ENV:Fault>
+</SOAP-ENV:Body></SOAP-ENV:Envelope>"""
+
+
+def get_search_value(body, name):
+    match = re.search(r'<(?:\w+:)?{0}>\s*([^<\s]+)\s*</'.format(name), body)
+    return match.group(1) if match else None
+
+
+def build_record(server_code, index, timestamp):
+    """ Returns one operational monitoring record, similar in size and fields to the real ones.
+    """
+    request_in = timestamp * 1000 + index % 1000
+    return {
+        'monitoringDataTs': timestamp,
+        'securityServerInternalIp': '10.0.0.1',
+        'securityServerType': 'Client' if index % 2 else 'Producer',
+        'requestInTs': request_in,
+        'requestOutTs': request_in + 2,
+        'responseInTs': request_in + 40,
+        'responseOutTs': request_in + 42,
+        'clientXRoadInstance': 'BENCH',
+        'clientMemberClass': 'COM',
+        'clientMemberCode': 'client-{0}'.format(index % 50),
+        'clientSubsystemCode': 'consumer',
+        'serviceXRoadInstance': 'BENCH',
+        'serviceMemberClass': 'GOV',
+        'serviceMemberCode': server_code,
+        'serviceSubsystemCode': 'producer',
+        'serviceCode': 'service-{0}'.format(index % 20),
+        'serviceVersion': 'v1',
+        'messageId': '{0}-{1}'.format(server_code, index),
+        'messageUserId': 'EE{0:011d}'.format(index % 100000),
+        'messageIssue': None,
+        'messageProtocolVersion': '4.0',
+        'clientSecurityServerAddress': 'client-ss.bench',
+        'serviceSecurityServerAddress': '{0}.bench'.format(server_code),
+        'requestSoapSize': 1200 + index % 300,
+        'requestMimeSize': 1200 + index % 300,
+        'requestAttachmentCount': 0,
+        'responseSoapSize': 2400 + index % 700,
+        'responseMimeSize': 2400 + index % 700,
+        'responseAttachmentCount': 0,
+        'succeeded': index % 100 != 0,
+        'soapFaultCode': None if index % 100 else 'Server.ServiceFailed',
+        'soapFaultString': None if index % 100 else 'Simulated service failure',
+    }
+
+
+def get_records(server_code, profile, records_from, records_to):
+    """ Returns the records of the server in the time range and the nextRecordsFrom value (or None).
+    Record number k of a server has timestamp floor(k / records_per_second). A page ends at a whole second, so
+    the next page starts right after the last record served and no record is served twice.
+    """
+    rate = float(profile['records_per_second'])
+    if rate <= 0:
+        return [], None
+    first = int(math.ceil(records_from * rate))
+    end = int(math.ceil((records_to + 1) * rate))
+    last = min(end, first + profile['page_records'])
+    next_records_from = None
+    if last < end:
+        next_records_from = int(last / rate)
+        if next_records_from <= records_from:
+            # More than page_records records in one second, the whole second is served
+            next_records_from = records_from + 1
+        last = int(math.ceil(next_records_from * rate))
+        if last >= end:
+            next_records_from = None
+    records = [build_record(server_code, k, int(k / rate)) for k in range(first, last)]
+    return records, next_records_from
+
+
+def build_response(records, next_records_from):
+    """ Returns the multipart response body with gzipped attachment.
+    """
+    next_element = ''
+    if next_records_from is not None:
+        next_element = '<om:nextRecordsFrom>{0}</om:nextRecordsFrom>\n'.format(next_records_from)
+    soap = SOAP_RESPONSE.format(records_count=len(records), next_records_from=next_element)
+    attachment = gzip.compress(json.dumps({'records': records}).encode('utf-8'), compresslevel=6)
+    return b''.join([
+        '--{0}\r\ncontent-type: text/xml; charset=UTF-8\r\n\r\n'.format(BOUNDARY).encode('ascii'),
+        soap.encode('utf-8'),
+        '\r\n--{0}\r\ncontent-type: application/gzip\r\ncontent-transfer-encoding: binary\r\n'
+        'content-id: <operational-monitoring-data.json.gz>\r\n\r\n'.format(BOUNDARY).encode('ascii'),
+        attachment,
+        '\r\n--{0}--\r\n'.format(BOUNDARY).encode('ascii')])
+
+
+class FakeSecurityServerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('content-length', 0))).decode('utf-8')
+        server_code = get_search_value(body, 'serverCode')
+        profile = server.get_profile(server_code)
+        if profile['latency']:
+            time.sleep(profile['latency'])
+        if server.random.random() < profile['failure_rate']:
+            server.count(failures=1)
+            self.send_body(500, 'text/xml; charset=UTF-8', SOAP_FAULT.encode('utf-8'))
+            return
+        records, next_records_from = get_records(server_code, profile, int(get_search_value(body, 'recordsFrom')),
+                                                 int(get_search_value(body, 'recordsTo')))
+        response = build_response(records, next_records_from)
+        server.count(records=len(records), response_bytes=len(response))
+        content_type = 'multipart/related; type="text/xml"; charset=UTF-8; boundary={0}'.format(BOUNDARY)
+        self.send_body(200, content_type, response)
+
+    def do_GET(self):
+        if not self.path.startswith('/stats'):
+            self.send_body(404, 'text/plain', b'Not found')
+            return
+        stats = self.server.get_stats(reset='reset' in self.path)
+        self.send_body(200, 'application/json', json.dumps(stats).encode('utf-8'))
+
+    def send_body(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSecurityServer(socketserver.ThreadingMixIn, HTTPServer):
+    """ HTTP server simulating any number of security servers, identified by serverCode of the query.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, default_profile=None, profiles=None, seed=None):
+        """
+        :param address: (host, port) to listen on, port 0 selects a free port.
+        :param default_profile: Profile of the servers not in profiles, see DEFAULT_PROFILE.
+        :param profiles: Dictionary of profiles by serverCode.
+        :param seed: Seed of the simulated failures.
+        """
+        HTTPServer.__init__(self, address, FakeSecurityServerHandler)
+        self.default_profile = dict(DEFAULT_PROFILE)
+        self.default_profile.update(default_profile or {})
+        self.profiles = profiles or {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = None
+        self.get_stats(reset=True)
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}/'.format(self.server_address[0], self.server_address[1])
+
+    def get_profile(self, server_code):
+        profile = dict(self.default_profile)
+        profile.update(self.profiles.get(server_code, {}))
+        return profile
+
+    def count(self, records=0, response_bytes=0, failures=0):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['records'] += records
+            self.stats['response_bytes'] += response_bytes
+            self.stats['failures'] += failures
+
+    def get_stats(self, reset=False):
+        with self.lock:
+            stats = self.stats
+            if reset:
+                self.stats = {'requests': 0, 'failures': 0, 'records': 0, 'response_bytes': 0}
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', dest='host', help='Listen address (default: %(default)s)', default='127.0.0.1')
+    parser.add_argument('--port', dest='port', type=int, help='Listen port (default: %(default)s)', default=8080)
+    parser.add_argument('--records-per-second', dest='records_per_second', type=float,
+                        default=DEFAULT_PROFILE['records_per_second'], help='Records per second of every server')
+    parser.add_argument('--page-records', dest='page_records', type=int, default=DEFAULT_PROFILE['page_records'],
+                        help='Maximum records per response (default: %(default)s)')
+    parser.add_argument('--latency', dest='latency', type=float, default=0.0, help='Response latency in seconds')
+    parser.add_argument('--failure-rate', dest='failure_rate', type=float, default=0.0,
+                        help='Share of failed queries, 0.0 - 1.0')
+    args = parser.parse_args()
+
+    server = FakeSecurityServer((args.host, args.port), {
+        'records_per_second': args.records_per_second, 'page_records': args.page_records,
+        'latency': args.latency, 'failure_rate': args.failure_rate})
+    print('- Fake security server listening on {0}'.format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+""" Collector Benchmark - Collector Module
+
+Runs collector_main against N servers simulated by the fake security server and reports the throughput.
+Needs a MongoDB server (settings MONGODB_SERVER, MONGODB_USER, MONGODB_PWD); all the data is written
+into the databases of a separate suffix (--suffix), which are cleared before the run.
+
+Usage example:
+
+> python3 -m collector_module.benchmark.run_benchmark --servers 50 --records-per-second 2 --backlog 3600 --latency 0.2
+
+The spool, sharding and backfill are disabled for the run, so the pages of every server are fetched in sequence
+and written into MongoDB.
+
+Reported per cycle: queries, failed queries, records, records/s, cycle time and the maximum resident memory
+of the collector process and of its worker processes (pool engine).
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import resource
+import shutil
+import tempfile
+import time
+
+import requests
+
+from .. import settings
+from ..collector import collector_main
+from ..collectorlib.database_manager import DatabaseManager, RAW_DATA_COLLECTION
+from ..collectorlib.logger_manager import LoggerManager
+from .fake_security_server import FakeSecurityServer
+
+
+def get_server_list(count):
+    server_list = []
+    for i in range(count):
+        data = {'ownerId': str(i), 'instance': 'BENCH', 'memberClass': 'GOV', 'memberCode': 'member-{0}'.format(i),
+                'serverCode': 'ss-{0}'.format(i), 'address': 'ss-{0}.bench'.format(i)}
+        data['server'] = '/'.join([data['instance'], data['memberClass'], data['memberCode'], data['serverCode'],
+                                   data['address']])
+        server_list.append(data)
+    return server_list
+
+
+def prepare_database(server_m, server_list, backlog):
+    """ Clears the benchmark databases and sets every server pointer backlog seconds behind.
+    """
+    client = server_m.get_client()
+    client[server_m.db_name][RAW_DATA_COLLECTION].delete_many({})
+    state = client[server_m.db_collector_state]
+    for collection in ('server_list', 'collector_pointer', 'server_health'):
+        state[collection].delete_many({})
+    server_m.stores_server_list_database(server_list)
+    records_from = server_m.get_timestamp() - backlog
+    for server in server_list:
+        server_m.set_next_records_timestamp(server['server'], records_from)
+
+
+def get_max_rss():
+    """ Returns the maximum resident memory of this process and of its largest finished child process, in MB.
+    """
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0
+    return self_rss, children_rss
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--servers', dest='servers', type=int, default=10, help='Number of simulated servers')
+    parser.add_argument('--records-per-second', dest='records_per_second', type=float, default=1.0,
+                        help='Records per second of every server (default: %(default)s)')
+    parser.add_argument('--backlog', dest='backlog', type=int, default=3600,
+                        help='Initial backlog of every server in seconds (default: %(default)s)')
+    parser.add_argument('--page-records', dest='page_records', type=int, default=10000,
+                        help='Maximum records per response (default: %(default)s)')
+    parser.add_argument('--latency', dest='latency', type=float, default=0.0, help='Response latency in seconds')
+    parser.add_argument('--failure-rate', dest='failure_rate', type=float, default=0.0,
+                        help='Share of failed queries, 0.0 - 1.0')
+    parser.add_argument('--cycles', dest='cycles', type=int, default=1, help='Number of collector runs')
+    parser.add_argument('--engine', dest='engine', default=settings.COLLECTOR_ENGINE,
+                        help='COLLECTOR_ENGINE (default: %(default)s)')
+    parser.add_argument('--threads', dest='threads', type=int, default=settings.THREAD_COUNT,
+                        help='THREAD_COUNT (default: %(default)s)')
+    parser.add_argument('--concurrency', dest='concurrency', type=int, default=settings.ASYNC_CONCURRENCY,
+                        help='ASYNC_CONCURRENCY (default: %(default)s)')
+    parser.add_argument('--suffix', dest='suffix', default='benchmark',
+                        help='MongoDB suffix of the benchmark databases (default: %(default)s)')
+    parser.add_argument('--verbose', dest='verbose', action='store_true', help='Print the collector log')
+    args = parser.parse_args()
+
+    if args.suffix == settings.MONGODB_SUFFIX:
+        parser.error('--suffix must differ from MONGODB_SUFFIX, the benchmark clears its databases')
+
+    # The fake server runs in its own process, so that it does not compete with the collector for the GIL
+    fake_server = FakeSecurityServer(('127.0.0.1', 0), {
+        'records_per_second': args.records_per_second, 'page_records': args.page_records,
+        'latency': args.latency, 'failure_rate': args.failure_rate})
+    server_process = multiprocessing.Process(target=fake_server.serve_forever, daemon=True)
+    server_process.start()
+    fake_server.socket.close()
+
+    heartbeat_path = tempfile.mkdtemp()
+    settings.SECURITY_SERVER_URL = fake_server.url
+    settings.MONGODB_SUFFIX = args.suffix
+    settings.COLLECTOR_ENGINE = args.engine
+    settings.THREAD_COUNT = args.threads
+    settings.ASYNC_CONCURRENCY = args.concurrency
+    settings.SERVER_PAGE_RECORDS = args.page_records
+    settings.HEARTBEAT_PATH = heartbeat_path
+    # Pages are written into MongoDB by this node alone, whatever the settings file enables
+    settings.SPOOL_PATH = None
+    settings.COLLECTOR_SHARDING = False
+    settings.BACKFILL_MIN_LAG = 0
+
+    logger = logging.getLogger(settings.LOGGER_NAME)
+    logger.addHandler(logging.StreamHandler() if args.verbose else logging.NullHandler())
+    logger.propagate = False
+    logger_m = LoggerManager(settings.LOGGER_NAME, settings.MODULE)
+
+    server_m = DatabaseManager(settings.MONGODB_SUFFIX, settings.MONGODB_SERVER, settings.MONGODB_USER,
+                               settings.MONGODB_PWD, logger_m)
+    prepare_database(server_m, get_server_list(args.servers), args.backlog)
+
+    print('- Engine: {0}, THREAD_COUNT: {1}, ASYNC_CONCURRENCY: {2}, servers: {3}'.format(
+        args.engine, args.threads, args.concurrency, args.servers))
+    try:
+        for cycle in range(1, args.cycles + 1):
+            requests.get(fake_server.url + 'stats?reset=1').raise_for_status()
+            start_time = time.time()
+            collector_main(logger_m)
+            cycle_time = time.time() - start_time
+            stats = requests.get(fake_server.url + 'stats').json()
+            self_rss, children_rss = get_max_rss()
+            result = {
+                'cycle': cycle,
+                'queries': stats['requests'],
+                'failed_queries': stats['failures'],
+                'records': stats['records'],
+                'records_per_second': round(stats['records'] / cycle_time, 1),
+                'response_mb': round(stats['response_bytes'] / 1048576.0, 1),
+                'cycle_time': round(cycle_time, 2),
+                'max_rss_mb': round(self_rss, 1),
+                'max_worker_rss_mb': round(children_rss, 1),
+            }
+            print(json.dumps(result))
+    finally:
+        server_process.terminate()
+        server_process.join()
+        shutil.rmtree(heartbeat_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,77 @@
-import json
+import argparse
 import logging
 import multiprocessing
 import os
-import re
+import signal
+import socket
+import threading
 import time
 import uuid
-import zlib
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import WatchedFileHandler
 from multiprocessing import Pool
 
 import requests
 
 from . import settings
-from .collectorlib.database_manager import DatabaseManager
+from .collectorlib.async_engine import AsyncCollectorEngine, ScheduledCollectorEngine
+from .collectorlib.backfill import BackfillTracker, is_backfill_pointer
+from .collectorlib.database_manager import DatabaseManager, LeaseLostError
 from .collectorlib.logger_manager import LoggerManager
+from .collectorlib.metrics import CollectorMetrics, DECOMPRESSED_BYTES, HTTP_LATENCY, INSERT_LATENCY, PAGE_LATENCY
+from .collectorlib.metrics import PAGE_RECORDS, POINTER_LAG, RESPONSE_BYTES
+from .collectorlib.operational_data_reader import OperationalDataError, OperationalDataReader
+from .collectorlib.scheduler import BacklogScheduler, get_poll_interval, is_poll_due, update_server_stats
+from .collectorlib.server_health import FAILURE_HTTP_ERROR, FAILURE_NO_ATTACHMENT, FAILURE_PARSE_ERROR, FAILURE_TIMEOUT
+from .collectorlib.server_health import is_available, record_failure, record_success, start_probe
+from .collectorlib.sharding import ShardMember
+from .collectorlib.spool import Spool
+
+# Size of the response pieces read from the security server
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+_http_local = threading.local()
+
+# Metrics collected by the workers of this process
+_metrics = CollectorMetrics()
+
+
+def get_http_session():
+    """ Returns the HTTP session of the current thread.
+    Sessions keep the connections to the security server alive between requests.
+    """
+    session = getattr(_http_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        _http_local.session = session
+    return session
+
+
+def get_spool():
+    """ Returns the spool of fetched pages, or None if pages are inserted into MongoDB directly.
+    """
+    if not settings.SPOOL_PATH:
+        return None
+    return Spool(settings.SPOOL_PATH)
+
+
+def apply_spool_pointer(spool, pointer):
+    """ Returns the collector pointer moved past the pages waiting in the spool.
+    """
+    if spool is None:
+        return pointer
+    records_from = spool.get_records_from(pointer['server'])
+    if records_from is None or records_from <= pointer['records_from']:
+        return pointer
+    pointer = dict(pointer)
+    pointer['records_from'] = records_from
+    return pointer
+
+
+def get_collector_pointer(server_m, server_key):
+    """ Returns the collector pointer of the server, including the pages not yet drained from the spool.
+    """
+    return apply_spool_pointer(get_spool(), server_m.get_collector_pointer(server_key, settings.RECORDS_FROM_OFFSET))
 
 
 def collector_worker(data):
@@ -30,7 +88,7 @@ def collector_worker(data):
     memberCode = server_data['memberCode']
     serverCode = server_data['serverCode']
     req_id = str(uuid.uuid4())
-    worker_name = multiprocessing.current_process().name
+    worker_name = '{0}/{1}'.format(multiprocessing.current_process().name, threading.current_thread().name)
 
     # Log collection period
     msg = '[{0}] Collecting {1} from {2} to {3}'.format(worker_name, server, records_from, records_to)
@@ -41,36 +99,65 @@ def collector_worker(data):
     body = server_m.get_soap_body(monitoring_client, xRoadInstance, memberClass, memberCode,
                                   serverCode, req_id, records_from, records_to)
 
+    start_time = time.time()
     try:
-        response = requests.post(settings.SECURITY_SERVER_URL, data=body, headers=headers, timeout=settings.SECURITY_SERVER_TIMEOUT)
+        response = get_http_session().post(settings.SECURITY_SERVER_URL, data=body, headers=headers,
+                                           timeout=settings.SECURITY_SERVER_TIMEOUT, stream=True)
         response.raise_for_status()
+        http_time = time.time() - start_time
     except Exception as e:
         msg = "[{0}] Cannot get response for: {1} Cause: {2} \n".format(worker_name, server, repr(e))
         logger_m.log_warning('collector_worker', msg)
+        record_server_failure(data, get_failure_class(e))
         return -1
 
+    # Records are read from the attachment and added to database (or spool) in batches of INSERT_BATCH_SIZE
+    reader = OperationalDataReader(response.iter_content(chunk_size=RESPONSE_CHUNK_SIZE),
+                                   response.headers.get('content-type'))
+    spool = get_spool()
+    ingest = server_m.start_ingest(server) if spool is None else spool.start_ingest(server)
+    insert_time = 0.0
     try:
-        # Finding attachment
-        resp_search = re.search(b"content-id: <operational-monitoring-data.json.gz>\r\n\r\n(.+)\r\n--xroad",
-                                response.content, re.DOTALL)
-        if resp_search is None:
-            # No attachment present
-            msg = "[{0}] No attachment present for: {1}\n".format(worker_name, server)
-            logger_m.log_warning('collector_worker', msg)
-            return -1
-
-        data_json = json.loads(zlib.decompress(resp_search.group(1), zlib.MAX_WBITS | 16).decode('utf-8'))
-        records = data_json["records"]
-    except Exception as e:
+        for records in reader.iter_records(settings.INSERT_BATCH_SIZE):
+            insert_start = time.time()
+            ingest.insert(records)
+            insert_time += time.time() - insert_start
+    except OperationalDataError as e:
+        ingest.abort()
         msg = "[{0}] Cannot parse response attachment of: {1} Cause: {2} \n".format(worker_name, server, repr(e))
         logger_m.log_warning('collector_worker', msg)
+        record_server_failure(data, FAILURE_PARSE_ERROR)
+        return -1
+    except requests.exceptions.RequestException as e:
+        ingest.abort()
+        msg = "[{0}] Cannot get response for: {1} Cause: {2} \n".format(worker_name, server, repr(e))
+        logger_m.log_warning('collector_worker', msg)
+        record_server_failure(data, get_failure_class(e))
+        return -1
+    except LeaseLostError as e:
+        # Server was taken over by another collector node, the rest of the page is not written
+        ingest.abort()
+        msg = "[{0}] Records not added for: {1} Cause: {2} \n".format(worker_name, server, repr(e))
+        logger_m.log_warning('collector_worker', msg)
+        return -1
+    except Exception:
+        ingest.abort()
+        raise
+    finally:
+        response.close()
+
+    if not reader.attachment_found:
+        # No attachment present
+        ingest.abort()
+        msg = "[{0}] No attachment present for: {1}\n".format(worker_name, server)
+        logger_m.log_warning('collector_worker', msg)
+        record_server_failure(data, FAILURE_NO_ATTACHMENT)
         return -1
 
-    # Add data to database
-    if len(records):
-        msg = "[{0}] Adding {1} documents for server: {2}".format(worker_name, len(records), server)
+    records_count = reader.record_count
+    if records_count:
+        msg = "[{0}] Added {1} documents for server: {2}".format(worker_name, records_count, server)
         logger_m.log_info('collector_worker', msg)
-        server_m.insert_data_to_raw_messages(records)
     else:
         msg = "[{0}] No documents for server: {1}".format(worker_name, server)
         logger_m.log_warning('collector_worker', msg)
@@ -79,12 +166,11 @@ def collector_worker(data):
     next_records_from = records_to
 
     # Update nextRecordsFrom value
-    resp_search = re.search(b"<om:nextRecordsFrom>(\d+)</om:nextRecordsFrom>", response.content)
-    if resp_search:
-        next_records_from = int(resp_search.group(1))
+    if reader.next_records_from is not None:
+        next_records_from = reader.next_records_from
         # Deciding if we should repeat query and fetch additional data
-        if len(records) < settings.REPEAT_MIN_RECORDS:
-            msg = "[{0}] Not enough data received ({1}) to repeat query to server {2}".format(worker_name, len(records),
+        if records_count < settings.REPEAT_MIN_RECORDS:
+            msg = "[{0}] Not enough data received ({1}) to repeat query to server {2}".format(worker_name, records_count,
                                                                                               server)
             logger_m.log_info('collector_worker', msg)
         elif repeat > 0:
@@ -96,71 +182,463 @@ def collector_worker(data):
             msg = "[{0}] Maximum repeats reached for server {1}".format(worker_name, server)
             logger_m.log_warning('collector_worker', msg)
 
-    # Updates collector pointer
-    server_m.set_next_records_timestamp(server, next_records_from)
+    # Updates collector pointer and server statistics together with the inserted records
+    stats = update_server_stats(data.get('server_stats'), records_count, next_records_from - records_from,
+                                time.time() - start_time)
+    insert_start = time.time()
+    backfill = data.get('backfill')
+    try:
+        if backfill is None:
+            ingest.commit(server, next_records_from, stats)
+        else:
+            backfill.commit(ingest, server, records_from, next_records_from, stats)
+            # Progress of the sub-window, see backfill_window
+            data['next_records_from'] = next_records_from
+    except LeaseLostError as e:
+        # Server was taken over by another collector node, it is not a failure of the server
+        msg = "[{0}] Collector pointer not updated for: {1} Cause: {2} \n".format(worker_name, server, repr(e))
+        logger_m.log_warning('collector_worker', msg)
+        return -1
+    end_time = time.time()
+
+    _metrics.observe(HTTP_LATENCY, server, http_time)
+    _metrics.observe(PAGE_LATENCY, server, end_time - start_time)
+    _metrics.observe(RESPONSE_BYTES, server, reader.response_bytes)
+    _metrics.observe(DECOMPRESSED_BYTES, server, reader.decompressed_bytes)
+    _metrics.observe(PAGE_RECORDS, server, records_count)
+    _metrics.observe(INSERT_LATENCY, server, insert_time + end_time - insert_start)
+    _metrics.set_gauge(POINTER_LAG, server, server_m.get_timestamp() - next_records_from)
+
+    health = record_success(server, data.get('server_health'), server_m.get_timestamp())
+    if health is not None:
+        server_m.set_server_health(health)
     return return_value
 
 
-def collector_main(logger_m):
+def get_failure_class(exception):
+    """ Returns the server health failure class of a request exception.
+    """
+    if isinstance(exception, requests.exceptions.Timeout):
+        return FAILURE_TIMEOUT
+    return FAILURE_HTTP_ERROR
+
+
+def record_server_failure(data, failure_class):
+    """ Stores the failed query into the server health registry, server is skipped until its backoff expires.
+    :param data: The collector_worker input.
+    :param failure_class: The failure class.
     """
+    server_m = data['server_manager']
+    _metrics.count_failure(data['server_data']['server'], failure_class)
+    health = record_failure(data['server_data']['server'], data.get('server_health'), failure_class,
+                            server_m.get_timestamp(), settings.SERVER_BACKOFF_BASE, settings.SERVER_BACKOFF_MAX)
+    server_m.set_server_health(health)
+
+
+def get_repeat_health(server_m, server_key, health):
+    """ Returns the health document for the following pages of a run, as stored after the successful first page.
+    A failure of a following page continues from it, keeping the failure_counts history of the server.
+    :param server_m:
+    :param server_key: The server key.
+    :param health: Health document of the first page of the run, or None.
+    """
+    return record_success(server_key, health, server_m.get_timestamp()) or health
+
+
+def get_available_servers(logger_m, server_m, server_list):
+    """ Skips the servers with open circuit breaker, servers with expired backoff are probed.
+    :param logger_m:
+    :param server_m:
+    :param server_list:
+    :return: Returns the list of servers to query and dictionary of their health documents.
+    """
+    health_by_server = server_m.get_server_health()
+    now = server_m.get_timestamp()
+    available = []
+    health_to_use = {}
+    for server in server_list:
+        health = health_by_server.get(server['server'])
+        if not is_available(health, now):
+            continue
+        probe_health = start_probe(health)
+        if probe_health is not health:
+            server_m.set_server_health(probe_health)
+        health_to_use[server['server']] = probe_health
+        available.append(server)
+    skipped = len(server_list) - len(available)
+    if skipped:
+        logger_m.log_info('collector_health', 'Skipped {0} servers with open circuit breaker'.format(skipped))
+    return available, health_to_use
+
+
+def get_worker_data(logger_m, server_m, server, repeat, health=None):
+    """ Builds the collector_worker input for the next page of the given server.
     :param logger_m:
+    :param server_m:
+    :param server: Server data from the server list.
+    :param repeat: Number of repeats still allowed.
+    :param health: Server health document, see get_repeat_health for the following pages.
     :return:
     """
-    server_m = DatabaseManager(settings.MONGODB_SUFFIX,
-                               settings.MONGODB_SERVER,
-                               settings.MONGODB_USER,
-                               settings.MONGODB_PWD,
-                               logger_m)
+    pointer = get_collector_pointer(server_m, server['server'])
+    records_to = server_m.get_timestamp() - settings.RECORDS_TO_OFFSET
+    data = dict()
+    data['logger_manager'] = logger_m
+    data['server_manager'] = server_m
+    data['server_data'] = server
+    data['repeat'] = repeat
+    data['next_records_from'] = pointer['records_from']
+    data['next_records_to'] = records_to
+    data['server_stats'] = get_server_stats(pointer)
+    data['server_health'] = health
+    return data
 
-    logger_m.log_info('collector_start', 'Starting collector - Version {0}'.format(LoggerManager.__version__))
 
-    start_processing_time = time.time()
-    pool = Pool(processes=settings.THREAD_COUNT)
-    data = server_m.get_server_list_database()[0]
-    server_list = data['server_list']
-    print('- Using server list updated at: {0}'.format(data['timestamp']))
+def get_server_stats(pointer):
+    """ Returns the server statistics stored in the collector pointer document.
+    """
+    return {'records_per_second': pointer.get('records_per_second'), 'response_time': pointer.get('response_time')}
+
+
+def reset_worker_metrics():
+    """ Pool initializer, forked workers must not report the metrics inherited from the parent process.
+    """
+    _metrics.drain()
+
+
+def pool_worker(data):
+    """ Runs collector_worker in a pool process and returns its result together with the metrics of the page.
+    """
+    return collector_worker(data), _metrics.drain()
 
-    list_to_process = []
-    records_from_offset = settings.RECORDS_FROM_OFFSET
 
+def create_pool():
+    return Pool(processes=settings.THREAD_COUNT, initializer=reset_worker_metrics)
+
+
+def collect_with_pool(logger_m, server_m, server_list, pool=None):
+    """ Collects the data in rounds, every round waits for all the servers to return.
+    :param logger_m:
+    :param server_m:
+    :param server_list:
+    :param pool: Process pool kept by the caller between runs, a new one is used if not given.
+    :return: Returns total number of collected and failed servers.
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = create_pool()
+    server_list, health = get_available_servers(logger_m, server_m, server_list)
+    list_to_process = [get_worker_data(logger_m, server_m, server, settings.REPEAT_LIMIT, health.get(server['server']))
+                       for server in server_list]
+
+    total_error = 0
+    total_done = 0
+
+    try:
+        while list_to_process:
+            processed = pool.map(pool_worker, list_to_process)
+            # Check servers that are not finished
+            repeat_process = []
+            for i, (p, worker_metrics) in enumerate(processed):
+                _metrics.merge(worker_metrics)
+                if p == -1:
+                    total_error += 1
+                elif p == 0:
+                    total_done += 1
+                else:
+                    server = list_to_process[i]['server_data']
+                    server_health = get_repeat_health(server_m, server['server'], health.get(server['server']))
+                    repeat_process.append(get_worker_data(logger_m, server_m, server, p, server_health))
+            list_to_process = repeat_process
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+
+    return total_done, total_error
+
+
+def collect_with_asyncio(logger_m, server_m, server_list, executor=None):
+    """ Collects the data with independent per-server pipelines sharing one concurrency limit.
+    :param logger_m:
+    :param server_m:
+    :param server_list:
+    :param executor: Thread executor kept by the caller between runs, a new one is used if not given.
+    :return: Returns total number of collected and failed servers.
+    """
+    server_list, health = get_available_servers(logger_m, server_m, server_list)
+
+    def prepare(server, repeat):
+        server_health = health.get(server['server'])
+        if repeat != settings.REPEAT_LIMIT:
+            server_health = get_repeat_health(server_m, server['server'], server_health)
+        return get_worker_data(logger_m, server_m, server, repeat, server_health)
+
+    engine = AsyncCollectorEngine(prepare, collector_worker, settings.ASYNC_CONCURRENCY, settings.REPEAT_LIMIT)
+    processed = engine.run(server_list, executor)
+    total_error = len([p for p in processed if p == -1])
+    total_done = len(processed) - total_error
+    return total_done, total_error
+
+
+def collect_with_scheduler(logger_m, server_m, server_list, executor=None):
+    """ Collects the data in the order of the largest backlog reduction per fetch time, until the cycle time budget
+    is used. Servers are repeated while they have more data, REPEAT_LIMIT applies to each fetch separately.
+    :param logger_m:
+    :param server_m:
+    :param server_list:
+    :param executor: Thread executor kept by the caller between runs, a new one is used if not given.
+    :return: Returns total number of collected and failed servers.
+    """
+    scheduler = BacklogScheduler(settings.SERVER_PAGE_RECORDS, settings.SECURITY_SERVER_TIMEOUT / 10.0)
+    server_list, health = get_available_servers(logger_m, server_m, server_list)
+    pointers = server_m.get_collector_pointers()
+    spool = get_spool()
+    now = server_m.get_timestamp()
     for server in server_list:
-        server_key = server['server']
-        records_from = server_m.get_next_records_timestamp(server_key, records_from_offset)
-        records_to = server_m.get_timestamp() - settings.RECORDS_TO_OFFSET
-        data = dict()
-        data['logger_manager'] = logger_m
-        data['server_manager'] = server_m
-        data['server_data'] = server
-        data['repeat'] = settings.REPEAT_LIMIT
+        pointer = pointers.get(server['server'])
+        if pointer is None:
+            scheduler.add(server['server'], server, settings.RECORDS_FROM_OFFSET)
+        else:
+            pointer = apply_spool_pointer(spool, pointer)
+            scheduler.add(server['server'], server, now - pointer['records_from'], get_server_stats(pointer))
+
+    started = set()
+
+    def prepare(server):
+        server_health = health.get(server['server'])
+        if server['server'] in started:
+            server_health = get_repeat_health(server_m, server['server'], server_health)
+        started.add(server['server'])
+        return get_worker_data(logger_m, server_m, server, settings.REPEAT_LIMIT, server_health)
+
+    def refresh(server):
+        pointer = get_collector_pointer(server_m, server['server'])
+        return server_m.get_timestamp() - pointer['records_from'], get_server_stats(pointer)
+
+    engine = ScheduledCollectorEngine(scheduler, prepare, collector_worker, refresh,
+                                      settings.ASYNC_CONCURRENCY, settings.CYCLE_TIME_BUDGET)
+    processed = engine.run(executor)
+    total_error = len([p for p in processed.values() if p == -1])
+    total_done = len(processed) - total_error
+    postponed = len(server_list) - len(processed)
+    logger_m.log_info('collector_scheduler', 'Servers postponed: {0}, Remaining lag: {1:.0f} seconds'.format(
+        postponed, scheduler.total_lag()))
+    return total_done, total_error
+
+
+def backfill_window(data, window, deadline):
+    """ Fetches the pages of one backfill sub-window until it is complete or the deadline passes.
+    :param data: The collector_worker input of the first page, with BackfillTracker in data['backfill'].
+    :param window: The [start, end] sub-window.
+    :param deadline: Time after which no new page is fetched.
+    :return: Returns 0 if the window is complete, 1 if not and -1 on error.
+    """
+    records_from, records_to = window
+    while records_from < records_to:
+        if time.time() >= deadline:
+            return 1
         data['next_records_from'] = records_from
         data['next_records_to'] = records_to
-        list_to_process.append(data)
+        if collector_worker(data) == -1:
+            return -1
+        if data['next_records_from'] <= records_from:
+            # No progress, the rest of the window is fetched by the next run
+            return 1
+        records_from = data['next_records_from']
+        data['server_health'] = get_repeat_health(data['server_manager'], data['server_data']['server'],
+                                                  data['server_health'])
+    return 0
 
-    total_error = 0
-    total_done = 0
 
-    while list_to_process:
-        processed = pool.map(collector_worker, list_to_process)
-        # Check servers that are not finished
-        repeat_process = []
-        for i, p in enumerate(processed):
-            if p == -1:
-                total_error += 1
-            elif p == 0:
-                total_done += 1
+def split_backfill_servers(server_m, server_list):
+    """ Returns the servers collected normally and the servers with backfill, see is_backfill_pointer.
+    Backfill is not used together with the spool.
+    """
+    if get_spool() is not None:
+        return server_list, []
+    pointers = server_m.get_collector_pointers()
+    now = server_m.get_timestamp()
+    normal = []
+    lagging = []
+    for server in server_list:
+        pointer = pointers.get(server['server'])
+        if pointer is not None and is_backfill_pointer(pointer, now, settings.RECORDS_TO_OFFSET, settings.BACKFILL_MIN_LAG):
+            lagging.append(server)
+        else:
+            normal.append(server)
+    return normal, lagging
+
+
+def collect_backfill(logger_m, server_m, server_list, executor=None):
+    """ Collects the lagging servers by fetching up to BACKFILL_CONCURRENCY sub-windows of every server at a time,
+    for at most BACKFILL_TIME_BUDGET seconds. Unfinished sub-windows are continued by the next run.
+    :param logger_m:
+    :param server_m:
+    :param server_list: The lagging servers.
+    :param executor: Thread executor kept by the caller between runs, a new one is used if not given.
+    :return: Returns total number of completed and failed servers.
+    """
+    server_list, health = get_available_servers(logger_m, server_m, server_list)
+    deadline = time.time() + settings.BACKFILL_TIME_BUDGET
+    tasks = []
+    for server in server_list:
+        data = get_worker_data(logger_m, server_m, server, settings.REPEAT_LIMIT, health.get(server['server']))
+        pointer = get_collector_pointer(server_m, server['server'])
+        tracker = BackfillTracker.from_pointer(pointer, data['next_records_to'])
+        windows = tracker.get_windows(settings.BACKFILL_CONCURRENCY, settings.BACKFILL_MIN_WINDOW)
+        logger_m.log_info('collector_backfill', 'Backfill of {0} from {1} to {2} in {3} windows'.format(
+            server['server'], tracker.records_from, tracker.records_to, len(windows)))
+        for window in windows:
+            window_data = dict(data)
+            window_data['backfill'] = tracker
+            tasks.append((server['server'], tracker, window_data, window))
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=settings.ASYNC_CONCURRENCY)
+    try:
+        futures = [(key, tracker, executor.submit(backfill_window, data, window, deadline))
+                   for key, tracker, data, window in tasks]
+        results = {}
+        for key, tracker, future in futures:
+            result = future.result()
+            if result == -1 or results.get(key) == -1:
+                results[key] = -1
             else:
-                data = list_to_process[i]
-                server_key = data['server_data']['server']
-                records_from = server_m.get_next_records_timestamp(server_key, records_from_offset)
-                records_to = server_m.get_timestamp() - settings.RECORDS_TO_OFFSET
-                data['repeat'] = p
-                data['next_records_from'] = records_from
-                data['next_records_to'] = records_to
-                repeat_process.append(data)
-        list_to_process = repeat_process
+                results[key] = 0 if tracker.is_done() else 1
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+
+    total_error = len([r for r in results.values() if r == -1])
+    total_done = len([r for r in results.values() if r == 0])
+    logger_m.log_info('collector_backfill', 'Backfill completed: {0}, Unfinished: {1}, Error: {2}'.format(
+        total_done, len(results) - total_done - total_error, total_error))
+    return total_done, total_error
+
+
+def publish_metrics(logger_m, server_m, cycle):
+    """ Writes the collector metrics into the Prometheus text file and the summary document in collector_state.
+    Failures are logged, they do not fail the collection.
+    :param logger_m:
+    :param server_m:
+    :param cycle: Dictionary of collector cycle values.
+    """
+    try:
+        if settings.METRICS_FILE:
+            _metrics.write_prometheus(settings.METRICS_FILE, cycle)
+        if settings.METRICS_SUMMARY_CYCLES:
+            server_m.store_collector_metrics(_metrics.get_summary(), cycle, settings.METRICS_SUMMARY_CYCLES)
+    except Exception as e:
+        logger_m.log_warning('collector_metrics', 'Cannot publish metrics: {0}'.format(repr(e)))
+
+
+def get_due_servers(logger_m, server_m, server_list):
+    """ Returns the servers to poll now. Every server is polled at its own cadence, about DAEMON_TARGET_RECORDS
+    records per poll, but not more often than DAEMON_MIN_INTERVAL and not less often than DAEMON_MAX_INTERVAL.
+    :param logger_m:
+    :param server_m:
+    :param server_list:
+    :return:
+    """
+    pointers = server_m.get_collector_pointers()
+    spool = get_spool()
+    now = server_m.get_timestamp()
+    due = []
+    for server in server_list:
+        pointer = pointers.get(server['server'])
+        if pointer is None:
+            due.append(server)
+            continue
+        pointer = apply_spool_pointer(spool, pointer)
+        interval = get_poll_interval(get_server_stats(pointer), settings.DAEMON_TARGET_RECORDS,
+                                     settings.DAEMON_MIN_INTERVAL, settings.DAEMON_MAX_INTERVAL)
+        if is_poll_due(pointer['records_from'], now, settings.RECORDS_TO_OFFSET, interval):
+            due.append(server)
+    logger_m.log_info('collector_daemon', 'Servers due: {0} of {1}'.format(len(due), len(server_list)))
+    return due
+
+
+def collect(logger_m, server_m, server_list, pool=None, executor=None):
+    """ Collects the data of the servers with the engine selected by COLLECTOR_ENGINE.
+    Lagging servers are collected by backfill instead, see collect_backfill.
+    :return: Returns total number of collected and failed servers.
+    """
+    server_list, lagging = split_backfill_servers(server_m, server_list)
+    backfill_done, backfill_error = 0, 0
+    if lagging:
+        backfill_done, backfill_error = collect_backfill(logger_m, server_m, lagging, executor)
+
+    if settings.COLLECTOR_ENGINE == 'asyncio':
+        total_done, total_error = collect_with_asyncio(logger_m, server_m, server_list, executor)
+    elif settings.COLLECTOR_ENGINE == 'scheduler':
+        total_done, total_error = collect_with_scheduler(logger_m, server_m, server_list, executor)
+    else:
+        total_done, total_error = collect_with_pool(logger_m, server_m, server_list, pool)
+    return total_done + backfill_done, total_error + backfill_error
+
+
+def get_database_manager(logger_m):
+    return DatabaseManager(settings.MONGODB_SUFFIX,
+                           settings.MONGODB_SERVER,
+                           settings.MONGODB_USER,
+                           settings.MONGODB_PWD,
+                           logger_m,
+                           write_concern=settings.MONGODB_WRITE_CONCERN,
+                           use_transactions=settings.MONGODB_TRANSACTIONS,
+                           node_id=get_node_id(),
+                           raw_storage=settings.RAW_STORAGE)
+
+
+def get_node_id():
+    """ Returns the collector node ID when sharding is enabled, otherwise None.
+    """
+    if not settings.COLLECTOR_SHARDING:
+        return None
+    return settings.COLLECTOR_NODE_ID or socket.gethostname()
+
+
+def get_shard_member(logger_m, server_m):
+    """ Returns the ShardMember of this collector node, or None if sharding is disabled.
+    """
+    if server_m.node_id is None:
+        return None
+    logger_m.log_info('collector_sharding', 'Collector node: {0}'.format(server_m.node_id))
+    return ShardMember(server_m, server_m.node_id, settings.SHARD_LEASE_TTL, settings.SHARD_VIRTUAL_NODES, logger_m,
+                       settle_time=settings.SHARD_SETTLE_TIME, membership_ttl=settings.SHARD_MEMBERSHIP_TTL)
+
+
+def collector_main(logger_m):
+    """
+    :param logger_m:
+    :return:
+    """
+    server_m = get_database_manager(logger_m)
+
+    logger_m.log_info('collector_start', 'Starting collector - Version {0}'.format(LoggerManager.__version__))
+
+    start_processing_time = time.time()
+    data = server_m.get_server_list_database()[0]
+    server_list = data['server_list']
+    print('- Using server list updated at: {0}'.format(data['timestamp']))
+
+    shard = get_shard_member(logger_m, server_m)
+    if shard is not None:
+        server_list = shard.update(server_list)
+        shard.start()
+    try:
+        total_done, total_error = collect(logger_m, server_m, server_list)
+    finally:
+        if shard is not None:
+            # Heartbeat is kept for SHARD_MEMBERSHIP_TTL, nodes run by cron keep their shares and skip the settle time
+            shard.leave(keep_membership=True)
 
     end_processing_time = time.time()
     total_time = time.strftime("%H:%M:%S", time.gmtime(end_processing_time - start_processing_time))
+    publish_metrics(logger_m, server_m, {'timestamp': end_processing_time, 'servers_done': total_done,
+                                         'servers_error': total_error,
+                                         'seconds': end_processing_time - start_processing_time})
     logger_m.log_info(
         'collector_end', 'Total collected: {0}, Total error: {1}, Total time: {2}'.format(
             total_done, total_error, total_time))
@@ -168,7 +646,84 @@ def collector_main(logger_m):
         total_done, total_error, total_time), settings.HEARTBEAT_PATH, settings.HEARTBEAT_FILE, "SUCCEEDED")
 
 
+def collector_daemon(logger_m):
+    """ Collects the data continuously until SIGTERM or SIGINT.
+    Process pool, threads, HTTP sessions and MongoDB connections are kept between the cycles, server list is
+    reloaded only when update_servers stores a new one. Every DAEMON_TICK seconds the servers that are due
+    (see get_due_servers) are collected.
+    :param logger_m:
+    :return:
+    """
+    server_m = get_database_manager(logger_m)
+    logger_m.log_info('collector_start', 'Starting collector daemon - Version {0}'.format(LoggerManager.__version__))
+
+    pool = None
+    executor = None
+    if settings.COLLECTOR_ENGINE in ('asyncio', 'scheduler'):
+        executor = ThreadPoolExecutor(max_workers=settings.ASYNC_CONCURRENCY)
+    else:
+        pool = create_pool()
+
+    # Signal handlers are set after the pool is created, workers keep the default ones
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    shard = get_shard_member(logger_m, server_m)
+    if shard is not None:
+        shard.start()
+
+    server_list = []
+    server_list_timestamp = None
+    try:
+        while not stop.is_set():
+            start_processing_time = time.time()
+            try:
+                timestamp = server_m.get_server_list_timestamp()
+                if timestamp != server_list_timestamp:
+                    data = server_m.get_server_list_database()[0]
+                    server_list = data['server_list']
+                    server_list_timestamp = data['timestamp']
+                    logger_m.log_info('collector_daemon', 'Using server list updated at: {0}'.format(timestamp))
+
+                total_done, total_error = 0, 0
+                owned = server_list if shard is None else shard.update(server_list)
+                due = get_due_servers(logger_m, server_m, owned)
+                if due:
+                    total_done, total_error = collect(logger_m, server_m, due, pool, executor)
+
+                end_processing_time = time.time()
+                total_time = time.strftime("%H:%M:%S", time.gmtime(end_processing_time - start_processing_time))
+                if due:
+                    publish_metrics(logger_m, server_m, {'timestamp': end_processing_time, 'servers_done': total_done,
+                                                         'servers_error': total_error,
+                                                         'seconds': end_processing_time - start_processing_time})
+                    logger_m.log_info('collector_end', 'Total collected: {0}, Total error: {1}, Total time: {2}'.format(
+                        total_done, total_error, total_time))
+                logger_m.log_heartbeat('Total collected: {0}, Total error: {1}, Total time: {2}'.format(
+                    total_done, total_error, total_time), settings.HEARTBEAT_PATH, settings.HEARTBEAT_FILE, "SUCCEEDED")
+            except Exception as e:
+                # The daemon keeps running, e.g. while MongoDB is restarted
+                logger_m.log_error('collector_daemon', '{0}'.format(repr(e)))
+                logger_m.log_heartbeat("error", settings.HEARTBEAT_PATH, settings.HEARTBEAT_FILE, "FAILED")
+            stop.wait(max(settings.DAEMON_TICK - (time.time() - start_processing_time), 0))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if shard is not None:
+            shard.leave()
+    logger_m.log_info('collector_daemon', 'Collector daemon stopped')
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--daemon', dest='daemon', action='store_true',
+                        help='Collect continuously, polling every server at its own cadence')
+    args = parser.parse_args()
+
     logger = logging.getLogger(settings.LOGGER_NAME)
     logger.setLevel(settings.LOGGER_LEVEL)
     log_file_name = settings.LOGGER_FILE
@@ -181,7 +736,10 @@ if __name__ == '__main__':
 
     logger_m = LoggerManager(settings.LOGGER_NAME, settings.MODULE)
     try:
-        collector_main(logger_m)
+        if args.daemon:
+            collector_daemon(logger_m)
+        else:
+            collector_main(logger_m)
     except Exception as e:
         logger_m.log_error('collector', '{0}'.format(repr(e)))
         logger_m.log_heartbeat("error", settings.HEARTBEAT_PATH, settings.HEARTBEAT_FILE, "FAILED")
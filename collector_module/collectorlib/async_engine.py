@@ -0,0 +1,129 @@
+""" Asyncio Engine - Collector Module
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncCollectorEngine:
+    """ Runs an independent fetch -> parse -> insert -> advance pointer loop for every server.
+
+    The blocking parts (HTTP request, MongoDB calls) are executed in a bounded thread executor,
+    while one global semaphore limits the number of servers processed at the same time.
+    A slow server only delays its own loop and never the rest of the collection cycle.
+    """
+
+    def __init__(self, prepare, worker, concurrency, repeat_limit):
+        """
+        :param prepare: Callable(item, repeat) returning the worker input for the next page of the item.
+        :param worker: Callable(data) returning -1 (error), 0 (done) or the number of repeats still allowed.
+        :param concurrency: Maximum number of servers processed at the same time.
+        :param repeat_limit: Number of repeats allowed for the first page.
+        """
+        self.prepare = prepare
+        self.worker = worker
+        self.concurrency = concurrency
+        self.repeat_limit = repeat_limit
+
+    def run(self, items, executor=None):
+        """ Processes all the items until every pipeline has finished.
+        :param items: List of items (servers) to process.
+        :param executor: Thread executor kept by the caller between runs, a new one is used if not given.
+        :return: Returns the list of final worker results, in the order of items.
+        """
+        loop = asyncio.new_event_loop()
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            return loop.run_until_complete(self._run_all(loop, executor, items))
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
+            loop.close()
+
+    async def _run_all(self, loop, executor, items):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pipelines = [self._pipeline(loop, executor, semaphore, item) for item in items]
+        return await asyncio.gather(*pipelines)
+
+    async def _pipeline(self, loop, executor, semaphore, item):
+        repeat = self.repeat_limit
+        while True:
+            async with semaphore:
+                data = await loop.run_in_executor(executor, self.prepare, item, repeat)
+                result = await loop.run_in_executor(executor, self.worker, data)
+            if result <= 0:
+                return result
+            repeat = result
+
+
+class ScheduledCollectorEngine:
+    """ Runs the fetches handed out by a BacklogScheduler on a fixed number of slots.
+
+    No new fetch is started after the time budget is used, the remaining backlog is left for the next cycle.
+    """
+
+    def __init__(self, scheduler, prepare, worker, refresh, concurrency, time_budget):
+        """
+        :param scheduler: The BacklogScheduler with all the servers added.
+        :param prepare: Callable(item) returning the worker input for the next page of the item.
+        :param worker: Callable(data) returning -1 (error), 0 (done) or a positive value if more data is available.
+        :param refresh: Callable(item) returning the new (lag, stats) of the item after a fetch.
+        :param concurrency: Number of fetch slots.
+        :param time_budget: Time after which no new fetches are started, in seconds.
+        """
+        self.scheduler = scheduler
+        self.prepare = prepare
+        self.worker = worker
+        self.refresh = refresh
+        self.concurrency = concurrency
+        self.time_budget = time_budget
+
+    def run(self, executor=None):
+        """ Processes the schedule.
+        :param executor: Thread executor kept by the caller between runs, a new one is used if not given.
+        :return: Returns dictionary of the last worker result of every server fetched at least once.
+        """
+        loop = asyncio.new_event_loop()
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            return loop.run_until_complete(self._run_all(loop, executor))
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
+            loop.close()
+
+    async def _run_all(self, loop, executor):
+        results = {}
+        condition = asyncio.Condition()
+        deadline = time.time() + self.time_budget
+        slots = [self._slot(loop, executor, condition, deadline, results) for _ in range(self.concurrency)]
+        await asyncio.gather(*slots)
+        return results
+
+    async def _slot(self, loop, executor, condition, deadline, results):
+        while time.time() < deadline:
+            picked = self.scheduler.next_server()
+            if picked is None:
+                if not self.scheduler.in_flight():
+                    return
+                # Wait for a running fetch to finish, it may have more data
+                async with condition:
+                    await condition.wait()
+                continue
+            key, item = picked
+            result = -1
+            lag = stats = None
+            try:
+                data = await loop.run_in_executor(executor, self.prepare, item)
+                result = await loop.run_in_executor(executor, self.worker, data)
+                lag, stats = await loop.run_in_executor(executor, self.refresh, item)
+                results[key] = result
+            finally:
+                self.scheduler.complete(key, result > 0, lag, stats)
+                async with condition:
+                    condition.notify_all()
@@ -0,0 +1,124 @@
+""" Backfill - Collector Module
+
+Catch-up of a security server with a large backlog. The lagging period [records_from, backfill_to] is split
+into sub-windows fetched concurrently. The completed ranges are kept in the collector pointer (backfill_ranges)
+and records_from advances only over contiguous completed ranges, so an interrupted backfill continues from
+the remaining gaps.
+"""
+
+import threading
+
+
+def add_range(records_from, ranges, start, end):
+    """ Adds a completed range and advances records_from over the contiguous completed ranges.
+    :param records_from: Start of the first range not completed.
+    :param ranges: Sorted, non-overlapping list of completed [start, end] ranges after records_from.
+    :param start: Start of the completed range.
+    :param end: End of the completed range.
+    :return: Returns the new records_from and list of ranges.
+    """
+    merged = []
+    for range_start, range_end in sorted(list(ranges) + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    while merged and merged[0][0] <= records_from:
+        records_from = max(records_from, merged.pop(0)[1])
+    return records_from, merged
+
+
+def get_gaps(records_from, records_to, ranges):
+    """ Returns the list of [start, end] periods between records_from and records_to not covered by the ranges.
+    """
+    gaps = []
+    start = records_from
+    for range_start, range_end in ranges:
+        if range_start > start:
+            gaps.append([start, min(range_start, records_to)])
+        start = max(start, range_end)
+        if start >= records_to:
+            break
+    if start < records_to:
+        gaps.append([start, records_to])
+    return [gap for gap in gaps if gap[1] > gap[0]]
+
+
+def split_windows(gaps, count, min_window):
+    """ Returns at most count windows: the first count gaps, split by halving the longest window while there are
+    less than count windows and the windows are long enough. The remaining gaps are left to the next run.
+    :param gaps: List of [start, end] periods.
+    :param count: Maximum number of windows.
+    :param min_window: Minimum length of a window, in seconds.
+    :return: Returns the sorted list of windows.
+    """
+    windows = [list(gap) for gap in sorted(gaps)[:count]]
+    while len(windows) < count:
+        longest = max(windows, key=lambda w: w[1] - w[0]) if windows else None
+        if longest is None or longest[1] - longest[0] < 2 * min_window:
+            break
+        middle = longest[0] + (longest[1] - longest[0]) // 2
+        windows.remove(longest)
+        windows.extend([[longest[0], middle], [middle, longest[1]]])
+    return sorted(windows)
+
+
+def is_backfill_pointer(pointer, now, records_to_offset, min_lag):
+    """ Returns True if the server has an unfinished backfill or lags more than min_lag seconds.
+    """
+    if pointer.get('backfill_to') is not None:
+        return True
+    return bool(min_lag) and now - records_to_offset - pointer['records_from'] > min_lag
+
+
+class BackfillTracker:
+    """ Gap-tracking collector pointer of one server, shared by the sub-window fetches of the server.
+    """
+
+    def __init__(self, records_from, records_to, ranges=None):
+        """
+        :param records_from: The records_from value of the collector pointer.
+        :param records_to: End of the backfill.
+        :param ranges: Completed ranges stored in the collector pointer.
+        """
+        self.records_from = records_from
+        self.records_to = records_to
+        self.ranges = [list(r) for r in ranges or []]
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_pointer(cls, pointer, records_to):
+        """ Continues the backfill stored in the collector pointer, or starts a new one ending at records_to.
+        """
+        if pointer.get('backfill_to') is not None:
+            records_to = pointer['backfill_to']
+        # Collector queries use time in integer seconds
+        return cls(pointer['records_from'], int(records_to), pointer.get('backfill_ranges'))
+
+    def get_windows(self, count, min_window):
+        """ Returns the sub-windows still to fetch.
+        """
+        with self.lock:
+            return split_windows(get_gaps(self.records_from, self.records_to, self.ranges), count, min_window)
+
+    def is_done(self):
+        with self.lock:
+            return self.records_from >= self.records_to
+
+    def commit(self, ingest, server_key, start, end, stats=None):
+        """ Completes a page covering [start, end] and stores the gap-tracking pointer with the page.
+        Pointer updates of the server are serialized, so a later state is never overwritten by an earlier one.
+        :param ingest: The IngestSession of the page.
+        :param server_key: The server key.
+        :param start: Start of the period covered by the page.
+        :param end: End of the period covered by the page.
+        :param stats: Server statistics stored in the collector pointer.
+        """
+        with self.lock:
+            records_from, ranges = add_range(self.records_from, self.ranges, start, end)
+            done = records_from >= self.records_to
+            update = dict(stats or {})
+            update['backfill_ranges'] = [] if done else ranges
+            update['backfill_to'] = None if done else self.records_to
+            ingest.commit(server_key, records_from, update)
+            self.records_from, self.ranges = records_from, ranges
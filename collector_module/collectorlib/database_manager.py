@@ -1,20 +1,214 @@
 """ Database Manager - Collector Module
 """
 
+import json
+import os
 import time
-import re
+import zlib
+
 import requests
-import xml.etree.ElementTree as ET
 
 import pymongo
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.write_concern import WriteConcern
+
+from .record_keys import add_record_keys
+from .shared_params import get_content_hash, get_shared_params_location, parse_shared_params
 
 
 RAW_DATA_COLLECTION = 'raw_messages'
 
+# Raw storage formats: one document per record, or one compressed chunk document per fetched page
+RAW_STORAGE_RECORDS = 'records'
+RAW_STORAGE_CHUNKS = 'chunks'
+# Format of the records field of the chunk documents, read by the corrector
+CHUNK_FORMAT = 'ndjson-zlib'
+# Compressed size after which a page is split into several chunks, well below the 16MB document limit
+CHUNK_MAX_BYTES = 8 * 1024 * 1024
+# MongoDB error code of a duplicate key
+DUPLICATE_KEY_ERROR = 11000
+
+# MongoClient of the current process by URI, shared by all DatabaseManager instances (and pool tasks) of the process
+_process_clients = {}
+_process_clients_pid = None
+
+
+def get_process_client(uri):
+    global _process_clients_pid
+    if _process_clients_pid != os.getpid():
+        # Forked process, the clients of the parent can not be used
+        _process_clients.clear()
+        _process_clients_pid = os.getpid()
+    client = _process_clients.get(uri)
+    if client is None:
+        client = pymongo.MongoClient(uri)
+        _process_clients[uri] = client
+    return client
+
+
+class LeaseLostError(Exception):
+    """ The collector node does not hold the lease of the server anymore.
+    """
+    pass
+
+
+class RawChunk:
+    """ Records of a page compressed into one raw_messages chunk document.
+    requestInTs of the chunk is the smallest requestInTs of its records, so chunks are corrected in the same
+    order as single records.
+    """
+
+    def __init__(self):
+        self.compressor = zlib.compressobj()
+        self.parts = []
+        self.size = 0
+        self.count = 0
+        self.request_in_ts = []
+        self.monitoring_data_ts = []
+
+    def add(self, data):
+        line = json.dumps(data, separators=(',', ':')) + '\n'
+        part = self.compressor.compress(line.encode('utf-8'))
+        if part:
+            self.parts.append(part)
+            self.size += len(part)
+        self.count += 1
+        if data.get('requestInTs') is not None:
+            self.request_in_ts.append(data['requestInTs'])
+        if data.get('monitoringDataTs') is not None:
+            self.monitoring_data_ts.append(data['monitoringDataTs'])
+
+    def get_document(self, server_key, timestamp):
+        self.parts.append(self.compressor.flush())
+        return {'chunkFormat': CHUNK_FORMAT, 'server': server_key, 'recordCount': self.count,
+                'requestInTs': min(self.request_in_ts) if self.request_in_ts else None,
+                'requestInTsTo': max(self.request_in_ts) if self.request_in_ts else None,
+                'monitoringDataTsFrom': min(self.monitoring_data_ts) if self.monitoring_data_ts else None,
+                'monitoringDataTsTo': max(self.monitoring_data_ts) if self.monitoring_data_ts else None,
+                'records': b''.join(self.parts), 'insertTime': timestamp}
+
+
+class IngestSession:
+    """ Writes the records of one fetched page and the collector pointer update together.
+    The records are inserted in batches while the page is read. With transactions enabled, records and pointer are
+    committed atomically. Otherwise the records are written before the pointer with _id built from the server key
+    and recordHash, so a page written again after a failure (or a crash before the pointer update) only causes
+    duplicate key errors, which are ignored.
+    With chunked raw storage the page is written as compressed chunk documents (see RawChunk) before the pointer.
+    With sharding, the pointer is advanced only while the node holds the lease of the server: the pointer update
+    is filtered by leaseNode, which acquire_server_leases sets when the lease is taken over. If the lease was lost,
+    commit raises LeaseLostError. Without transactions leaseNode is also checked before every write of records,
+    so a node that lost the lease stops writing the page; records written just before the lease moved have the
+    same _id as the ones of the new holder.
+    """
+
+    def __init__(self, db_manager, server_key):
+        client = db_manager.get_client()
+        write_concern = db_manager.write_concern
+        self.logger_m = db_manager.logger_m
+        self.raw_msg = client[db_manager.db_name].get_collection(RAW_DATA_COLLECTION, write_concern=write_concern)
+        self.pointer = client[db_manager.db_collector_state].get_collection('collector_pointer', write_concern=write_concern)
+        self.node_id = db_manager.node_id
+        self.server_key = server_key
+        self.chunks = [] if db_manager.raw_storage == RAW_STORAGE_CHUNKS else None
+        self.session = None
+        self.in_transaction = False
+        if db_manager.use_transactions:
+            self.session = client.start_session()
+            self.session.start_transaction(write_concern=write_concern)
+            self.in_transaction = True
+
+    def insert(self, data_list):
+        """ Adds a batch of records of the page to raw_messages.
+        :param data_list: List of records.
+        """
+        try:
+            for data in data_list:
+                add_record_keys(data)
+            if self.chunks is not None:
+                for data in data_list:
+                    if not self.chunks or self.chunks[-1].size >= CHUNK_MAX_BYTES:
+                        self.chunks.append(RawChunk())
+                    self.chunks[-1].add(data)
+                return
+            self._check_lease()
+            timestamp = DatabaseManager.get_timestamp()
+            for data in data_list:
+                data['insertTime'] = timestamp
+            if self.in_transaction:
+                self.raw_msg.insert_many(data_list, session=self.session)
+                return
+            for data in data_list:
+                data['_id'] = '{0}/{1}'.format(self.server_key, data['recordHash'])
+            try:
+                self.raw_msg.insert_many(data_list, ordered=False)
+            except BulkWriteError as e:
+                # Records already written by an earlier attempt of the page
+                if any(error['code'] != DUPLICATE_KEY_ERROR for error in e.details['writeErrors']):
+                    raise e
+        except Exception as e:
+            self.logger_m.log_error('IngestSession.insert', '{0}'.format(repr(e)))
+            raise e
+
+    def commit(self, server_key, records_from, stats=None):
+        """ Advances the collector pointer of the server and completes the page.
+        :param server_key: The server key.
+        :param records_from: Next records_from value.
+        :param stats: Additional server statistics stored in the collector pointer.
+        """
+        try:
+            if self.chunks:
+                self._check_lease()
+                timestamp = DatabaseManager.get_timestamp()
+                self.raw_msg.insert_many([chunk.get_document(server_key, timestamp) for chunk in self.chunks],
+                                         session=self.session)
+                self.chunks = []
+            update = dict(stats or {})
+            update['records_from'] = records_from
+            if self.node_id is None:
+                self.pointer.update_one({'server': server_key}, {'$set': update}, upsert=True, session=self.session)
+            else:
+                # Lease check and pointer update are one atomic write
+                result = self.pointer.update_one({'server': server_key, 'leaseNode': self.node_id}, {'$set': update},
+                                                 session=self.session)
+                if result.matched_count == 0:
+                    raise LeaseLostError('Lease of {0} lost by node {1}'.format(server_key, self.node_id))
+            if self.in_transaction:
+                self.session.commit_transaction()
+                self.in_transaction = False
+        except Exception as e:
+            self.logger_m.log_error('IngestSession.commit', '{0}'.format(repr(e)))
+            self.abort()
+            raise e
+        self._end()
+
+    def abort(self):
+        """ Discards the page. Without transactions the already inserted records are kept, they are ignored as
+        duplicates when the page is written again.
+        """
+        self.chunks = None
+        if self.in_transaction:
+            self.in_transaction = False
+            self.session.abort_transaction()
+        self._end()
+
+    def _check_lease(self):
+        # Inside a transaction the lease is checked by the pointer update of commit
+        if self.node_id is None or self.in_transaction:
+            return
+        if self.pointer.find_one({'server': self.server_key, 'leaseNode': self.node_id}, {'_id': 1}) is None:
+            raise LeaseLostError('Lease of {0} lost by node {1}'.format(self.server_key, self.node_id))
+
+    def _end(self):
+        if self.session is not None:
+            self.session.end_session()
+            self.session = None
+
 
 class DatabaseManager:
 
-    def __init__(self, mdb_suffix, mongodb_server, mongodb_user, mongodb_pwd, logger_manager):
+    def __init__(self, mdb_suffix, mongodb_server, mongodb_user, mongodb_pwd, logger_manager,
+                 write_concern=None, use_transactions=False, node_id=None, raw_storage=RAW_STORAGE_RECORDS):
         self.mdb_server = mongodb_server
         self.mdb_user = mongodb_user
         self.mdb_pwd = mongodb_pwd
@@ -22,76 +216,110 @@ class DatabaseManager:
         self.db_collector_state = 'collector_state_{0}'.format(mdb_suffix)
         self.collector_id = 'collector_{0}'.format(mdb_suffix)
         self.logger_m = logger_manager
+        self.write_concern = WriteConcern(**(write_concern or {}))
+        self.use_transactions = use_transactions
+        # Collector node ID when the server list is sharded between nodes, see sharding.ShardMember
+        self.node_id = node_id
+        self.raw_storage = raw_storage
+        self._client = None
+        self._client_pid = None
+
+    def __getstate__(self):
+        # MongoClient can not be shared with child processes, every process opens its own
+        state = self.__dict__.copy()
+        state['_client'] = None
+        state['_client_pid'] = None
+        return state
+
+    def get_client(self):
+        """ Returns the MongoClient of the current process, connections are reused between calls.
+        """
+        if self._client is None or self._client_pid != os.getpid():
+            uri = "mongodb://{0}:{1}@{2}/auth_db".format(self.mdb_user, self.mdb_pwd, self.mdb_server)
+            self._client = get_process_client(uri)
+            self._client_pid = os.getpid()
+        return self._client
 
     @staticmethod
     def get_timestamp():
         return float(time.time())
 
     def get_list_from_central_server(self, central_server, timeout):
-        server_list = []
+        return self.get_shared_params(central_server, timeout)[1]
+
+    def get_shared_params(self, central_server, timeout, known_hash=None):
+        """ Downloads and parses shared-params.xml of the central server.
+        :param central_server: The central server address.
+        :param timeout: Timeout of the requests.
+        :param known_hash: Hash of the shared parameters already stored, see get_server_list_database.
+        :return: Returns the hash of the shared parameters and the server list, server list is None if the hash
+        equals known_hash and empty on errors.
+        """
         # Downloading shared-params.xml
         try:
             url_str = "http://{0}/internalconf".format(central_server)
             globalConf = requests.get(url_str, timeout=timeout)
             globalConf.raise_for_status()
-            #  NB! re.search global configuration regex might be changed
-            # according version naming or other future naming conventions
-            data = globalConf.content.decode("utf-8")
-            s = re.search(r"Content-location: (/V\d+/\d+/shared-params.xml)", data)
-            sharedParams = requests.get("http://{0}{1}".format(central_server, s.group(1)), timeout=timeout)
+            location, params_hash = get_shared_params_location(globalConf.content.decode("utf-8"))
+            if params_hash is not None and params_hash == known_hash:
+                return params_hash, None
+            sharedParams = requests.get("http://{0}{1}".format(central_server, location), timeout=timeout)
             sharedParams.raise_for_status()
         except Exception as e:
             self.logger_m.log_warning('ServerManager.get_list_from_central_server', '{0}'.format(repr(e)))
-            return []
-
-        try:
-            root = ET.fromstring(sharedParams.content)
-            instance = root.find("./instanceIdentifier").text
-            for server in root.findall("./securityServer"):
-                ownerId = server.find("./owner").text
-                owner = root.find("./member[@id='{0}']".format(ownerId))
-                memberClass = owner.find("./memberClass/code").text
-                memberCode = owner.find("./memberCode").text
-                serverCode = server.find("./serverCode").text
-                address = server.find("./address").text
-                s = instance + "/" + memberClass + "/" + memberCode + "/" + serverCode + "/" + address
-                data = {}
-                data['ownerId'] = ownerId
-                data['instance'] = instance
-                data['memberClass'] = memberClass
-                data['memberCode'] = memberCode
-                data['serverCode'] = serverCode
-                data['address'] = address
-                data['server'] = s
-                server_list.append(data)
+            return None, []
 
+        if params_hash is None:
+            params_hash = get_content_hash(sharedParams.content)
+            if params_hash == known_hash:
+                return params_hash, None
+
+        try:
+            server_list = parse_shared_params(sharedParams.content)
         except Exception as e:
             self.logger_m.log_warning('ServerManager.get_list_from_central_server', '{0}'.format(repr(e)))
-            return []
+            return None, []
 
-        return server_list
+        return params_hash, server_list
 
-    def stores_server_list_database(self, server_list):
+    def stores_server_list_database(self, server_list, shared_params_hash=None, added=None, removed=None):
+        """ Stores new server list, with the hash of its shared parameters and the servers added and removed
+        since the previous list
+        """
         try:
-            uri = "mongodb://{0}:{1}@{2}/auth_db".format(self.mdb_user, self.mdb_pwd, self.mdb_server)
-            client = pymongo.MongoClient(uri)
+            client = self.get_client()
             db = client[self.db_collector_state]
             collection = db['server_list']
             data = dict()
             data['timestamp'] = self.get_timestamp()
             data['server_list'] = server_list
             data['collector_id'] = self.collector_id
+            data['shared_params_hash'] = shared_params_hash
+            data['added'] = added or []
+            data['removed'] = removed or []
             collection.insert(data)
         except Exception as e:
             self.logger_m.log_error('ServerManager.get_server_list_database', '{0}'.format(repr(e)))
             raise e
 
+    def set_server_list_hash(self, server_list_id, shared_params_hash):
+        """ Updates the shared parameters hash of a stored server list, when the parameters changed but the servers
+        did not
+        """
+        try:
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['server_list']
+            collection.update_one({'_id': server_list_id}, {'$set': {'shared_params_hash': shared_params_hash}})
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.set_server_list_hash', '{0}'.format(repr(e)))
+            raise e
+
     def get_server_list_database(self, n=1):
         """ Returns the top n most recent server list
         """
         try:
-            uri = "mongodb://{0}:{1}@{2}/auth_db".format(self.mdb_user, self.mdb_pwd, self.mdb_server)
-            client = pymongo.MongoClient(uri)
+            client = self.get_client()
             db = client[self.db_collector_state]
             collection = db['server_list']
             cur = collection.find({'collector_id': self.collector_id}).sort([('timestamp', -1)]).limit(n)
@@ -100,12 +328,25 @@ class DatabaseManager:
             raise e
         return list(cur)
 
-    def get_next_records_timestamp(self, server_key, records_from_offset):
-        """ Returns next records_from pointer for the given server
+    def get_server_list_timestamp(self):
+        """ Returns the timestamp of the most recent server list, or None
         """
         try:
-            uri = "mongodb://{0}:{1}@{2}/auth_db".format(self.mdb_user, self.mdb_pwd, self.mdb_server)
-            client = pymongo.MongoClient(uri)
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['server_list']
+            doc = collection.find_one({'collector_id': self.collector_id}, {'timestamp': 1},
+                                      sort=[('timestamp', -1)])
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.get_server_list_timestamp', '{0}'.format(repr(e)))
+            raise e
+        return doc['timestamp'] if doc else None
+
+    def get_collector_pointer(self, server_key, records_from_offset):
+        """ Returns the collector_pointer document of the given server, creates it if missing
+        """
+        try:
+            client = self.get_client()
             db = client[self.db_collector_state]
             collection = db['collector_pointer']
             cur = collection.find_one({'server': server_key})
@@ -114,47 +355,214 @@ class DatabaseManager:
                 data = dict()
                 data['server'] = server_key
                 data['records_from'] = self.get_timestamp() - records_from_offset
+                if self.node_id is not None:
+                    # Lease holder, see acquire_server_leases
+                    data['leaseNode'] = self.node_id
                 collection.insert(data)
             else:
                 data = cur
-            # Return pointers
-            records_from = data['records_from']
         except Exception as e:
-            self.logger_m.log_error('ServerManager.get_next_records_timestamp', '{0}'.format(repr(e)))
+            self.logger_m.log_error('ServerManager.get_collector_pointer', '{0}'.format(repr(e)))
             raise e
-        return records_from
+        return data
+
+    def get_collector_pointers(self):
+        """ Returns dictionary of all collector_pointer documents by server
+        """
+        try:
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['collector_pointer']
+            pointers = dict((doc['server'], doc) for doc in collection.find())
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.get_collector_pointers', '{0}'.format(repr(e)))
+            raise e
+        return pointers
+
+    def get_next_records_timestamp(self, server_key, records_from_offset):
+        """ Returns next records_from pointer for the given server
+        """
+        return self.get_collector_pointer(server_key, records_from_offset)['records_from']
 
     def set_next_records_timestamp(self, server_key, records_from):
-        uri = "mongodb://{0}:{1}@{2}/auth_db".format(self.mdb_user, self.mdb_pwd, self.mdb_server)
         try:
-            client = pymongo.MongoClient(uri)
+            client = self.get_client()
             db = client[self.db_collector_state]
             collection = db['collector_pointer']
-            data = dict()
-            data['server'] = server_key
-            data['records_from'] = records_from
-            collection.find_and_modify(query={'server': server_key},
-                                       update=data, upsert=True)
+            collection.update_one({'server': server_key}, {'$set': {'records_from': records_from}}, upsert=True)
         except Exception as e:
             self.logger_m.log_error('ServerManager.set_next_records_timestamp', '{0}'.format(repr(e)))
             raise e
 
+    def get_server_health(self):
+        """ Returns dictionary of all server_health documents by server
+        """
+        try:
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['server_health']
+            health = dict((doc['server'], doc) for doc in collection.find())
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.get_server_health', '{0}'.format(repr(e)))
+            raise e
+        return health
+
+    def set_server_health(self, health):
+        """ Stores the server_health document of a server
+        """
+        try:
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['server_health']
+            data = dict(health)
+            data.pop('_id', None)
+            collection.update_one({'server': data['server']}, {'$set': data}, upsert=True)
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.set_server_health', '{0}'.format(repr(e)))
+            raise e
+
+    def store_collector_metrics(self, servers, cycle, history):
+        """ Stores the metrics summary of the collector, keeping the values of the last history cycles
+        :param servers: List of per-server metric summaries.
+        :param cycle: Dictionary of collector cycle values.
+        :param history: Number of cycles kept.
+        """
+        try:
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['collector_metrics']
+            # Every collector node keeps its own summary
+            collection.update_one({'collector_id': self.collector_id, 'node': self.node_id},
+                                  {'$set': {'timestamp': self.get_timestamp(), 'cycle': cycle, 'servers': servers},
+                                   '$push': {'cycles': {'$each': [cycle], '$slice': -history}}}, upsert=True)
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.store_collector_metrics', '{0}'.format(repr(e)))
+            raise e
+
+    def set_node_heartbeat(self, node_id, expires):
+        """ Stores the heartbeat of the collector node, the node is considered live until expires
+        """
+        try:
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['collector_nodes']
+            collection.update_one({'node': node_id}, {'$set': {'heartbeat': self.get_timestamp(), 'expires': expires}},
+                                  upsert=True)
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.set_node_heartbeat', '{0}'.format(repr(e)))
+            raise e
+
+    def get_live_nodes(self, now):
+        """ Returns sorted list of collector nodes with valid heartbeat
+        """
+        try:
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['collector_nodes']
+            nodes = sorted(doc['node'] for doc in collection.find({'expires': {'$gt': now}}, {'node': 1}))
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.get_live_nodes', '{0}'.format(repr(e)))
+            raise e
+        return nodes
+
+    def remove_node(self, node_id):
+        try:
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['collector_nodes']
+            collection.delete_one({'node': node_id})
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.remove_node', '{0}'.format(repr(e)))
+            raise e
+
+    def acquire_server_leases(self, node_id, server_keys, now, expires):
+        """ Renews the leases of the servers held by the node and takes over the free and expired ones.
+        Requires unique index on server_lease.server, a lease held by another node fails the upsert.
+        The node is set as leaseNode of the collector_pointer of the leased servers, after that the previous holder
+        can not advance the pointers anymore, see IngestSession.commit.
+        :return: Returns the list of servers leased by the node.
+        """
+        try:
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['server_lease']
+            collection.update_many({'server': {'$in': server_keys}, 'node': node_id}, {'$set': {'expires': expires}})
+            held = set(doc['server'] for doc in collection.find({'server': {'$in': server_keys}, 'node': node_id},
+                                                                {'server': 1}))
+            acquired = []
+            for server_key in server_keys:
+                if server_key in held:
+                    acquired.append(server_key)
+                    continue
+                try:
+                    collection.update_one({'server': server_key, 'expires': {'$lte': now}},
+                                          {'$set': {'node': node_id, 'expires': expires, 'acquired': now}}, upsert=True)
+                    acquired.append(server_key)
+                except DuplicateKeyError:
+                    # Held by another node
+                    pass
+            if acquired:
+                db['collector_pointer'].update_many({'server': {'$in': acquired}, 'leaseNode': {'$ne': node_id}},
+                                                    {'$set': {'leaseNode': node_id}})
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.acquire_server_leases', '{0}'.format(repr(e)))
+            raise e
+        return acquired
+
+    def renew_server_leases(self, node_id, expires):
+        try:
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['server_lease']
+            collection.update_many({'node': node_id}, {'$set': {'expires': expires}})
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.renew_server_leases', '{0}'.format(repr(e)))
+            raise e
+
+    def release_server_leases(self, node_id, server_keys=None):
+        """ Releases the given (or all) leases of the node and removes the node as leaseNode of their collector_pointer
+        """
+        try:
+            client = self.get_client()
+            db = client[self.db_collector_state]
+            collection = db['server_lease']
+            query = {'node': node_id}
+            if server_keys is not None:
+                query['server'] = {'$in': server_keys}
+            collection.delete_many(query)
+            query = {'leaseNode': node_id}
+            if server_keys is not None:
+                query['server'] = {'$in': server_keys}
+            db['collector_pointer'].update_many(query, {'$unset': {'leaseNode': ''}})
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.release_server_leases', '{0}'.format(repr(e)))
+            raise e
+
     def insert_data_to_raw_messages(self, data_list):
         try:
-            uri = "mongodb://{0}:{1}@{2}/auth_db".format(self.mdb_user, self.mdb_pwd, self.mdb_server)
-            client = pymongo.MongoClient(uri)
+            client = self.get_client()
             db = client[self.db_name]
-            raw_msg = db[RAW_DATA_COLLECTION]
-            # Add timestamp to data list
+            raw_msg = db.get_collection(RAW_DATA_COLLECTION, write_concern=self.write_concern)
+            # Add timestamp and record keys to data list
+            timestamp = self.get_timestamp()
             for data in data_list:
-                timestamp = self.get_timestamp()
                 data['insertTime'] = timestamp
+                add_record_keys(data)
             # Save all
             raw_msg.insert_many(data_list)
         except Exception as e:
             self.logger_m.log_error('ServerManager.insert_data_to_raw_messages', '{0}'.format(repr(e)))
             raise e
 
+    def start_ingest(self, server_key):
+        """ Starts writing of one fetched page of the server, see IngestSession.
+        """
+        try:
+            return IngestSession(self, server_key)
+        except Exception as e:
+            self.logger_m.log_error('ServerManager.start_ingest', '{0}'.format(repr(e)))
+            raise e
+
     @staticmethod
     def get_soap_body(monitoring_client, xRoadInstance, memberClass, memberCode, serverCode, req_id, recordsFrom, recordsTo):
         body = """<SOAP-ENV:Envelope
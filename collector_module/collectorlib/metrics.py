@@ -0,0 +1,223 @@
+""" Metrics - Collector Module
+
+Per-server histograms, gauges and failure counters of the collector, published as Prometheus text format file
+and as summary document in collector_state.
+"""
+
+import os
+import threading
+
+METRICS_PREFIX = 'xroad_collector'
+
+HTTP_LATENCY = 'http_latency_seconds'
+PAGE_LATENCY = 'page_seconds'
+RESPONSE_BYTES = 'response_bytes'
+DECOMPRESSED_BYTES = 'decompressed_bytes'
+PAGE_RECORDS = 'page_records'
+INSERT_LATENCY = 'insert_seconds'
+POINTER_LAG = 'pointer_lag_seconds'
+
+_BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9)
+_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+BUCKETS = {
+    HTTP_LATENCY: _SECONDS_BUCKETS,
+    PAGE_LATENCY: _SECONDS_BUCKETS,
+    RESPONSE_BYTES: _BYTES_BUCKETS,
+    DECOMPRESSED_BYTES: _BYTES_BUCKETS,
+    PAGE_RECORDS: (0, 10, 100, 1000, 2500, 5000, 10000),
+    INSERT_LATENCY: (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+}
+
+HELP = {
+    HTTP_LATENCY: 'Time until the response headers of the security server, in seconds.',
+    PAGE_LATENCY: 'Time spent to fetch, parse and store one page, in seconds.',
+    RESPONSE_BYTES: 'Size of the response of the security server.',
+    DECOMPRESSED_BYTES: 'Size of the decompressed operational data attachment.',
+    PAGE_RECORDS: 'Number of records per fetched page.',
+    INSERT_LATENCY: 'Time spent to store one page into MongoDB or spool, in seconds.',
+    POINTER_LAG: 'Age of the collector pointer of the server after the last fetch, in seconds.',
+    'failures_total': 'Number of failed queries by failure class.',
+}
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        # Last count is for values above the last bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """ Returns the upper bound of the bucket holding the q quantile, None if it is above the last bucket.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for i, count in enumerate(self.counts[:-1]):
+            total += count
+            if total >= rank:
+                return self.buckets[i]
+        return None
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return repr(float(value))
+
+
+class CollectorMetrics:
+    """ Metrics of one collector process. Thread-safe, and can be pickled to return the observations of pool workers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = dict((metric, {}) for metric in BUCKETS)
+        self.gauges = {POINTER_LAG: {}}
+        self.failures = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def observe(self, metric, server_key, value):
+        with self.lock:
+            histogram = self.histograms[metric].get(server_key)
+            if histogram is None:
+                histogram = Histogram(BUCKETS[metric])
+                self.histograms[metric][server_key] = histogram
+            histogram.observe(value)
+
+    def set_gauge(self, metric, server_key, value):
+        with self.lock:
+            self.gauges[metric][server_key] = value
+
+    def count_failure(self, server_key, failure_class):
+        with self.lock:
+            failures = self.failures.setdefault(server_key, {})
+            failures[failure_class] = failures.get(failure_class, 0) + 1
+
+    def merge(self, other):
+        """ Adds the observations of another CollectorMetrics (e.g. of a pool worker).
+        """
+        with self.lock:
+            for metric, histograms in other.histograms.items():
+                for server_key, histogram in histograms.items():
+                    if server_key in self.histograms[metric]:
+                        self.histograms[metric][server_key].merge(histogram)
+                    else:
+                        self.histograms[metric][server_key] = histogram
+            for metric, gauges in other.gauges.items():
+                self.gauges[metric].update(gauges)
+            for server_key, failures in other.failures.items():
+                own = self.failures.setdefault(server_key, {})
+                for failure_class, count in failures.items():
+                    own[failure_class] = own.get(failure_class, 0) + count
+
+    def drain(self):
+        """ Returns the collected metrics and starts collecting from scratch.
+        """
+        with self.lock:
+            metrics = CollectorMetrics()
+            metrics.histograms, self.histograms = self.histograms, metrics.histograms
+            metrics.gauges, self.gauges = self.gauges, metrics.gauges
+            metrics.failures, self.failures = self.failures, metrics.failures
+        return metrics
+
+    def to_prometheus(self, cycle=None):
+        """ Returns the metrics in Prometheus text exposition format.
+        :param cycle: Dictionary of collector cycle values, exported as gauges.
+        """
+        lines = []
+        with self.lock:
+            for metric in sorted(self.histograms):
+                name = '{0}_{1}'.format(METRICS_PREFIX, metric)
+                lines.append('# HELP {0} {1}'.format(name, HELP[metric]))
+                lines.append('# TYPE {0} histogram'.format(name))
+                for server_key in sorted(self.histograms[metric]):
+                    histogram = self.histograms[metric][server_key]
+                    label = 'server="{0}"'.format(_escape(server_key))
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(name, label, _format_value(bound), cumulative))
+                    lines.append('{0}_bucket{{{1},le="+Inf"}} {2}'.format(name, label, histogram.count))
+                    lines.append('{0}_sum{{{1}}} {2}'.format(name, label, _format_value(histogram.sum)))
+                    lines.append('{0}_count{{{1}}} {2}'.format(name, label, histogram.count))
+            for metric in sorted(self.gauges):
+                name = '{0}_{1}'.format(METRICS_PREFIX, metric)
+                lines.append('# HELP {0} {1}'.format(name, HELP[metric]))
+                lines.append('# TYPE {0} gauge'.format(name))
+                for server_key in sorted(self.gauges[metric]):
+                    lines.append('{0}{{server="{1}"}} {2}'.format(name, _escape(server_key),
+                                                                  _format_value(self.gauges[metric][server_key])))
+            name = '{0}_failures_total'.format(METRICS_PREFIX)
+            lines.append('# HELP {0} {1}'.format(name, HELP['failures_total']))
+            lines.append('# TYPE {0} counter'.format(name))
+            for server_key in sorted(self.failures):
+                for failure_class in sorted(self.failures[server_key]):
+                    lines.append('{0}{{server="{1}",class="{2}"}} {3}'.format(
+                        name, _escape(server_key), failure_class, self.failures[server_key][failure_class]))
+        for key in sorted(cycle or {}):
+            name = '{0}_cycle_{1}'.format(METRICS_PREFIX, key)
+            lines.append('# TYPE {0} gauge'.format(name))
+            lines.append('{0} {1}'.format(name, _format_value(cycle[key])))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, file_name, cycle=None):
+        """ Writes the Prometheus text file atomically, e.g. for node_exporter textfile collector.
+        """
+        tmp_name = '{0}.{1}.tmp'.format(file_name, os.getpid())
+        with open(tmp_name, 'w') as f:
+            f.write(self.to_prometheus(cycle))
+        os.replace(tmp_name, file_name)
+
+    def get_summary(self):
+        """ Returns list of per-server metric summaries (count, sum, average, p50, p95 and gauges), one dictionary
+        per server with the server key in 'server', sorted by server key.
+        MongoDB field names may not contain dots, so the servers are given as a list.
+        """
+        servers = {}
+        with self.lock:
+            for metric, histograms in self.histograms.items():
+                for server_key, histogram in histograms.items():
+                    servers.setdefault(server_key, {})[metric] = {
+                        'count': histogram.count, 'sum': histogram.sum,
+                        'avg': histogram.sum / histogram.count if histogram.count else None,
+                        'p50': histogram.quantile(0.5), 'p95': histogram.quantile(0.95)}
+            for metric, gauges in self.gauges.items():
+                for server_key, value in gauges.items():
+                    servers.setdefault(server_key, {})[metric] = value
+            for server_key, failures in self.failures.items():
+                servers.setdefault(server_key, {})['failures'] = dict(failures)
+        summary = []
+        for server_key in sorted(servers):
+            data = servers[server_key]
+            data['server'] = server_key
+            summary.append(data)
+        return summary
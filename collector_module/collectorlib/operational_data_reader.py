@@ -0,0 +1,320 @@
+""" Operational Data Reader - Collector Module
+
+Streaming reader of the getSecurityServerOperationalData SOAP/MIME response.
+The gzipped operational-monitoring-data.json.gz attachment is decompressed and decoded incrementally,
+so the memory use does not depend on the size of the attachment.
+"""
+
+import codecs
+import json
+import re
+import zlib
+
+ATTACHMENT_CONTENT_ID = '<operational-monitoring-data.json.gz>'
+NEXT_RECORDS_FROM_RE = re.compile(br"<om:nextRecordsFrom>(\d+)</om:nextRecordsFrom>")
+BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+RECORDS_START_RE = re.compile(r'"records"\s*:\s*\[')
+WHITESPACE_RE = re.compile(r'\s*')
+
+# Maximum amount of decompressed data produced from one piece of the attachment
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+
+class OperationalDataError(Exception):
+    """ Raised when the operational monitoring response can not be parsed.
+    """
+    pass
+
+
+def get_boundary(content_type):
+    """ Returns the multipart boundary from the Content-Type header value or None.
+    :param content_type: The Content-Type header value.
+    :return: Returns the boundary as bytes.
+    """
+    if content_type:
+        m = BOUNDARY_RE.search(content_type)
+        if m is not None:
+            return m.group(1).strip().encode('ascii')
+    return None
+
+
+class MultipartParser:
+    """ Incremental multipart/related parser.
+    Feeding data returns a list of events: ('headers', dict), ('data', bytes) and ('end', None) for every part.
+    """
+
+    def __init__(self, boundary=None):
+        self.boundary = boundary
+        self.buffer = b''
+        self.state = 'preamble'
+        self.delimiter = None if boundary is None else b'\r\n--' + boundary
+
+    def feed(self, data):
+        self.buffer += data
+        events = []
+        while self._step(events):
+            pass
+        return events
+
+    def close(self):
+        events = []
+        if self.state in ('body', 'raw'):
+            if self.buffer:
+                events.append(('data', self.buffer))
+            self.buffer = b''
+            if self.state == 'body':
+                raise OperationalDataError('Response ended inside a multipart part')
+            events.append(('end', None))
+        self.state = 'done'
+        return events
+
+    def _step(self, events):
+        if self.state == 'preamble':
+            return self._read_preamble(events)
+        if self.state == 'headers':
+            return self._read_headers(events)
+        if self.state == 'body':
+            return self._read_body(events)
+        if self.state == 'delimiter':
+            return self._read_delimiter_end()
+        if self.state == 'raw':
+            if self.buffer:
+                events.append(('data', self.buffer))
+                self.buffer = b''
+            return False
+        # Epilogue is ignored
+        self.buffer = b''
+        return False
+
+    def _read_preamble(self, events):
+        if self.boundary is None:
+            line_end = self.buffer.find(b'\r\n')
+            if line_end == -1:
+                if len(self.buffer) > 2 and not self.buffer.startswith(b'--'):
+                    self._start_raw(events)
+                    return True
+                return False
+            line = self.buffer[:line_end]
+            if not line.startswith(b'--'):
+                self._start_raw(events)
+                return True
+            self.boundary = line[2:].strip()
+            self.delimiter = b'\r\n--' + self.boundary
+            self.buffer = self.buffer[line_end + 2:]
+            self.state = 'headers'
+            return True
+        start = (b'\r\n' + self.buffer).find(self.delimiter)
+        if start == -1:
+            # Keep only the tail that may contain the beginning of the delimiter
+            self.buffer = self.buffer[-len(self.delimiter):]
+            return False
+        self.buffer = self.buffer[max(start + len(self.delimiter) - 2, 0):]
+        self.state = 'delimiter'
+        return True
+
+    def _start_raw(self, events):
+        # Not a multipart message, whole body is one part without headers
+        events.append(('headers', {}))
+        self.state = 'raw'
+
+    def _read_headers(self, events):
+        if self.buffer.startswith(b'\r\n'):
+            header_block = b''
+            self.buffer = self.buffer[2:]
+        else:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end == -1:
+                return False
+            header_block = self.buffer[:end]
+            self.buffer = self.buffer[end + 4:]
+        headers = {}
+        for line in header_block.decode('latin-1').split('\r\n'):
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        events.append(('headers', headers))
+        self.state = 'body'
+        return True
+
+    def _read_body(self, events):
+        end = self.buffer.find(self.delimiter)
+        if end == -1:
+            keep = len(self.delimiter) - 1
+            if len(self.buffer) > keep:
+                events.append(('data', self.buffer[:-keep]))
+                self.buffer = self.buffer[-keep:]
+            return False
+        if end:
+            events.append(('data', self.buffer[:end]))
+        events.append(('end', None))
+        self.buffer = self.buffer[end + len(self.delimiter):]
+        self.state = 'delimiter'
+        return True
+
+    def _read_delimiter_end(self):
+        if self.buffer.startswith(b'--'):
+            self.state = 'epilogue'
+            return True
+        line_end = self.buffer.find(b'\r\n')
+        if line_end == -1:
+            return False
+        self.buffer = self.buffer[line_end + 2:]
+        self.state = 'headers'
+        return True
+
+
+class RecordsDecoder:
+    """ Incremental decoder of the {"records": [...]} JSON document.
+    Every complete record is decoded as soon as its data is available.
+    """
+
+    def __init__(self):
+        self.json_decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.started = False
+        self.finished = False
+
+    def feed(self, data, final=False):
+        """ Decodes records from the next piece of the JSON document.
+        :param data: Next piece of the document as bytes.
+        :param final: True if this is the last piece.
+        :return: Returns the list of records completed by this piece.
+        """
+        buf = self.buffer + self.text_decoder.decode(data, final)
+        records = []
+        pos = 0
+        if not self.started:
+            m = RECORDS_START_RE.search(buf)
+            if m is not None:
+                self.started = True
+                pos = m.end()
+        while self.started and not self.finished:
+            pos = WHITESPACE_RE.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            if buf[pos] == ']':
+                self.finished = True
+                pos += 1
+            elif buf[pos] == ',':
+                pos += 1
+            else:
+                try:
+                    record, pos = self.json_decoder.raw_decode(buf, pos)
+                except ValueError:
+                    # Record is not complete yet
+                    if final:
+                        raise OperationalDataError('Cannot decode operational monitoring record')
+                    break
+                records.append(record)
+        self.buffer = buf[pos:] if self.started else buf
+        if final and not self.finished:
+            raise OperationalDataError('Operational monitoring data ended unexpectedly')
+        return records
+
+
+class OperationalDataReader:
+    """ Reads records from the getSecurityServerOperationalData response given as an iterable of byte chunks.
+    """
+
+    def __init__(self, chunks, content_type=None):
+        """
+        :param chunks: Iterable of response body chunks (bytes).
+        :param content_type: Content-Type header of the response.
+        """
+        self.chunks = chunks
+        self.parser = MultipartParser(get_boundary(content_type))
+        self.attachment_found = False
+        self.next_records_from = None
+        self.record_count = 0
+        self.response_bytes = 0
+        self.decompressed_bytes = 0
+        self._part = None
+        self._soap = b''
+        self._decompressor = None
+        self._records_decoder = None
+
+    def iter_records(self, batch_size):
+        """ Yields lists of at most batch_size records from the attachment.
+        :param batch_size: Maximum number of records in one list.
+        :return: Generator of record lists.
+        """
+        pending = []
+        for records in self._iter_decoded():
+            if not records:
+                continue
+            pending.extend(records)
+            while len(pending) >= batch_size:
+                batch = pending[:batch_size]
+                pending = pending[batch_size:]
+                self.record_count += len(batch)
+                yield batch
+        if pending:
+            self.record_count += len(pending)
+            yield pending
+
+    def _iter_decoded(self):
+        for chunk in self.chunks:
+            self.response_bytes += len(chunk)
+            for event in self.parser.feed(chunk):
+                for records in self._handle_event(event):
+                    yield records
+        for event in self.parser.close():
+            for records in self._handle_event(event):
+                yield records
+
+    def _handle_event(self, event):
+        """ Handles one multipart event.
+        :param event: The (kind, value) event from the MultipartParser.
+        :return: Generator of decoded record lists.
+        """
+        kind, value = event
+        if kind == 'headers':
+            if value.get('content-id') == ATTACHMENT_CONTENT_ID:
+                self._part = 'attachment'
+                self.attachment_found = True
+                self._decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                self._records_decoder = RecordsDecoder()
+            else:
+                self._part = 'soap'
+                self._soap = b''
+        elif kind == 'data':
+            if self._part == 'attachment':
+                for records in self._decompress(value):
+                    yield records
+            elif self._part == 'soap':
+                self._soap += value
+        elif kind == 'end':
+            if self._part == 'attachment':
+                yield self._finish_attachment()
+            elif self._part == 'soap':
+                m = NEXT_RECORDS_FROM_RE.search(self._soap)
+                if m is not None:
+                    self.next_records_from = int(m.group(1))
+                self._soap = b''
+            self._part = None
+
+    def _decompress(self, data):
+        try:
+            while data:
+                out = self._decompressor.decompress(data, DECOMPRESS_CHUNK_SIZE)
+                self.decompressed_bytes += len(out)
+                yield self._records_decoder.feed(out)
+                data = self._decompressor.unconsumed_tail
+        except zlib.error as e:
+            raise OperationalDataError('Cannot decompress attachment: {0}'.format(repr(e)))
+        except UnicodeDecodeError as e:
+            raise OperationalDataError('Cannot decode attachment: {0}'.format(repr(e)))
+
+    def _finish_attachment(self):
+        self._part = None
+        try:
+            out = self._decompressor.flush()
+            if not self._decompressor.eof:
+                raise OperationalDataError('Attachment is truncated')
+            self.decompressed_bytes += len(out)
+            return self._records_decoder.feed(out, final=True)
+        except zlib.error as e:
+            raise OperationalDataError('Cannot decompress attachment: {0}'.format(repr(e)))
+        except UnicodeDecodeError as e:
+            raise OperationalDataError('Cannot decode attachment: {0}'.format(repr(e)))
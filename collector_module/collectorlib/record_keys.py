@@ -0,0 +1,60 @@
+""" Record Keys - Collector Module
+
+Content hash and service call key of the raw records, computed once when the records are inserted.
+The corrector uses recordHash for duplicate detection instead of hashing the records again, and copies
+serviceCallKey into clean_data for the analyzer.
+"""
+
+import hashlib
+
+# Version of the recordHash calculation, the corrector recalculates hashes of other versions
+RECORD_HASH_VERSION = 1
+
+# Fields added (as None) by the corrector before hashing, see DocumentManager.correct_structure of the corrector
+MUST_FIELDS = (
+    'monitoringDataTs', 'securityServerInternalIp', 'securityServerType', 'requestInTs', 'requestOutTs',
+    'responseInTs', 'responseOutTs', 'clientXRoadInstance', 'clientMemberClass', 'clientMemberCode',
+    'clientSubsystemCode', 'serviceXRoadInstance', 'serviceMemberClass', 'serviceMemberCode',
+    'serviceSubsystemCode', 'serviceCode', 'serviceVersion', 'representedPartyClass', 'representedPartyCode',
+    'messageId', 'messageUserId', 'messageIssue', 'messageProtocolVersion', 'clientSecurityServerAddress',
+    'serviceSecurityServerAddress', 'requestSoapSize', 'requestMimeSize', 'requestAttachmentCount',
+    'responseSoapSize', 'responseMimeSize', 'responseAttachmentCount', 'succeeded', 'soapFaultCode',
+    'soapFaultString'
+)
+
+# Fields that are not part of the record content
+HASH_EXCLUDED_FIELDS = ('_id', 'insertTime', 'corrected', 'recordHash', 'recordHashVersion', 'serviceCallKey')
+
+# Fields identifying a service call, in the order of service_call_fields of the analyzer
+SERVICE_CALL_FIELDS = (
+    'clientMemberClass', 'clientMemberCode', 'clientXRoadInstance', 'clientSubsystemCode', 'serviceCode',
+    'serviceVersion', 'serviceMemberClass', 'serviceMemberCode', 'serviceXRoadInstance', 'serviceSubsystemCode'
+)
+
+
+def calculate_record_hash(record):
+    """ Returns the version 1 content hash of the record: monitoringDataTs and MD5 of the sorted fields, formatted
+    as str() of an OrderedDict in Python 3.5 - 3.11. Equals DocumentManager.calculate_hash of the corrector.
+    :param record: The raw record.
+    """
+    document = dict((f, None) for f in MUST_FIELDS)
+    document.update(record)
+    items = ', '.join('({0!r}, {1!r})'.format(key, value) for key, value in sorted(document.items())
+                      if key not in HASH_EXCLUDED_FIELDS)
+    doc_hash = hashlib.md5('OrderedDict([{0}])'.format(items).encode('utf-8')).hexdigest()
+    return '{0}_{1}'.format(document['monitoringDataTs'], doc_hash)
+
+
+def get_service_call_key(record):
+    """ Returns the service call of the record as one string, missing fields are empty.
+    """
+    return '/'.join(record.get(f) or '' for f in SERVICE_CALL_FIELDS)
+
+
+def add_record_keys(record):
+    """ Adds recordHash, recordHashVersion and serviceCallKey to the raw record.
+    """
+    record['recordHash'] = calculate_record_hash(record)
+    record['recordHashVersion'] = RECORD_HASH_VERSION
+    record['serviceCallKey'] = get_service_call_key(record)
+    return record
@@ -0,0 +1,135 @@
+""" Backlog Scheduler - Collector Module
+"""
+
+# Weight of the latest observation in the per-server statistics
+STATS_ALPHA = 0.3
+
+
+def update_server_stats(stats, records, span, duration, alpha=STATS_ALPHA):
+    """ Updates the moving averages of the server traffic rate and page fetch time.
+    :param stats: Previous statistics, dictionary with keys records_per_second and response_time (or None).
+    :param records: Number of records received in the page.
+    :param span: Length of the time period covered by the page, in seconds.
+    :param duration: Time spent to fetch and store the page, in seconds.
+    :param alpha: Weight of the latest observation.
+    :return: Returns the new statistics dictionary.
+    """
+    def average(previous, value):
+        if previous is None:
+            return value
+        return alpha * value + (1 - alpha) * previous
+
+    stats = stats or {}
+    new_stats = {'response_time': average(stats.get('response_time'), duration),
+                 'records_per_second': stats.get('records_per_second')}
+    if span > 0:
+        new_stats['records_per_second'] = average(stats.get('records_per_second'), float(records) / span)
+    return new_stats
+
+
+def get_poll_interval(stats, target_records, min_interval, max_interval):
+    """ Returns the time between polls of a server, so that one poll returns about target_records records.
+    :param stats: Server statistics, see update_server_stats (or None).
+    :param target_records: Number of records wanted per poll.
+    :param min_interval: Interval of the busiest servers and servers without statistics, in seconds.
+    :param max_interval: Interval of the quietest servers, in seconds.
+    """
+    rate = (stats or {}).get('records_per_second')
+    if not rate:
+        return min_interval if rate is None else max_interval
+    return min(max(target_records / rate, min_interval), max_interval)
+
+
+def is_poll_due(records_from, now, records_to_offset, interval):
+    """ Returns True if the data of the server not yet collected covers at least interval seconds.
+    Collected servers have records_from close to now - records_to_offset.
+    """
+    return now - records_to_offset - records_from >= interval
+
+
+class BacklogScheduler:
+    """ Hands out fetch slots so that the total backlog shrinks as fast as possible.
+
+    The backlog (lag) of a server is how far its records_from pointer is behind now.
+    One fetch of a server removes up to page_records / records_per_second seconds of lag and takes response_time
+    seconds, so servers are ordered by the lag removed per second of fetch time.
+    Every server is scheduled once per cycle, afterwards only while it reports more data. When the cycle time
+    budget of the caller runs out, the servers not fetched yet are postponed to the next cycle.
+    """
+
+    def __init__(self, page_records, default_response_time, min_response_time=0.1):
+        """
+        :param page_records: Maximum number of records returned by one fetch.
+        :param default_response_time: Fetch time assumed for servers without statistics, in seconds.
+        :param min_response_time: Lower bound of the fetch time, in seconds.
+        """
+        self.page_records = page_records
+        self.default_response_time = default_response_time
+        self.min_response_time = min_response_time
+        self.servers = {}
+        self.order = []
+
+    def add(self, key, item, lag, stats=None):
+        """ Adds a server to the schedule.
+        :param key: The server key.
+        :param item: The server data given back by next_server().
+        :param lag: Current lag of the server, in seconds.
+        :param stats: Server statistics, see update_server_stats.
+        """
+        if key not in self.servers:
+            self.order.append(key)
+        self.servers[key] = {'item': item, 'lag': lag, 'stats': stats or {}, 'active': True, 'in_flight': False}
+
+    def priority(self, key):
+        """ Returns the seconds of lag removed per second of fetch time for the next fetch of the server.
+        """
+        server = self.servers[key]
+        lag = max(server['lag'], 0.0)
+        rate = server['stats'].get('records_per_second')
+        gain = lag if not rate else min(lag, self.page_records / rate)
+        response_time = server['stats'].get('response_time') or self.default_response_time
+        return gain / max(response_time, self.min_response_time)
+
+    def next_server(self):
+        """ Returns (key, item) of the server to fetch next and marks it in flight, or None if nothing is ready.
+        """
+        best_key = None
+        best_priority = None
+        for key in self.order:
+            server = self.servers[key]
+            if not server['active'] or server['in_flight']:
+                continue
+            priority = self.priority(key)
+            if best_priority is None or priority > best_priority:
+                best_key = key
+                best_priority = priority
+        if best_key is None:
+            return None
+        self.servers[best_key]['in_flight'] = True
+        return best_key, self.servers[best_key]['item']
+
+    def complete(self, key, more_data, lag=None, stats=None):
+        """ Records the result of a fetch.
+        :param key: The server key.
+        :param more_data: True if the server has more data to fetch.
+        :param lag: New lag of the server, in seconds.
+        :param stats: New server statistics.
+        """
+        server = self.servers[key]
+        server['in_flight'] = False
+        server['active'] = more_data
+        if lag is not None:
+            server['lag'] = lag
+        if stats is not None:
+            server['stats'] = stats
+
+    def has_pending(self):
+        """ Returns True if some server is still waiting for a fetch or being fetched.
+        """
+        return any(s['active'] for s in self.servers.values())
+
+    def in_flight(self):
+        return any(s['in_flight'] for s in self.servers.values())
+
+    def total_lag(self):
+        return sum(max(s['lag'], 0.0) for s in self.servers.values() if s['active'])
@@ -0,0 +1,68 @@
+""" Server Health - Collector Module
+
+Per-server circuit breaker. A server is "closed" (healthy) until a query fails, then "open" and skipped
+until its retry time. After the retry time one probe query is allowed ("half_open"): success closes the
+circuit, failure opens it again with twice as long backoff.
+"""
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+FAILURE_TIMEOUT = 'timeout'
+FAILURE_HTTP_ERROR = 'http_error'
+FAILURE_NO_ATTACHMENT = 'no_attachment'
+FAILURE_PARSE_ERROR = 'parse_error'
+
+
+def is_available(health, now):
+    """ Returns True if the server may be queried.
+    :param health: The server_health document of the server or None.
+    :param now: Current timestamp.
+    """
+    if health is None or health.get('state', STATE_CLOSED) == STATE_CLOSED:
+        return True
+    return now >= health.get('retry_at', 0)
+
+
+def start_probe(health):
+    """ Returns the health document for a query of an available server, open circuit becomes half-open.
+    """
+    if health is not None and health.get('state') == STATE_OPEN:
+        health = dict(health)
+        health['state'] = STATE_HALF_OPEN
+    return health
+
+
+def record_failure(server_key, health, failure_class, now, base_backoff, max_backoff):
+    """ Returns the health document after a failed query.
+    :param server_key: The server key.
+    :param health: The server_health document of the server or None.
+    :param failure_class: One of FAILURE_TIMEOUT, FAILURE_HTTP_ERROR, FAILURE_NO_ATTACHMENT, FAILURE_PARSE_ERROR.
+    :param now: Current timestamp.
+    :param base_backoff: Backoff after the first failure, in seconds.
+    :param max_backoff: Maximum backoff, in seconds.
+    """
+    failures = (health or {}).get('failures', 0) + 1
+    backoff = min(base_backoff * 2 ** (failures - 1), max_backoff)
+    new_health = dict(health or {})
+    new_health.update({'server': server_key, 'state': STATE_OPEN, 'failures': failures,
+                       'failure_class': failure_class, 'last_failure': now, 'retry_at': now + backoff})
+    classes = dict(new_health.get('failure_counts', {}))
+    classes[failure_class] = classes.get(failure_class, 0) + 1
+    new_health['failure_counts'] = classes
+    return new_health
+
+
+def record_success(server_key, health, now):
+    """ Returns the health document after a successful query, or None if nothing changed.
+    :param server_key: The server key.
+    :param health: The server_health document of the server or None.
+    :param now: Current timestamp.
+    """
+    if health is None or (health.get('state') == STATE_CLOSED and not health.get('failures')):
+        return None
+    new_health = dict(health)
+    new_health.update({'server': server_key, 'state': STATE_CLOSED, 'failures': 0, 'last_success': now,
+                       'retry_at': None})
+    return new_health
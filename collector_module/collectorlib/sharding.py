@@ -0,0 +1,157 @@
+""" Sharding - Collector Module
+
+Splits the server list between collector nodes. Every node keeps a heartbeat in collector_state.collector_nodes,
+servers are assigned to the live nodes by consistent hashing, and a node collects a server only while it holds
+the lease of the server in collector_state.server_lease. When a node dies its heartbeat and leases expire and
+the servers are taken over by the nodes they are assigned to now.
+
+A joining node waits settle_time seconds between its first heartbeat and the first lease acquisition, so nodes
+started at the same time see each other and do not take the servers of the others. Collector runs started by cron
+extend the heartbeat by membership_ttl when they end (see ShardMember.leave): the node stays a live member until
+its next run, which then does not wait settle_time again. The membership of a node ends when the heartbeat expires.
+"""
+
+import bisect
+import hashlib
+import threading
+import time
+
+
+def _hash(value):
+    return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """ Consistent hashing ring, adding or removing a node moves only the servers of that node.
+    """
+
+    def __init__(self, nodes, vnodes):
+        """
+        :param nodes: Node IDs.
+        :param vnodes: Number of points of every node on the ring, more points give more even split.
+        """
+        self.ring = sorted((_hash('{0}#{1}'.format(node, i)), node) for node in nodes for i in range(vnodes))
+        self.hashes = [h for h, _ in self.ring]
+
+    def get_node(self, key):
+        """ Returns the node the key is assigned to, or None if the ring is empty.
+        """
+        if not self.ring:
+            return None
+        i = bisect.bisect(self.hashes, _hash(key)) % len(self.ring)
+        return self.ring[i][1]
+
+
+def get_assigned_servers(server_list, nodes, node_id, vnodes):
+    """ Returns the servers of the server list assigned to the node.
+    """
+    ring = HashRing(nodes, vnodes)
+    return [server for server in server_list if ring.get_node(server['server']) == node_id]
+
+
+class ShardMember:
+    """ Membership of one collector node, see module description.
+    """
+
+    def __init__(self, server_m, node_id, lease_ttl, vnodes, logger_m, settle_time=0, membership_ttl=None):
+        """
+        :param server_m: The DatabaseManager.
+        :param node_id: Unique ID of the node.
+        :param lease_ttl: Time in seconds the heartbeat and the leases are valid without renewal.
+        :param vnodes: Number of points of every node on the hashing ring.
+        :param logger_m: The LoggerManager.
+        :param settle_time: Time in seconds a joining node waits for the heartbeats of other nodes started at
+        the same time.
+        :param membership_ttl: Time in seconds the heartbeat is kept after leave(keep_membership=True), longer than
+        the interval of the cron runs. If None the heartbeat expires by lease_ttl.
+        """
+        self.server_m = server_m
+        self.node_id = node_id
+        self.lease_ttl = lease_ttl
+        self.vnodes = vnodes
+        self.logger_m = logger_m
+        self.settle_time = settle_time
+        self.membership_ttl = membership_ttl
+        self.joined = False
+        self.owned = set()
+        self.lock = threading.Lock()
+        self.stop_event = None
+        self.thread = None
+
+    def update(self, server_list):
+        """ Sends the heartbeat, releases the servers assigned to other nodes and acquires the leases of the servers
+        assigned to this node.
+        :param server_list: The complete server list.
+        :return: Returns the servers owned by this node.
+        """
+        with self.lock:
+            now = self.server_m.get_timestamp()
+            if not self.joined:
+                live = self.server_m.get_live_nodes(now)
+                self.server_m.set_node_heartbeat(self.node_id, now + self.lease_ttl)
+                if self.node_id not in live and self.settle_time > 0:
+                    # New member: other nodes starting now register their heartbeats meanwhile
+                    time.sleep(self.settle_time)
+                    now = self.server_m.get_timestamp()
+                self.joined = True
+            self.server_m.set_node_heartbeat(self.node_id, now + self.lease_ttl)
+            nodes = self.server_m.get_live_nodes(now)
+            if self.node_id not in nodes:
+                nodes.append(self.node_id)
+            assigned = get_assigned_servers(server_list, nodes, self.node_id, self.vnodes)
+            keys = [server['server'] for server in assigned]
+            released = self.owned - set(keys)
+            if released:
+                self.server_m.release_server_leases(self.node_id, sorted(released))
+            owned = set(self.server_m.acquire_server_leases(self.node_id, keys, now, now + self.lease_ttl))
+            taken = owned - self.owned
+            if taken or released:
+                self.logger_m.log_info('collector_sharding', 'Nodes: {0}, Servers owned: {1}, taken: {2}, released: '
+                                                             '{3}'.format(len(nodes), len(owned), len(taken), len(released)))
+            self.owned = owned
+        return [server for server in assigned if server['server'] in owned]
+
+    def renew(self):
+        """ Extends the heartbeat and the leases held by this node.
+        """
+        with self.lock:
+            expires = self.server_m.get_timestamp() + self.lease_ttl
+            self.server_m.set_node_heartbeat(self.node_id, expires)
+            self.server_m.renew_server_leases(self.node_id, expires)
+
+    def _renew_loop(self, stop_event):
+        while not stop_event.wait(self.lease_ttl / 3.0):
+            try:
+                self.renew()
+            except Exception as e:
+                # Leases may expire, the collector pointers are protected by the lease check of IngestSession
+                self.logger_m.log_warning('collector_sharding', 'Cannot renew leases: {0}'.format(repr(e)))
+
+    def start(self):
+        """ Starts the thread renewing the heartbeat and the leases every third of lease_ttl.
+        """
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._renew_loop, args=(self.stop_event,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def leave(self, keep_membership=False):
+        """ Stops the renewal and releases the leases, so other nodes can take over the servers immediately.
+        :param keep_membership: If True the heartbeat is kept (for membership_ttl if set) until it expires, the
+        servers assigned to this node stay assigned to it for the next run. Otherwise the heartbeat is removed and
+        the servers are assigned to the other nodes.
+        """
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            self.server_m.release_server_leases(self.node_id)
+            if keep_membership:
+                if self.membership_ttl is not None:
+                    self.server_m.set_node_heartbeat(self.node_id,
+                                                     self.server_m.get_timestamp() + self.membership_ttl)
+            else:
+                self.server_m.remove_node(self.node_id)
+                self.joined = False
+            self.owned = set()
@@ -0,0 +1,67 @@
+""" Shared Parameters - Collector Module
+
+Parsing of the global configuration directory (internalconf) and shared-params.xml of the central server.
+"""
+
+import hashlib
+import re
+import xml.etree.ElementTree as ET
+
+# Shared parameters part of the configuration directory: location, other headers, empty line and the content hash
+SHARED_PARAMS_PART = re.compile(
+    r"Content-location: (/V\d+/\d+/shared-params.xml)[ \t]*\r?\n(?:[\w-]+:[^\r\n]*\r?\n)*\r?\n([A-Za-z0-9+/=]+)")
+SHARED_PARAMS_LOCATION = re.compile(r"Content-location: (/V\d+/\d+/shared-params.xml)")
+
+
+def get_shared_params_location(internalconf):
+    """ Returns the location of shared-params.xml in the configuration directory and its hash (or None).
+    :param internalconf: Content of the configuration directory (str).
+    """
+    #  NB! global configuration regex might be changed according version naming or other future naming conventions
+    match = SHARED_PARAMS_PART.search(internalconf)
+    if match:
+        return match.group(1), match.group(2)
+    match = SHARED_PARAMS_LOCATION.search(internalconf)
+    if match is None:
+        raise ValueError('Shared parameters not found in configuration directory')
+    return match.group(1), None
+
+
+def get_content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def parse_shared_params(content):
+    """ Returns the list of security servers in shared-params.xml.
+    Members are indexed by id in one pass, so the cost grows linearly with the size of the instance.
+    :param content: Content of shared-params.xml (bytes).
+    """
+    root = ET.fromstring(content)
+    instance = root.find("./instanceIdentifier").text
+    members = dict((member.get('id'), member) for member in root.iterfind("./member"))
+    server_list = []
+    for server in root.iterfind("./securityServer"):
+        ownerId = server.find("./owner").text
+        owner = members[ownerId]
+        memberClass = owner.find("./memberClass/code").text
+        memberCode = owner.find("./memberCode").text
+        serverCode = server.find("./serverCode").text
+        address = server.find("./address").text
+        data = {}
+        data['ownerId'] = ownerId
+        data['instance'] = instance
+        data['memberClass'] = memberClass
+        data['memberCode'] = memberCode
+        data['serverCode'] = serverCode
+        data['address'] = address
+        data['server'] = instance + "/" + memberClass + "/" + memberCode + "/" + serverCode + "/" + address
+        server_list.append(data)
+    return server_list
+
+
+def get_server_list_diff(old_list, new_list):
+    """ Returns the sorted lists of server keys added and removed between the two server lists.
+    """
+    old_keys = set(s['server'] for s in old_list or [])
+    new_keys = set(s['server'] for s in new_list)
+    return sorted(new_keys - old_keys), sorted(old_keys - new_keys)
@@ -0,0 +1,195 @@
+""" Spool - Collector Module
+
+Write-ahead spool between fetching data from security servers and inserting it into MongoDB.
+Every fetched page is written into a gzip compressed NDJSON segment file with a sidecar index in the format of the
+segments of external_files/collector_into_file_get_opmon.py (server, file, compression, min and max
+monitoringDataTs and the record count), extended by the collector pointer value after the page. The drainer loads
+complete segments into raw_messages and advances the collector pointers in segment order.
+"""
+
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import os
+import time
+
+SEGMENT_EXTENSION = '.json.gz'
+PARTIAL_EXTENSION = '.part'
+INDEX_EXTENSION = '.idx.json'
+# Sidecar of segments written by earlier versions
+LEGACY_META_EXTENSION = '.meta.json'
+SEGMENT_COMPRESSION = 'gzip'
+POINTER_DIRECTORY = 'pointers'
+
+_segment_counter = itertools.count()
+
+
+def _write_json_atomic(file_name, data):
+    tmp_name = file_name + PARTIAL_EXTENSION
+    with open(tmp_name, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_name, file_name)
+
+
+class SpoolIngest:
+    """ Writes one fetched page into a spool segment, same interface as IngestSession.
+    """
+
+    def __init__(self, spool):
+        self.spool = spool
+        self.name = '{0:015d}_{1}_{2:06d}'.format(int(time.time() * 1000), os.getpid(), next(_segment_counter))
+        self.file_name = os.path.join(spool.path, self.name + SEGMENT_EXTENSION)
+        self.raw_file = open(self.file_name + PARTIAL_EXTENSION, 'wb')
+        self.file = io.TextIOWrapper(gzip.GzipFile(fileobj=self.raw_file, mode='wb'), encoding='utf-8')
+        self.records = 0
+        self.monitoring_data_ts = []
+
+    def insert(self, data_list):
+        """ Appends a batch of records of the page to the segment.
+        :param data_list: List of records.
+        """
+        for data in data_list:
+            self.file.write(json.dumps(data, separators=(',', ':')))
+            self.file.write('\n')
+            if data.get('monitoringDataTs') is not None:
+                self.monitoring_data_ts.append(data['monitoringDataTs'])
+        self.records += len(data_list)
+
+    def commit(self, server_key, records_from, stats=None):
+        """ Completes the segment, the page is durable after this call.
+        :param server_key: The server key.
+        :param records_from: Next records_from value.
+        :param stats: Additional server statistics stored in the collector pointer by the drainer.
+        """
+        self._close()
+        os.replace(self.file_name + PARTIAL_EXTENSION, self.file_name)
+        index = {'segment': self.name, 'server': server_key, 'file': self.name + SEGMENT_EXTENSION,
+                 'compression': SEGMENT_COMPRESSION, 'records': self.records,
+                 'minMonitoringDataTs': min(self.monitoring_data_ts) if self.monitoring_data_ts else None,
+                 'maxMonitoringDataTs': max(self.monitoring_data_ts) if self.monitoring_data_ts else None,
+                 'records_from': records_from, 'stats': stats or {}, 'created': time.time()}
+        _write_json_atomic(os.path.join(self.spool.path, self.name + INDEX_EXTENSION), index)
+        _write_json_atomic(self.spool.get_pointer_file(server_key), {'server': server_key, 'records_from': records_from})
+
+    def abort(self):
+        """ Discards the segment.
+        """
+        if self.file is not None:
+            self._close()
+            os.remove(self.file_name + PARTIAL_EXTENSION)
+
+    def _close(self):
+        # Closing the gzip stream leaves the underlying file open for fsync
+        self.file.close()
+        self.file = None
+        self.raw_file.flush()
+        os.fsync(self.raw_file.fileno())
+        self.raw_file.close()
+
+
+class Spool:
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, POINTER_DIRECTORY), exist_ok=True)
+
+    def start_ingest(self, server_key):
+        """ Starts writing of one fetched page of the server, see SpoolIngest.
+        """
+        return SpoolIngest(self)
+
+    def get_pointer_file(self, server_key):
+        name = hashlib.sha1(server_key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, POINTER_DIRECTORY, name + '.json')
+
+    def get_records_from(self, server_key):
+        """ Returns the records_from value after the last spooled page of the server, or None.
+        """
+        try:
+            with open(self.get_pointer_file(server_key)) as f:
+                return json.load(f)['records_from']
+        except (IOError, ValueError, KeyError):
+            return None
+
+    def list_segments(self):
+        """ Returns the indexes of all complete segments, oldest first.
+        """
+        segments = []
+        for file_name in sorted(os.listdir(self.path)):
+            if file_name.endswith(INDEX_EXTENSION) or file_name.endswith(LEGACY_META_EXTENSION):
+                with open(os.path.join(self.path, file_name)) as f:
+                    segments.append(json.load(f))
+        return segments
+
+    def read_segment(self, segment, batch_size):
+        """ Yields the records of the segment in lists of at most batch_size records.
+        """
+        batch = []
+        with gzip.open(os.path.join(self.path, segment['segment'] + SEGMENT_EXTENSION), 'rt', encoding='utf-8') as f:
+            for line in f:
+                batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def remove_segment(self, segment):
+        os.remove(os.path.join(self.path, segment['segment'] + SEGMENT_EXTENSION))
+        for extension in (INDEX_EXTENSION, LEGACY_META_EXTENSION):
+            index_name = os.path.join(self.path, segment['segment'] + extension)
+            if os.path.exists(index_name):
+                os.remove(index_name)
+
+    def remove_partial(self, max_age):
+        """ Removes segments left incomplete by interrupted workers.
+        :param max_age: Minimum age of the removed files, in seconds.
+        """
+        now = time.time()
+        for file_name in os.listdir(self.path):
+            full_name = os.path.join(self.path, file_name)
+            if file_name.endswith(PARTIAL_EXTENSION) and now - os.path.getmtime(full_name) > max_age:
+                os.remove(full_name)
+
+
+def drain_spool(spool, server_m, batch_size, logger_m):
+    """ Loads complete spool segments into raw_messages and advances the collector pointers.
+    A segment already recorded in the collector pointer (spool_segment) is not loaded again.
+    :param spool: The Spool.
+    :param server_m: The DatabaseManager.
+    :param batch_size: Number of records inserted at a time.
+    :param logger_m: The LoggerManager.
+    :return: Returns the number of loaded segments and records.
+    """
+    total_segments = 0
+    total_records = 0
+    pointers = server_m.get_collector_pointers()
+    for segment in spool.list_segments():
+        server_key = segment['server']
+        pointer = pointers.get(server_key, {})
+        if pointer.get('spool_segment', '') >= segment['segment']:
+            # Loaded before the segment was removed
+            spool.remove_segment(segment)
+            continue
+        ingest = server_m.start_ingest(server_key)
+        try:
+            for records in spool.read_segment(segment, batch_size):
+                ingest.insert(records)
+        except Exception:
+            ingest.abort()
+            raise
+        stats = dict(segment['stats'])
+        stats['spool_segment'] = segment['segment']
+        ingest.commit(server_key, segment['records_from'], stats)
+        pointers[server_key] = stats
+        spool.remove_segment(segment)
+        total_segments += 1
+        total_records += segment['records']
+    if total_segments:
+        logger_m.log_info('collector_spool', 'Loaded {0} segments with {1} records from spool'.format(
+            total_segments, total_records))
+    return total_segments, total_records
@@ -0,0 +1,51 @@
+""" Loads the pages spooled by the collector into raw_messages
+    and advances collector_state.collector_pointer
+"""
+
+import logging
+import os
+from logging.handlers import WatchedFileHandler
+
+from .collectorlib.database_manager import DatabaseManager
+from .collectorlib.logger_manager import LoggerManager
+from .collectorlib.spool import Spool, drain_spool
+from . import settings
+
+# Incomplete segments older than this are left by interrupted workers, in seconds
+PARTIAL_SEGMENT_MAX_AGE = 86400
+
+
+def main(logger_m):
+    if not settings.SPOOL_PATH:
+        print('- Spool is not enabled (SPOOL_PATH)')
+        return
+    server_m = DatabaseManager(settings.MONGODB_SUFFIX,
+                               settings.MONGODB_SERVER,
+                               settings.MONGODB_USER,
+                               settings.MONGODB_PWD,
+                               logger_m,
+                               write_concern=settings.MONGODB_WRITE_CONCERN,
+                               use_transactions=settings.MONGODB_TRANSACTIONS,
+                               raw_storage=settings.RAW_STORAGE)
+
+    spool = Spool(settings.SPOOL_PATH)
+    spool.remove_partial(PARTIAL_SEGMENT_MAX_AGE)
+    total_segments, total_records = drain_spool(spool, server_m, settings.INSERT_BATCH_SIZE, logger_m)
+    print('- Total of {0} segments with {1} records loaded from spool.'.format(total_segments, total_records))
+
+
+if __name__ == '__main__':
+    logger = logging.getLogger(settings.LOGGER_NAME)
+    logger.setLevel(settings.LOGGER_LEVEL)
+
+    formatter = logging.Formatter("%(message)s")
+    file_handler = WatchedFileHandler(os.path.join(settings.LOGGER_PATH, settings.LOGGER_FILE))
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+
+    logger_m = LoggerManager(settings.LOGGER_NAME, settings.MODULE)
+    try:
+        main(logger_m)
+    except Exception as e:
+        logger_m.log_error('drain_spool', '{0}'.format(repr(e)))
+        raise e
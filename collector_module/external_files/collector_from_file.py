@@ -4,6 +4,17 @@ Usage example:
 
 > python collector_from_file.py query_db_ee-dev root "temp_files/ee-dev.COM.*" --auth auth_db --host 127.0.0.1:27017
 
+Files are read and parsed in parallel by --workers processes and streamed to MongoDB in unordered insert_many
+chunks of --chunk-size records. Memory use does not depend on the size of the files.
+
+Duplicates are removed with a bounded set of the last --dedup-size record hashes, duplicates further apart
+are left for the corrector, which checks every record against the hashes of clean_data anyway.
+
+Progress of every file is kept in the ledger file (--ledger). An interrupted run continues where it stopped,
+files loaded completely (and not changed since) are skipped.
+
+Segments written by collector_into_file_get_opmon.py (OUTPUT_MODE "segments") are selected by their sidecar
+index: with --records-from / --records-to only segments holding records of the given period are loaded.
 """
 import time
 import getpass
@@ -12,12 +23,33 @@ import hashlib
 import collections
 import glob
 import argparse
+import gzip
+import io
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
 
 import pymongo
+from pymongo.errors import BulkWriteError
 from tqdm import tqdm
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+__version__ = '0.4'
 
-__version__ = '0.3'
+# Seconds between ledger file updates
+LEDGER_SAVE_INTERVAL = 5.0
+
+# Seconds to wait for the readers before checking that none of them failed
+READER_CHECK_INTERVAL = 5.0
+
+SEGMENT_EXTENSIONS = ('.json.gz', '.json.zst')
+INDEX_EXTENSION = '.idx.json'
 
 
 def get_timestamp():
@@ -39,10 +71,239 @@ def calculate_hash(_document):
     return "{0}_{1}".format(document['monitoringDataTs'], doc_hash)
 
 
-def process_files(file_list, mdb_database, mdb_user, mdb_pwd, mdb_server, mdb_auth):
+def open_file(file_name):
+    """ Opens a log file, files ending with .gz (e.g. collector spool segments) or .zst are decompressed
+
+    :param file_name: The file name
+    :return: the file object
+    """
+    if file_name.endswith('.gz'):
+        return gzip.open(file_name, 'rt', encoding='utf-8')
+    if file_name.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('zstandard module is required to read {0}'.format(file_name))
+        reader = zstandard.ZstdDecompressor().stream_reader(open(file_name, 'rb'), read_across_frames=True)
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    return open(file_name)
+
+
+def get_segment_index(file_name):
+    """ Returns the sidecar index of a segment file, None if the file has no index
+
+    :param file_name: The file name
+    :return: the index dictionary
+    """
+    for extension in SEGMENT_EXTENSIONS:
+        if file_name.endswith(extension):
+            index_name = file_name[:-len(extension)] + INDEX_EXTENSION
+            if os.path.isfile(index_name):
+                with open(index_name) as f:
+                    return json.load(f)
+    return None
+
+
+def select_files(file_list, records_from=None, records_to=None):
+    """ Returns the files to load: index files are left out, and segments with index only if they hold
+    records between records_from and records_to
+
+    :param file_list: The list of files
+    :param records_from: Minimum monitoringDataTs or None
+    :param records_to: Maximum monitoringDataTs or None
+    :return: the selected files
+    """
+    selected = []
+    for file_name in file_list:
+        if file_name.endswith(INDEX_EXTENSION):
+            continue
+        if records_from is not None or records_to is not None:
+            index = get_segment_index(file_name)
+            if index is not None:
+                if records_from is not None and index['maxMonitoringDataTs'] < records_from:
+                    continue
+                if records_to is not None and index['minMonitoringDataTs'] > records_to:
+                    continue
+        selected.append(file_name)
+    return selected
+
+
+class BoundedHashSet:
+    """ Set of the last capacity record hashes, stored as 64-bit integers
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.hashes = set()
+        self.order = collections.deque()
+
+    def add(self, doc_hash):
+        """ Adds the hash
+
+        :param doc_hash: The hash returned by calculate_hash
+        :return: False if the hash was already present
+        """
+        key = int(doc_hash[-16:], 16)
+        if key in self.hashes:
+            return False
+        self.hashes.add(key)
+        self.order.append(key)
+        if len(self.order) > self.capacity:
+            self.hashes.discard(self.order.popleft())
+        return True
+
+
+class Ledger:
+    """ Per-file loading progress: number of lines stored in MongoDB and if the file is complete
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.files = {}
+        if os.path.isfile(file_name):
+            with open(file_name) as f:
+                self.files = json.load(f)
+        self.saved = time.time()
+
+    @staticmethod
+    def get_signature(file_name):
+        stat = os.stat(file_name)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def get_start_line(self, file_name):
+        """ Returns the number of lines already loaded, None if the whole file is loaded
+        """
+        entry = self.files.get(file_name)
+        signature = self.get_signature(file_name)
+        if entry is None or entry['size'] != signature['size'] or entry['mtime'] != signature['mtime']:
+            # New or changed (e.g. rotated) file is loaded from the beginning
+            entry = dict(signature, lines=0, complete=False)
+            self.files[file_name] = entry
+        if entry['complete']:
+            return None
+        return entry['lines']
+
+    def set_progress(self, file_name, lines, complete=False):
+        self.files[file_name]['lines'] = lines
+        self.files[file_name]['complete'] = complete
+        if complete or time.time() - self.saved > LEDGER_SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        tmp_name = self.file_name + '.tmp'
+        with open(tmp_name, 'w') as f:
+            json.dump(self.files, f)
+        os.replace(tmp_name, self.file_name)
+        self.saved = time.time()
+
+
+class FileProgress:
+    """ Tracks the chunks of a file stored in MongoDB, which may complete in any order
+    """
+
+    def __init__(self, start_line):
+        self.done_line = start_line
+        self.finished = {}
+        self.end_line = None
+        self.saved_complete = False
+
+    def chunk_done(self, first_line, end_line):
+        """ Returns True if the contiguous loaded part of the file grew
+        """
+        self.finished[first_line] = end_line
+        advanced = False
+        while self.done_line in self.finished:
+            self.done_line = self.finished.pop(self.done_line)
+            advanced = True
+        return advanced
+
+    def is_complete(self):
+        return self.end_line is not None and self.done_line >= self.end_line
+
+
+def check_readers(results):
+    """ Raises the error of a failed reader, the rest of its file would never arrive in the queue
+
+    :param results: List of (file_name, AsyncResult) of the readers
+    :return: None
+    """
+    for file_name, result in results:
+        if result.ready() and not result.successful():
+            print('ERROR: reader of file {0} failed'.format(file_name))
+            result.get()
+
+
+_queue = None
+
+
+def init_reader(chunk_queue):
+    global _queue
+    _queue = chunk_queue
+
+
+def read_file(file_name, start_line, chunk_size):
+    """ Parses the file from start_line and puts the chunks of records into the queue of the loader process
+
+    Queue items: (file_name, first_line, end_line, records, errors); the last item of a file has first_line None
+    and end_line None if the file could not be read to the end.
+    """
+    first_line = start_line
+    line_count = 0
+    records = []
+    errors = 0
+    try:
+        with open_file(file_name) as f:
+            for line_no, line in enumerate(f):
+                line_count = line_no + 1
+                if line_no < start_line:
+                    continue
+                try:
+                    jsonn = json.loads(line)
+                    records.append((calculate_hash(jsonn), jsonn))
+                except Exception as e:
+                    print('ERROR: file {0} line {1} --- {2}'.format(file_name, line_no, e))
+                    errors += 1
+                if line_no + 1 - first_line >= chunk_size:
+                    _queue.put((file_name, first_line, line_no + 1, records, errors))
+                    first_line = line_no + 1
+                    records = []
+                    errors = 0
+    except Exception as e:
+        print('ERROR: file {0} --- {1}'.format(file_name, e))
+        # Records read before the error are stored and recorded in the ledger, a rerun continues after them
+        _queue.put((file_name, first_line, max(line_count, first_line), records, errors + 1))
+        _queue.put((file_name, None, None, None, 0))
+        return
+    end_line = max(line_count, first_line)
+    if end_line > first_line:
+        _queue.put((file_name, first_line, end_line, records, errors))
+    _queue.put((file_name, None, end_line, None, 0))
+
+
+def insert_chunk(raw_msg, records):
+    """ Inserts the records with unordered bulk write
+
+    :return: Number of records not inserted
+    """
+    if not records:
+        return 0
+    try:
+        raw_msg.insert_many(records, ordered=False)
+    except BulkWriteError as e:
+        print('ERROR: {0} records not inserted --- {1}'.format(len(e.details['writeErrors']),
+                                                             e.details['writeErrors'][0]['errmsg']))
+        return len(e.details['writeErrors'])
+    return 0
+
+
+def process_files(file_list, mdb_database, mdb_user, mdb_pwd, mdb_server, mdb_auth, workers=None,
+                  chunk_size=1000, insert_threads=4, dedup_size=5000000, ledger_file='collector_from_file.ledger.json'):
     """ Process list of files into MongoDB
 
     :param file_list: The list of log files with JSON queries
+    :param workers: Number of processes reading the files, default is the number of CPUs
+    :param chunk_size: Number of lines parsed and records inserted at a time
+    :param insert_threads: Number of concurrent insert_many calls
+    :param dedup_size: Number of record hashes kept for duplicate detection
+    :param ledger_file: The progress ledger file
     :return: None
     """
     uri = "mongodb://{0}:{1}@{2}/{3}".format(mdb_user, mdb_pwd, mdb_server, mdb_auth)
@@ -51,36 +312,96 @@ def process_files(file_list, mdb_database, mdb_user, mdb_pwd, mdb_server, mdb_au
     db = client[db_name]
     raw_msg = db['raw_messages']
     total_processed = 0
-    total_queries = 0
+    total_unique = 0
     total_error = 0
-    unique_queries_to_add = []
-    queries_hash = set()
 
+    ledger = Ledger(ledger_file)
+    progress = {}
     for file_name in file_list:
-        print('--> processing file: {0}'.format(file_name))
-        with open(file_name) as f:
-            lines = f.readlines()
-            total_queries += len(lines)
-            for i, line in enumerate(lines):
+        start_line = ledger.get_start_line(file_name)
+        if start_line is None:
+            print('--> skipping loaded file: {0}'.format(file_name))
+        else:
+            progress[file_name] = FileProgress(start_line)
+    if not progress:
+        return
+
+    workers = workers or multiprocessing.cpu_count()
+    # Bounded queue and number of pending inserts limit the records held in memory
+    chunk_queue = multiprocessing.Queue(maxsize=workers * 2)
+    pool = multiprocessing.Pool(processes=workers, initializer=init_reader, initargs=(chunk_queue,))
+    executor = ThreadPoolExecutor(max_workers=insert_threads)
+    pending = collections.deque()
+    queries_hash = BoundedHashSet(dedup_size)
+    results = [(file_name, pool.apply_async(read_file, (file_name, p.done_line, chunk_size)))
+               for file_name, p in progress.items()]
+    files_left = len(progress)
+    completed = False
+
+    def update_ledger(file_name, advanced):
+        file_progress = progress[file_name]
+        if file_progress.is_complete():
+            if not file_progress.saved_complete:
+                print('--> loaded file: {0}'.format(file_name))
+                ledger.set_progress(file_name, file_progress.done_line, True)
+                file_progress.saved_complete = True
+        elif advanced:
+            ledger.set_progress(file_name, file_progress.done_line)
+
+    def complete_chunk(future, file_name, first_line, end_line):
+        nonlocal total_error
+        total_error += future.result()
+        update_ledger(file_name, progress[file_name].chunk_done(first_line, end_line))
+
+    try:
+        with tqdm(unit=' records') as progress_bar:
+            while files_left:
                 try:
-                    jsonn = json.loads(line)
-                    jsonn['insertTime'] = get_timestamp()
-                    doc_hash = calculate_hash(jsonn)
-                    if doc_hash not in queries_hash:
+                    file_name, first_line, end_line, records, errors = chunk_queue.get(
+                        timeout=READER_CHECK_INTERVAL)
+                except queue.Empty:
+                    check_readers(results)
+                    continue
+                if first_line is None:
+                    # End of file, or read error if end_line is None
+                    progress[file_name].end_line = end_line
+                    files_left -= 1
+                    update_ledger(file_name, False)
+                    continue
+                total_processed += len(records)
+                total_error += errors
+                timestamp = get_timestamp()
+                unique_queries_to_add = []
+                for doc_hash, jsonn in records:
+                    if queries_hash.add(doc_hash):
+                        jsonn['insertTime'] = timestamp
                         unique_queries_to_add.append(jsonn)
-                        queries_hash.add(doc_hash)
-                    total_processed += 1
-                except Exception as e:
-                    print('ERROR: file {0} line {1} --- {2}'.format(file_name, i, e))
-                    total_error += 1
+                total_unique += len(unique_queries_to_add)
+                pending.append((executor.submit(insert_chunk, raw_msg, unique_queries_to_add),
+                                file_name, first_line, end_line))
+                while len(pending) > insert_threads * 2 or (pending and pending[0][0].done()):
+                    complete_chunk(*pending.popleft())
+                    while pending and pending[0][0].done():
+                        complete_chunk(*pending.popleft())
+                progress_bar.update(len(records))
+            while pending:
+                complete_chunk(*pending.popleft())
+            for _, result in results:
+                result.get()
+            completed = True
+    finally:
+        ledger.save()
+        executor.shutdown(wait=True)
+        if completed:
+            pool.close()
+        else:
+            # Readers may be blocked on the full queue
+            pool.terminate()
+        pool.join()
 
-    total_unique_queries = len(unique_queries_to_add)
-    print('- Total processed: {0} from {1}'.format(total_processed, total_queries))
-    print('- Total unique queries: {0} '.format(total_unique_queries))
+    print('- Total processed: {0}'.format(total_processed))
+    print('- Total unique queries: {0} '.format(total_unique))
     print('- Total errors: {0}'.format(total_error))
-    print('- Adding queries to MongoDB')
-    for jsonn in tqdm(unique_queries_to_add):
-        raw_msg.insert_one(jsonn)
 
 
 def main():
@@ -95,6 +416,20 @@ def main():
     parser.add_argument('--host', dest='mdb_host', help='MongoDB host (default: %(default)s)',
                         default='127.0.0.1:27017')
     parser.add_argument('--confirm', dest='confirmation', help='Skip confirmation step, if True', default="False")
+    parser.add_argument('--workers', dest='workers', type=int, default=multiprocessing.cpu_count(),
+                        help='Number of processes reading the files (default: %(default)s)')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=1000,
+                        help='Number of records inserted at a time (default: %(default)s)')
+    parser.add_argument('--insert-threads', dest='insert_threads', type=int, default=4,
+                        help='Number of concurrent inserts (default: %(default)s)')
+    parser.add_argument('--dedup-size', dest='dedup_size', type=int, default=5000000,
+                        help='Number of record hashes kept for duplicate detection (default: %(default)s)')
+    parser.add_argument('--ledger', dest='ledger', default='collector_from_file.ledger.json',
+                        help='Progress ledger file (default: %(default)s)')
+    parser.add_argument('--records-from', dest='records_from', type=int, default=None,
+                        help='Load only the segments with records from this monitoringDataTs (requires segment index)')
+    parser.add_argument('--records-to', dest='records_to', type=int, default=None,
+                        help='Load only the segments with records up to this monitoringDataTs (requires segment index)')
     args = parser.parse_args()
 
     # Get user password to access MongoDB
@@ -102,7 +437,7 @@ def main():
     if mdb_pwd is None:
         mdb_pwd = getpass.getpass('Password:')
 
-    file_list = glob.glob(args.FILE_PATTERN)
+    file_list = select_files(sorted(glob.glob(args.FILE_PATTERN)), args.records_from, args.records_to)
     total_input_files = len(file_list)
     print('******************************************************************************')
     print('* Collector from file [version {0}]                                          *'.format(__version__))
@@ -110,7 +445,7 @@ def main():
     print('- The following files will be added to MongoDB (total {0} files)'.format(total_input_files))
     # If no files are added, return
     if total_input_files == 0:
-        print('- Nothing to do... please check the input parameter: "{0}"'.format(args.file_pattern))
+        print('- Nothing to do... please check the input parameter: "{0}"'.format(args.FILE_PATTERN))
         return
     # List files to get user approval
     for f in file_list:
@@ -128,7 +463,9 @@ def main():
     mdb_auth = args.auth_db
 
     if choice.strip().lower() in {'y', 'yes'}:
-        process_files(file_list, mdb_database, mdb_user, mdb_pwd, mdb_server, mdb_auth)
+        process_files(file_list, mdb_database, mdb_user, mdb_pwd, mdb_server, mdb_auth, workers=args.workers,
+                      chunk_size=args.chunk_size, insert_threads=args.insert_threads, dedup_size=args.dedup_size,
+                      ledger_file=args.ledger)
     else:
         print('- Canceling operation ...')
     print('- Done')
@@ -6,6 +6,7 @@
 # Threaded queries (THREAD_COUNT) in use
 # Result files in directory LOG_PATH, rotated with max size LOG_MAX_SIZE
 # Maximum amount of rotated logs to keep is LOG_BACKUP_COUNT
+# Or, with OUTPUT_MODE "segments", compressed segments in SEGMENT_PATH split by record time and server
 # Status file to keep nextRecordsFrom values is NEXT_RECORDS_FILE
 #
 # NB! Global configuration signature is not checked. Use this program at your own risk
@@ -24,6 +25,7 @@ import os
 import logging
 from logging.handlers import RotatingFileHandler
 import settings
+import opmon_segments
 
 
 ###########################
@@ -119,15 +121,33 @@ REPEAT_MIN_RECORDS = settings.REPEAT_MIN_RECORDS
 # REPEAT_LIMIT=500
 REPEAT_LIMIT = settings.REPEAT_LIMIT
 
+# Output mode:
+# "log" - records are appended to log files LOG_PATH/YYYY/MM/DD/<server>.log (date of the run), rotated by size
+# "segments" - records are written into compressed NDJSON segments
+#   SEGMENT_PATH/YYYY/MM/DD/<server>.<segment start>.<run id>.json.gz (or .json.zst),
+#   one segment per server, run and SEGMENT_SECONDS of record time (monitoringDataTs, UTC).
+#   Every segment has a sidecar index <server>.<segment start>.<run id>.idx.json holding the server,
+#   min and max monitoringDataTs and the record count
+OUTPUT_MODE = "log"
+
 # Path to the logs. Leave empty for current directory or add path with "/" at the end
 LOG_PATH = "./"
 # We do use subdirectories in form of YYYY/MM/DD/ under LOG_PATH
 now = datetime.datetime.now()
 LOG_PATH = LOG_PATH + "/" + '{:04d}'.format(now.year) + "/" + '{:02d}'.format(now.month) + "/" + '{:02d}'.format(now.day) + "/"
 
-if not os.path.exists(LOG_PATH):
+if OUTPUT_MODE == "log" and not os.path.exists(LOG_PATH):
     os.makedirs(LOG_PATH)
 
+# Path to the segments, subdirectories YYYY/MM/DD/ are based on record time
+SEGMENT_PATH = "./"
+
+# Time period of records in one segment (in seconds)
+SEGMENT_SECONDS = 3600
+
+# Segment compression: "gzip" or "zstd" (requires python zstandard module)
+SEGMENT_COMPRESSION = "gzip"
+
 # Maximum log size (in bytes) before log rotation
 # 10000000 ~ 10Mb
 # 100000000 ~ 100Mb
@@ -140,6 +160,12 @@ LOG_BACKUP_COUNT = 100
 # End of configurable parameters #
 ##################################
 
+# Identifies the segments written by this run
+RUN_ID = time.strftime('%Y%m%dT%H%M%S', time.gmtime()) + "-" + str(os.getpid())
+
+if OUTPUT_MODE == "segments":
+    segmentWriter = opmon_segments.SegmentWriter(SEGMENT_PATH, SEGMENT_SECONDS, SEGMENT_COMPRESSION, RUN_ID)
+
 # Main function that queries data and saves to the logs
 def process_data(threadName, serverData):
     # Example "server" values:
@@ -221,8 +247,12 @@ def process_data(threadName, serverData):
         sys.stderr.write(threadName + ": " + host_name + ": " + "Parse exception: " + response.content + "\n")
         return
 
+    # Writing to segments
+    if len(records) and OUTPUT_MODE == "segments":
+        if DEBUG: print (threadName + ": " + host_name + ": " + "Appending " + str(len(records)) + " records to segments")
+        segmentWriter.write(host_name, m.group(0), records)
     # Writing to log files
-    if len(records):
+    elif len(records):
         if DEBUG: print (threadName + ": " + host_name + ": " + "Appending " + str(len(records)) + " lines to log file")
         # TODO: host_name produces hierarchical logger. Can it be a problem?
         logger = logging.getLogger(host_name)
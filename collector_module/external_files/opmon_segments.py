@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Compressed NDJSON segments of operational monitoring records, used by collector_into_file_get_opmon.py."""
+
+__all__ = ['SegmentWriter', 'INDEX_EXTENSION']
+
+import json
+import os
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+INDEX_EXTENSION = '.idx.json'
+
+
+class SegmentWriter(object):
+    """Appends records to the segments of one run.
+
+    Segment path is <path>/YYYY/MM/DD/<host name>.<segment start>.<run id>.json.gz (or .json.zst), one segment
+    per server, run and segment_seconds of record time (monitoringDataTs, UTC). Every page is appended as a
+    separate gzip member or zstd frame. The sidecar index <...>.idx.json holds the server, min and max
+    monitoringDataTs and the record count, it is rewritten after the data is appended.
+    """
+
+    def __init__(self, path, segment_seconds, compression, run_id):
+        if compression == "zstd" and zstandard is None:
+            raise ImportError('zstandard module is required for zstd segments')
+        self.path = path
+        self.segment_seconds = segment_seconds
+        self.compression = compression
+        self.run_id = run_id
+        # Index of the segments written by this run, by segment file name
+        self.index = {}
+        self.index_lock = threading.Lock()
+
+    def compress(self, data):
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor().compress(data)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        return compressor.compress(data) + compressor.flush()
+
+    def write(self, host_name, server, records):
+        """Groups the records by segment start time and appends them to the segments of this run.
+
+        :param host_name: Security server host name, prefix of the segment names
+        :param server: Security server identifier stored in the index
+        :param records: List of records
+        """
+        segments = {}
+        for record in records:
+            ts = int(record.get("monitoringDataTs", 0))
+            segments.setdefault(ts - ts % self.segment_seconds, []).append(record)
+
+        for start in sorted(segments):
+            segment_records = segments[start]
+            segment_dir = os.path.join(self.path, time.strftime('%Y/%m/%d', time.gmtime(start)))
+            try:
+                os.makedirs(segment_dir)
+            except OSError:
+                if not os.path.isdir(segment_dir):
+                    raise
+            base_name = os.path.join(segment_dir, host_name + "." + time.strftime(
+                '%Y%m%dT%H%M%S', time.gmtime(start)) + "." + self.run_id)
+            file_name = base_name + (".json.zst" if self.compression == "zstd" else ".json.gz")
+
+            data = "".join(json.dumps(record, separators=(',', ':')) + "\n" for record in segment_records)
+            with open(file_name, "ab") as segment_file:
+                segment_file.write(self.compress(data.encode("utf-8")))
+
+            # Index is written after the data, so it never describes records missing from the segment
+            timestamps = [int(record.get("monitoringDataTs", 0)) for record in segment_records]
+            with self.index_lock:
+                index = self.index.get(file_name)
+                if index is None:
+                    index = {"server": server, "file": os.path.basename(file_name), "compression": self.compression,
+                             "segmentStart": start, "segmentEnd": start + self.segment_seconds,
+                             "minMonitoringDataTs": min(timestamps), "maxMonitoringDataTs": max(timestamps),
+                             "records": 0}
+                    self.index[file_name] = index
+                index["minMonitoringDataTs"] = min(index["minMonitoringDataTs"], min(timestamps))
+                index["maxMonitoringDataTs"] = max(index["maxMonitoringDataTs"], max(timestamps))
+                index["records"] += len(segment_records)
+                with open(base_name + INDEX_EXTENSION + ".tmp", "w") as index_file:
+                    json.dump(index, index_file, sort_keys=True)
+                os.rename(base_name + INDEX_EXTENSION + ".tmp", base_name + INDEX_EXTENSION)
@@ -0,0 +1,338 @@
+#!/usr/bin/python
+
+"""Crawler of the X-Road service catalog: method lists and WSDLs of all
+registered subsystems.
+
+Subsystems are queried concurrently by a bounded pool of worker
+threads. Results are cached on disk, one JSON file per subsystem and
+WSDL documents by their content hash. A cached subsystem is queried
+again only if its Security Servers changed in shared-params, its
+previous query failed or the entry is older than max_age.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import six
+from six.moves import queue
+import sys
+import tempfile
+import threading
+import time
+import xrdinfo
+
+# Default timeout for HTTP requests
+DEFAULT_TIMEOUT = 5.0
+
+# Default number of concurrent requests
+DEFAULT_THREADS = 16
+
+# Default maximum age of cached entries, in seconds
+DEFAULT_MAX_AGE = 24 * 3600
+
+# Version of the cache entry format
+CACHE_VERSION = 1
+
+
+def print_error(content):
+    """Thread safe and unicode safe error printer."""
+    content = u"ERROR: {}\n".format(content)
+    if six.PY2:
+        sys.stderr.write(content.encode('utf-8'))
+    else:
+        sys.stderr.write(content)
+
+
+def content_hash(content):
+    """MD5 hash of unicode content."""
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def registered_subsystem_servers(shared_params):
+    """Return dict: subsystem tuple -> sorted list of Security Server
+    identifiers the subsystem is registered in. Subsystems without
+    Security Servers are not included.
+    """
+    result = {}
+    for item in xrdinfo.subsystems_with_server(shared_params):
+        if len(item) == 9:
+            result.setdefault(tuple(item[0:4]), set()).add(xrdinfo.stringify(item[4:9]))
+    return dict((subsystem, sorted(server_ids)) for subsystem, server_ids in result.items())
+
+
+class CatalogCache(object):
+    """On-disk cache of the catalog. Writes are atomic, so an
+    interrupted crawl leaves the cache consistent.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.wsdl_path = os.path.join(path, 'wsdl')
+        for directory in (self.path, self.wsdl_path):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    def _write(self, file_name, content):
+        fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(file_name), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(content.encode('utf-8'))
+        os.rename(tmp_name, file_name)
+
+    def _subsystem_file(self, subsystem):
+        return os.path.join(self.path, content_hash(xrdinfo.stringify(subsystem)) + '.json')
+
+    def get(self, subsystem):
+        """Return cached entry of subsystem or None."""
+        try:
+            with open(self._subsystem_file(subsystem), 'rb') as entry_file:
+                entry = json.loads(entry_file.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get('cacheVersion') != CACHE_VERSION:
+            return None
+        return entry
+
+    def put(self, subsystem, entry):
+        entry['cacheVersion'] = CACHE_VERSION
+        self._write(self._subsystem_file(subsystem), json.dumps(entry, sort_keys=True))
+
+    def get_wsdl(self, wsdl_hash):
+        """Return cached WSDL document or None."""
+        try:
+            with open(os.path.join(self.wsdl_path, wsdl_hash + '.wsdl'), 'rb') as wsdl_file:
+                return wsdl_file.read().decode('utf-8')
+        except (IOError, OSError):
+            return None
+
+    def put_wsdl(self, wsdl_doc):
+        """Store WSDL document, return its hash."""
+        wsdl_hash = content_hash(wsdl_doc)
+        file_name = os.path.join(self.wsdl_path, wsdl_hash + '.wsdl')
+        if not os.path.exists(file_name):
+            self._write(file_name, wsdl_doc)
+        return wsdl_hash
+
+
+def is_fresh(entry, servers, now, max_age):
+    """Check if cached entry can be used without querying the
+    subsystem again.
+    """
+    return (entry is not None and entry.get('ok') and entry.get('servers') == servers
+            and now - entry.get('fetched', 0) < max_age)
+
+
+class CatalogCrawler(object):
+    """Concurrent crawler of the service catalog, see module
+    description.
+    """
+
+    def __init__(
+            self, addr, client, cache, threads=DEFAULT_THREADS, max_age=DEFAULT_MAX_AGE,
+            method='listMethods', wsdl=True, timeout=DEFAULT_TIMEOUT, verify=False, cert=None):
+        self.addr = addr
+        self.client = client
+        self.cache = cache
+        self.threads = threads
+        self.max_age = max_age
+        self.method = method
+        self.wsdl = wsdl
+        self.timeout = timeout
+        self.verify = verify
+        self.cert = cert
+        self.lock = threading.Lock()
+        self.work_queue = None
+        self.entries = {}
+        self.errors = []
+
+    def _fetch_methods(self, subsystem, entry, cached):
+        try:
+            entry['methods'] = sorted(
+                list(method) for method in xrdinfo.methods(
+                    addr=self.addr, client=self.client, producer=subsystem, method=self.method,
+                    timeout=self.timeout, verify=self.verify, cert=self.cert))
+            entry['ok'] = True
+        except xrdinfo.XrdInfoError as e:
+            self._add_error(u'{}: {}'.format(xrdinfo.stringify(subsystem), e))
+            if cached is not None and cached.get('ok'):
+                # Keep the previous catalog of the subsystem, the cached entry is queried again next time
+                cached['error'] = u'{}'.format(e)
+                with self.lock:
+                    self.entries[subsystem] = cached
+                return
+            entry['error'] = u'{}'.format(e)
+            self._store(subsystem, entry)
+            return
+        if self.wsdl and entry['methods']:
+            # WSDL of every service is requested by its own task, the last one stores the entry
+            entry['pending'] = len(entry['methods'])
+            for method in entry['methods']:
+                self.work_queue.put((self._fetch_wsdl, (subsystem, entry, method)))
+        else:
+            self._store(subsystem, entry)
+
+    def _fetch_wsdl(self, subsystem, entry, method):
+        wsdl_hash = None
+        error = None
+        try:
+            wsdl_doc = xrdinfo.wsdl(
+                addr=self.addr, client=self.client, service=method, timeout=self.timeout,
+                verify=self.verify, cert=self.cert)
+            if wsdl_doc:
+                wsdl_hash = self.cache.put_wsdl(wsdl_doc)
+        except Exception as e:
+            # Also errors of the cache, the entry must be stored after the last task
+            error = u'{}: {}'.format(xrdinfo.stringify(method), e)
+            self._add_error(error)
+        finally:
+            with self.lock:
+                entry['wsdl'][xrdinfo.stringify(method[4:6])] = wsdl_hash
+                if error is not None:
+                    # Subsystem with a missing WSDL is queried again next time
+                    entry['ok'] = False
+                    entry['error'] = error
+                entry['pending'] -= 1
+                done = entry['pending'] == 0
+        if done:
+            self._store(subsystem, entry)
+
+    def _add_error(self, error):
+        with self.lock:
+            self.errors.append(error)
+
+    def _store(self, subsystem, entry):
+        entry.pop('pending', None)
+        self.cache.put(subsystem, entry)
+        with self.lock:
+            self.entries[subsystem] = entry
+
+    def _worker(self):
+        while True:
+            task = self.work_queue.get()
+            if task is None:
+                self.work_queue.task_done()
+                break
+            func, args = task
+            try:
+                func(*args)
+            except Exception as e:
+                self._add_error(u'{}'.format(e))
+            finally:
+                self.work_queue.task_done()
+
+    def crawl(self, shared_params):
+        """Refresh the catalog of all registered subsystems.
+        Return dict: subsystem tuple -> catalog entry with keys
+        'methods' (list of service tuples), 'wsdl' (dict
+        serviceCode/serviceVersion -> WSDL hash, see
+        CatalogCache.get_wsdl), 'ok' and 'error'.
+        """
+        version = content_hash(shared_params)
+        subsystem_servers = registered_subsystem_servers(shared_params)
+        now = time.time()
+        self.entries = {}
+        self.errors = []
+        self.work_queue = queue.Queue()
+        for subsystem, servers in sorted(subsystem_servers.items()):
+            cached = self.cache.get(subsystem)
+            if is_fresh(cached, servers, now, self.max_age):
+                if cached.get('sharedParamsVersion') != version:
+                    cached['sharedParamsVersion'] = version
+                    self.cache.put(subsystem, cached)
+                self.entries[subsystem] = cached
+                continue
+            entry = {'subsystem': list(subsystem), 'servers': servers, 'sharedParamsVersion': version,
+                     'fetched': now, 'ok': False, 'error': None, 'methods': [], 'wsdl': {}}
+            self.work_queue.put((self._fetch_methods, (subsystem, entry, cached)))
+
+        workers = []
+        for _ in range(self.threads):
+            worker = threading.Thread(target=self._worker)
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        # Tasks add WSDL tasks to the queue, workers are stopped only after all tasks are done
+        self.work_queue.join()
+        for _ in workers:
+            self.work_queue.put(None)
+        for worker in workers:
+            worker.join()
+        return self.entries
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Refresh catalog of methods and WSDLs of X-Road subsystems.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='Only subsystems that changed in shared-params, failed previously or are older '
+               'than max age are queried.\n'
+               'Prints methods as: xRoadInstance/memberClass/memberCode/subsystemCode/'
+               'serviceCode/serviceVersion'
+    )
+    parser.add_argument(
+        'url', metavar='SERVER_URL',
+        help='URL of local Security Server, for example: http://my-ss.domain.local')
+    parser.add_argument(
+        'client', metavar='CLIENT',
+        help='slash separated Client identifier, for example: INST/GOV/12345/SUBSYSTEM')
+    parser.add_argument(
+        '--cache', metavar='CACHE_DIR', help='cache directory', default='xrd_catalog_cache')
+    parser.add_argument(
+        '-t', metavar='TIMEOUT', help='timeout for HTTP query', type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument(
+        '--threads', metavar='THREADS', help='amount of threads to use', type=int,
+        default=DEFAULT_THREADS)
+    parser.add_argument(
+        '--max-age', metavar='SECONDS', help='query again entries older than this', type=int,
+        default=DEFAULT_MAX_AGE)
+    parser.add_argument(
+        '--rest', help='use allowedMethods instead of listMethods', action='store_true')
+    parser.add_argument('--no-wsdl', help='do not download WSDLs', action='store_true')
+    parser.add_argument(
+        '--verify', metavar='CERT_PATH',
+        help='validate peer TLS certificate using CA certificate file.')
+    parser.add_argument(
+        '--cert', metavar='CERT_PATH', help='use TLS certificate for HTTPS requests.')
+    parser.add_argument('--key', metavar='KEY_PATH', help='private key for TLS certificate.')
+    parser.add_argument(
+        '--instance', metavar='INSTANCE',
+        help='use this instance instead of local X-Road instance')
+    args = parser.parse_args()
+
+    client = args.client.decode('utf-8') if six.PY2 else args.client
+    client = tuple(client.split('/'))
+    instance = args.instance.decode('utf-8') if args.instance and six.PY2 else args.instance
+
+    verify = args.verify if args.verify else False
+    cert = (args.cert, args.key) if args.cert and args.key else None
+
+    try:
+        shared_params = xrdinfo.shared_params_ss(
+            addr=args.url, instance=instance, timeout=args.t, verify=verify, cert=cert)
+    except xrdinfo.XrdInfoError as e:
+        print_error(e)
+        exit(1)
+
+    crawler = CatalogCrawler(
+        args.url, client, CatalogCache(args.cache), threads=args.threads, max_age=args.max_age,
+        method='allowedMethods' if args.rest else 'listMethods', wsdl=not args.no_wsdl,
+        timeout=args.t, verify=verify, cert=cert)
+    try:
+        entries = crawler.crawl(shared_params)
+    except xrdinfo.XrdInfoError as e:
+        print_error(e)
+        exit(1)
+
+    for error in crawler.errors:
+        print_error(error)
+    for subsystem in sorted(entries):
+        for method in entries[subsystem]['methods']:
+            line = xrdinfo.stringify(method)
+            if six.PY2:
+                print(line.encode('utf-8'))
+            else:
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
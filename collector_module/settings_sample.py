@@ -18,6 +18,17 @@ MONGODB_USER = '{0}_{1}'.format(MODULE, INSTANCE)
 MONGODB_PWD = ""
 MONGODB_SERVER = ""
 MONGODB_SUFFIX = '{0}'.format(INSTANCE)
+# Write concern of raw_messages inserts and collector pointer updates, e.g. {'w': 'majority', 'j': True}
+MONGODB_WRITE_CONCERN = {'w': 1}
+# Write records of a page and the collector pointer in one transaction (requires MongoDB 4.0+ replica set):
+# a page is stored together with its pointer or not at all.
+# Without transactions the records are written before the pointer. A page written again after a failure or a crash
+# before the pointer update does not create duplicates with RAW_STORAGE "records", the _id of a record is built from
+# the server and its recordHash. With "chunks" the repeated records are skipped by the corrector as duplicates.
+MONGODB_TRANSACTIONS = False
+# Raw storage format of raw_messages: "records" stores every record as its own document, "chunks" stores every
+# fetched page as one compressed chunk document (requires corrector version reading chunks).
+RAW_STORAGE = "records"
 
 # --------------------------------------------------------
 # Module settings
@@ -32,6 +43,11 @@ SECURITY_SERVER_URL = ""
 # Timeout for SERVER_URL http requests.
 SECURITY_SERVER_TIMEOUT = 60.0
 
+# Servers that fail (timeout, http error, missing attachment, parse error) are skipped until their backoff expires.
+# Backoff (in seconds) after the first failure, doubled after every following failure up to SERVER_BACKOFF_MAX.
+SERVER_BACKOFF_BASE = 600
+SERVER_BACKOFF_MAX = 86400
+
 # Message header of Instance Monitoring Client
 # MEMBERCLASS is in {GOV, COM, NGO, NEE}
 # Sample: MEMBERCLASS = "GOV"
@@ -53,6 +69,19 @@ MONITORING_CLIENT = """        <xrd:client id:objectType="SUBSYSTEM">
 # Match THREAD_COUNT with number of cores * CPUs available to ensure best performance
 THREAD_COUNT = 4
 
+# Collector engine:
+# "pool" - servers are queried in rounds with THREAD_COUNT processes, every round waits for the slowest server
+# "asyncio" - every server runs its own fetch/insert loop, slow servers do not hold up the others
+# "scheduler" - servers with the largest backlog (per fetch time) are fetched first, until CYCLE_TIME_BUDGET is used
+COLLECTOR_ENGINE = "pool"
+# Maximum number of servers queried at the same time by the "asyncio" and "scheduler" engines
+ASYNC_CONCURRENCY = 32
+# Time (in seconds) after which the "scheduler" engine does not start new queries, the rest is left for the next run.
+# Should be smaller than the interval of collector runs.
+CYCLE_TIME_BUDGET = 3000
+# Maximum number of records returned by security server in one response (records-available-limit)
+SERVER_PAGE_RECORDS = 10000
+
 # Amount of history to ask in the first time (in seconds).
 # 1 min = 60 sec
 # 1h = 60 min = 3600 sec
@@ -76,6 +105,59 @@ REPEAT_MIN_RECORDS = 50
 # If this value is too low and script is executed rarely then some data may be lost.
 REPEAT_LIMIT = 100
 
+# Number of records inserted into MongoDB (or spool) at a time while the response attachment is streamed.
+# With RAW_STORAGE "records" this bounds the memory used by a worker regardless of the size of the response,
+# "chunks" keeps the compressed page in memory until it is written.
+INSERT_BATCH_SIZE = 1000
+
+# Backfill of servers lagging more than BACKFILL_MIN_LAG seconds (0 disables, not used together with the spool).
+# The lagging period is split into BACKFILL_CONCURRENCY sub-windows of at least BACKFILL_MIN_WINDOW seconds that are
+# fetched at the same time. No new pages are fetched after BACKFILL_TIME_BUDGET seconds, the next run continues.
+BACKFILL_MIN_LAG = 6 * 3600
+BACKFILL_CONCURRENCY = 4
+BACKFILL_MIN_WINDOW = 600
+BACKFILL_TIME_BUDGET = 600
+
+# Directory of the write-ahead spool. When set, fetched pages are written into compressed segment files there
+# instead of MongoDB, and "python3 -m collector_module.drain_spool" loads them into MongoDB.
+# Pages fetched while MongoDB is unavailable are kept in the spool and are not fetched again.
+# SPOOL_PATH = '{0}/{1}/spool/'.format(APPDIR, INSTANCE)
+SPOOL_PATH = None
+
+# Daemon mode (python3 -m collector_module.collector --daemon)
+# Servers due for a poll are collected every DAEMON_TICK seconds.
+DAEMON_TICK = 10
+# Every server is polled when about DAEMON_TARGET_RECORDS records are waiting, based on its traffic volume,
+# but not more often than DAEMON_MIN_INTERVAL and not less often than DAEMON_MAX_INTERVAL seconds.
+DAEMON_TARGET_RECORDS = 1000
+DAEMON_MIN_INTERVAL = 60
+DAEMON_MAX_INTERVAL = 1800
+
+# Sharding of the server list between several collector nodes of the same MONGODB_SUFFIX.
+# Every node collects only the servers it holds the lease of in collector_state.server_lease.
+# COLLECTOR_NODE_ID must be unique among the nodes, host name is used if not set.
+COLLECTOR_SHARDING = False
+COLLECTOR_NODE_ID = None
+# Heartbeat and leases of a stopped node expire after SHARD_LEASE_TTL seconds, then other nodes take over its servers.
+SHARD_LEASE_TTL = 120
+# A joining node waits SHARD_SETTLE_TIME seconds for the heartbeats of nodes started at the same time before taking leases
+SHARD_SETTLE_TIME = 10
+# A node run by cron stays a member for SHARD_MEMBERSHIP_TTL seconds after the run, longer than the cron interval.
+# The servers of a node that is no longer run are taken over by the other nodes after that.
+SHARD_MEMBERSHIP_TTL = 4 * 3600
+# Points of every node on the consistent hashing ring, more points give more even split
+SHARD_VIRTUAL_NODES = 64
+
+# --------------------------------------------------------
+# Configure metrics
+# --------------------------------------------------------
+# Prometheus text format file of the per-server collector metrics (e.g. for node_exporter textfile collector).
+# Set to None to disable.
+# METRICS_FILE = '{0}/{1}/metrics/collector.prom'.format(APPDIR, INSTANCE)
+METRICS_FILE = None
+# Number of collector cycles kept in collector_state.collector_metrics summary document, 0 disables the document.
+METRICS_SUMMARY_CYCLES = 96
+
 # --------------------------------------------------------
 # Configure logger
 # --------------------------------------------------------
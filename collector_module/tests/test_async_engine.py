@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+
+from collector_module.collectorlib.async_engine import AsyncCollectorEngine
+
+
+class TestAsyncCollectorEngine(unittest.TestCase):
+    def test_repeats_until_done(self):
+        calls = []
+
+        def prepare(item, repeat):
+            return {'server': item, 'repeat': repeat}
+
+        def worker(data):
+            calls.append((data['server'], data['repeat']))
+            # Server "a" fails, "b" finishes at once, "c" needs two more pages
+            if data['server'] == 'a':
+                return -1
+            if data['server'] == 'b':
+                return 0
+            return data['repeat'] - 1 if data['repeat'] > 8 else 0
+
+        engine = AsyncCollectorEngine(prepare, worker, 2, 10)
+        self.assertEqual(engine.run(['a', 'b', 'c']), [-1, 0, 0])
+        self.assertEqual(sorted(c for c in calls if c[0] == 'c'), [('c', 8), ('c', 9), ('c', 10)])
+
+    def test_slow_server_does_not_block_others(self):
+        finished = []
+        lock = threading.Lock()
+
+        def prepare(item, repeat):
+            return {'server': item, 'repeat': repeat}
+
+        def worker(data):
+            if data['server'] == 'slow':
+                time.sleep(0.5)
+                result = 0
+            else:
+                time.sleep(0.01)
+                result = data['repeat'] - 1
+            with lock:
+                finished.append(data['server'])
+            return result
+
+        engine = AsyncCollectorEngine(prepare, worker, 2, 5)
+        engine.run(['slow', 'fast'])
+        # All pages of the fast server are fetched while the slow server is still running
+        self.assertEqual(finished, ['fast'] * 5 + ['slow'])
+
+    def test_concurrency_limit(self):
+        active = [0, 0]
+        lock = threading.Lock()
+
+        def prepare(item, repeat):
+            return item
+
+        def worker(data):
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return 0
+
+        engine = AsyncCollectorEngine(prepare, worker, 3, 0)
+        engine.run(list(range(12)))
+        self.assertEqual(active[1], 3)
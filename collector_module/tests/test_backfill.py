@@ -0,0 +1,76 @@
+import threading
+import unittest
+
+from collector_module.collectorlib.backfill import BackfillTracker, add_range, get_gaps, is_backfill_pointer
+from collector_module.collectorlib.backfill import split_windows
+
+
+class FakeIngest:
+    def __init__(self):
+        self.commits = []
+
+    def commit(self, server_key, records_from, stats=None):
+        self.commits.append((server_key, records_from, stats))
+
+
+class TestBackfill(unittest.TestCase):
+    def test_add_range(self):
+        self.assertEqual(add_range(100, [], 200, 300), (100, [[200, 300]]))
+        self.assertEqual(add_range(100, [[200, 300]], 300, 400), (100, [[200, 400]]))
+        self.assertEqual(add_range(100, [[200, 400]], 100, 150), (150, [[200, 400]]))
+        self.assertEqual(add_range(150, [[200, 400]], 150, 200), (400, []))
+        self.assertEqual(add_range(150, [[200, 400], [500, 600]], 150, 250), (400, [[500, 600]]))
+
+    def test_get_gaps(self):
+        self.assertEqual(get_gaps(100, 1000, []), [[100, 1000]])
+        self.assertEqual(get_gaps(100, 1000, [[200, 300], [500, 1000]]), [[100, 200], [300, 500]])
+        self.assertEqual(get_gaps(100, 1000, [[100, 1000]]), [])
+
+    def test_split_windows(self):
+        self.assertEqual(split_windows([[0, 1000]], 4, 100), [[0, 250], [250, 500], [500, 750], [750, 1000]])
+        # Windows are not shorter than min_window
+        self.assertEqual(split_windows([[0, 300]], 4, 100), [[0, 150], [150, 300]])
+        self.assertEqual(split_windows([[0, 100], [500, 1000]], 3, 100), [[0, 100], [500, 750], [750, 1000]])
+        self.assertEqual(split_windows([], 4, 100), [])
+        # More gaps than count, the first gaps are fetched by this run
+        self.assertEqual(split_windows([[0, 100], [200, 300], [400, 500], [600, 700]], 2, 10), [[0, 100], [200, 300]])
+
+    def test_is_backfill_pointer(self):
+        self.assertTrue(is_backfill_pointer({'records_from': 0, 'backfill_to': 500}, 10000, 60, 3600))
+        self.assertTrue(is_backfill_pointer({'records_from': 0}, 10000, 60, 3600))
+        self.assertFalse(is_backfill_pointer({'records_from': 9000}, 10000, 60, 3600))
+        self.assertFalse(is_backfill_pointer({'records_from': 0}, 10000, 60, 0))
+
+    def test_tracker_pointer(self):
+        tracker = BackfillTracker.from_pointer({'records_from': 0}, 1000)
+        windows = tracker.get_windows(2, 100)
+        self.assertEqual(windows, [[0, 500], [500, 1000]])
+        ingest = FakeIngest()
+        tracker.commit(ingest, 'a', 500, 700, {'response_time': 1.0})
+        self.assertEqual(ingest.commits[-1], ('a', 0, {'response_time': 1.0, 'backfill_ranges': [[500, 700]],
+                                                       'backfill_to': 1000}))
+        tracker.commit(ingest, 'a', 0, 500)
+        self.assertEqual(ingest.commits[-1], ('a', 700, {'backfill_ranges': [], 'backfill_to': 1000}))
+        self.assertFalse(tracker.is_done())
+
+        # Interrupted backfill continues from the stored pointer
+        tracker = BackfillTracker.from_pointer({'records_from': 700, 'backfill_to': 1000, 'backfill_ranges': []}, 5000)
+        self.assertEqual(tracker.get_windows(2, 100), [[700, 850], [850, 1000]])
+        tracker.commit(ingest, 'a', 850, 1000)
+        tracker.commit(ingest, 'a', 700, 850)
+        self.assertEqual(ingest.commits[-1], ('a', 1000, {'backfill_ranges': [], 'backfill_to': None}))
+        self.assertTrue(tracker.is_done())
+
+    def test_concurrent_commits(self):
+        tracker = BackfillTracker(0, 1000)
+        ingest = FakeIngest()
+        threads = [threading.Thread(target=tracker.commit, args=(ingest, 'a', i * 10, (i + 1) * 10))
+                   for i in range(100)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Stored pointer never moves backwards
+        pointers = [records_from for _, records_from, _ in ingest.commits]
+        self.assertEqual(pointers, sorted(pointers))
+        self.assertEqual(pointers[-1], 1000)
@@ -0,0 +1,155 @@
+import gzip
+import json
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# External files are standalone scripts, imported from their own directory
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'external_files'))
+
+import collector_from_file  # noqa: E402
+
+
+def failing_reader(file_name, start_line, chunk_size):
+    raise RuntimeError('reader failed')
+
+
+class FakeAsyncResult:
+    def __init__(self, ready, error=None):
+        self._ready = ready
+        self.error = error
+
+    def ready(self):
+        return self._ready
+
+    def successful(self):
+        return self.error is None
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+
+
+class TestBoundedHashSet(unittest.TestCase):
+    def test_capacity(self):
+        hashes = collector_from_file.BoundedHashSet(2)
+        doc_hashes = ['1500000000_{0:032x}'.format(i) for i in range(3)]
+        self.assertTrue(hashes.add(doc_hashes[0]))
+        self.assertFalse(hashes.add(doc_hashes[0]))
+        self.assertTrue(hashes.add(doc_hashes[1]))
+        self.assertTrue(hashes.add(doc_hashes[2]))
+        # Oldest hash is dropped when the set is full
+        self.assertEqual(len(hashes.hashes), 2)
+        self.assertTrue(hashes.add(doc_hashes[0]))
+        self.assertFalse(hashes.add(doc_hashes[2]))
+
+    def test_same_hash_of_same_record(self):
+        hashes = collector_from_file.BoundedHashSet(10)
+        record = {'monitoringDataTs': 1500000000, 'messageId': 'a'}
+        self.assertTrue(hashes.add(collector_from_file.calculate_hash(record)))
+        stored = dict(record, _id='id', insertTime=1.0)
+        self.assertFalse(hashes.add(collector_from_file.calculate_hash(stored)))
+
+
+class TestLedger(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.ledger_file = os.path.join(self.tmp_dir, 'ledger.json')
+        self.log_file = os.path.join(self.tmp_dir, 'opmon.log')
+        with open(self.log_file, 'w') as f:
+            f.write('{}\n' * 10)
+
+    def test_resume(self):
+        ledger = collector_from_file.Ledger(self.ledger_file)
+        self.assertEqual(ledger.get_start_line(self.log_file), 0)
+        ledger.set_progress(self.log_file, 4)
+        ledger.save()
+
+        # Interrupted run continues from the stored line
+        ledger = collector_from_file.Ledger(self.ledger_file)
+        self.assertEqual(ledger.get_start_line(self.log_file), 4)
+        ledger.set_progress(self.log_file, 10, True)
+        with open(self.ledger_file) as f:
+            self.assertTrue(json.load(f)[self.log_file]['complete'])
+
+        # Complete file is skipped
+        ledger = collector_from_file.Ledger(self.ledger_file)
+        self.assertIsNone(ledger.get_start_line(self.log_file))
+
+    def test_changed_file_loaded_again(self):
+        ledger = collector_from_file.Ledger(self.ledger_file)
+        ledger.get_start_line(self.log_file)
+        ledger.set_progress(self.log_file, 10, True)
+        with open(self.log_file, 'a') as f:
+            f.write('{}\n')
+        ledger = collector_from_file.Ledger(self.ledger_file)
+        self.assertEqual(ledger.get_start_line(self.log_file), 0)
+
+
+class TestFileProgress(unittest.TestCase):
+    def test_chunks_out_of_order(self):
+        progress = collector_from_file.FileProgress(100)
+        self.assertFalse(progress.chunk_done(200, 300))
+        self.assertEqual(progress.done_line, 100)
+        self.assertTrue(progress.chunk_done(100, 200))
+        self.assertEqual(progress.done_line, 300)
+        self.assertFalse(progress.is_complete())
+        progress.end_line = 300
+        self.assertTrue(progress.is_complete())
+
+
+class TestCheckReaders(unittest.TestCase):
+    def test_failed_reader(self):
+        collector_from_file.check_readers([('a.log', FakeAsyncResult(False)), ('b.log', FakeAsyncResult(True))])
+        with self.assertRaises(MemoryError):
+            collector_from_file.check_readers([('a.log', FakeAsyncResult(False)),
+                                               ('b.log', FakeAsyncResult(True, MemoryError()))])
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Patched reader is inherited by forked pool processes only')
+    def test_failed_reader_fails_run(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        log_file = os.path.join(tmp_dir, 'opmon.log')
+        with open(log_file, 'w') as f:
+            f.write('{}\n')
+        with mock.patch.object(collector_from_file, 'read_file', failing_reader), \
+                mock.patch.object(collector_from_file, 'READER_CHECK_INTERVAL', 0.1), \
+                mock.patch.object(collector_from_file.pymongo, 'MongoClient'):
+            with self.assertRaises(RuntimeError):
+                collector_from_file.process_files([log_file], 'query_db_test', 'user', 'pwd', 'localhost', 'auth_db',
+                                                  workers=1, ledger_file=os.path.join(tmp_dir, 'ledger.json'))
+
+
+class TestReadFile(unittest.TestCase):
+    def test_read_error_records_progress(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        file_name = os.path.join(tmp_dir, 'opmon.log.gz')
+        with gzip.open(file_name, 'wt') as f:
+            for i in range(10000):
+                f.write(json.dumps({'monitoringDataTs': 1500000000 + i, 'messageId': str(i)}) + '\n')
+        # Truncated file fails after some of its lines are read
+        with open(file_name, 'rb') as f:
+            data = f.read()
+        with open(file_name, 'wb') as f:
+            f.write(data[:len(data) // 2])
+
+        chunk_queue = queue.Queue()
+        collector_from_file.init_reader(chunk_queue)
+        collector_from_file.read_file(file_name, 0, 1000)
+        items = []
+        while not chunk_queue.empty():
+            items.append(chunk_queue.get())
+        self.assertEqual(items[-1], (file_name, None, None, None, 0))
+        chunks = items[:-1]
+        # Every chunk covers exactly its records, so the ledger advances over all stored records
+        self.assertEqual([chunk[1] for chunk in chunks], [0] + [chunk[2] for chunk in chunks[:-1]])
+        for _, first_line, end_line, records, _ in chunks:
+            self.assertEqual(len(records), end_line - first_line)
+        self.assertGreater(chunks[-1][2], 0)
+        self.assertLess(chunks[-1][2], 10000)
@@ -0,0 +1,71 @@
+import threading
+import unittest
+
+import requests
+
+from collector_module.benchmark.fake_security_server import FakeSecurityServer, get_records
+from collector_module.collectorlib.database_manager import DatabaseManager
+from collector_module.collectorlib.operational_data_reader import OperationalDataReader
+
+PROFILE = {'records_per_second': 2.0, 'page_records': 10, 'latency': 0.0, 'failure_rate': 0.0}
+
+
+class TestGetRecords(unittest.TestCase):
+    def test_range(self):
+        records, next_records_from = get_records('ss', PROFILE, 100, 103)
+        self.assertEqual([r['monitoringDataTs'] for r in records], [100, 100, 101, 101, 102, 102, 103, 103])
+        self.assertIsNone(next_records_from)
+
+    def test_paging(self):
+        records, next_records_from = get_records('ss', PROFILE, 100, 199)
+        self.assertEqual(len(records), 10)
+        self.assertEqual(next_records_from, 105)
+        records, _ = get_records('ss', PROFILE, next_records_from, 199)
+        self.assertEqual(records[0]['monitoringDataTs'], 105)
+
+    def test_many_records_per_second(self):
+        profile = dict(PROFILE, records_per_second=100.0)
+        records, next_records_from = get_records('ss', profile, 100, 199)
+        self.assertEqual(next_records_from, 101)
+        self.assertEqual(len(records), 100)
+
+    def test_pages_do_not_overlap(self):
+        profile = dict(PROFILE, records_per_second=3.0)
+        message_ids = []
+        records_from = 100
+        while records_from is not None:
+            records, records_from = get_records('ss', profile, records_from, 199)
+            message_ids.extend(r['messageId'] for r in records)
+        self.assertEqual(len(message_ids), 300)
+        self.assertEqual(len(set(message_ids)), 300)
+
+
+class TestFakeSecurityServer(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSecurityServer(('127.0.0.1', 0), PROFILE, {'ss-down': {'failure_rate': 1.0}})
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def query(self, server_code, records_from, records_to):
+        body = DatabaseManager.get_soap_body('', 'BENCH', 'GOV', 'member', server_code, 'id', records_from, records_to)
+        return requests.post(self.server.url, data=body, headers={"Content-type": "text/xml;charset=UTF-8"})
+
+    def test_response_readable_by_collector(self):
+        response = self.query('ss-1', 100, 199)
+        self.assertEqual(response.status_code, 200)
+        reader = OperationalDataReader([response.content], response.headers['content-type'])
+        records = [r for batch in reader.iter_records(100) for r in batch]
+        self.assertEqual(len(records), 10)
+        self.assertEqual(reader.next_records_from, 105)
+        self.assertEqual(self.server.get_stats()['records'], 10)
+
+    def test_failure(self):
+        self.assertEqual(self.query('ss-down', 100, 199).status_code, 500)
+        stats = requests.get(self.server.url + 'stats?reset=1').json()
+        self.assertEqual((stats['requests'], stats['failures']), (1, 1))
+        self.assertEqual(self.server.get_stats()['requests'], 0)
@@ -0,0 +1,272 @@
+import unittest
+from unittest import mock
+
+from pymongo.errors import BulkWriteError
+
+from collector_module.collectorlib.database_manager import DatabaseManager, IngestSession, LeaseLostError
+from collector_module.collectorlib.database_manager import RAW_STORAGE_CHUNKS, RAW_STORAGE_RECORDS
+
+
+class FakeResult:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+
+class FakeCollection:
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log
+        self.documents = []
+
+    def insert_many(self, documents, ordered=True, session=None):
+        self.log.append(('insert_many', self.name, session))
+        ids = set(doc['_id'] for doc in self.documents if '_id' in doc)
+        errors = []
+        for index, document in enumerate(documents):
+            if document.get('_id') in ids:
+                errors.append({'index': index, 'code': 11000, 'errmsg': 'duplicate key'})
+                if ordered:
+                    break
+                continue
+            if '_id' in document:
+                ids.add(document['_id'])
+            self.documents.append(document)
+        if errors:
+            raise BulkWriteError({'writeErrors': errors})
+
+    def find_one(self, query, projection=None, session=None):
+        self.log.append(('find_one', self.name, session))
+        matched = [doc for doc in self.documents if all(doc.get(k) == v for k, v in query.items())]
+        return matched[0] if matched else None
+
+    def update_one(self, query, update, upsert=False, session=None):
+        self.log.append(('update_one', self.name, session))
+        matched = [doc for doc in self.documents if all(doc.get(k) == v for k, v in query.items())]
+        if matched:
+            matched[0].update(update['$set'])
+        elif upsert:
+            document = dict(query)
+            document.update(update['$set'])
+            self.documents.append(document)
+        return FakeResult(len(matched))
+
+
+class FakeDatabase:
+    def __init__(self, client):
+        self.client = client
+
+    def get_collection(self, name, write_concern=None):
+        return self.client.collections[name]
+
+
+class FakeSession:
+    def __init__(self, log):
+        self.log = log
+
+    def start_transaction(self, write_concern=None):
+        self.log.append(('start_transaction',))
+
+    def commit_transaction(self):
+        self.log.append(('commit_transaction',))
+
+    def abort_transaction(self):
+        self.log.append(('abort_transaction',))
+
+    def end_session(self):
+        self.log.append(('end_session',))
+
+
+class FakeClient:
+    def __init__(self):
+        self.log = []
+        self.collections = dict((name, FakeCollection(name, self.log))
+                                for name in ('raw_messages', 'collector_pointer'))
+
+    def __getitem__(self, name):
+        return FakeDatabase(self)
+
+    def start_session(self):
+        return FakeSession(self.log)
+
+
+class FakeLogger:
+    def log_error(self, activity, msg):
+        pass
+
+
+class FakeDatabaseManager:
+    def __init__(self, use_transactions=False, node_id=None, raw_storage=RAW_STORAGE_RECORDS):
+        self.client = FakeClient()
+        self.write_concern = None
+        self.logger_m = FakeLogger()
+        self.db_name = 'query_db_test'
+        self.db_collector_state = 'collector_state_test'
+        self.use_transactions = use_transactions
+        self.node_id = node_id
+        self.raw_storage = raw_storage
+
+    def get_client(self):
+        return self.client
+
+
+SERVER = 'EE/GOV/1/ss1/ss1'
+
+
+def get_records(count, start=0):
+    return [{'monitoringDataTs': 1500000000 + i, 'messageId': 'm{0}'.format(i), 'requestInTs': 1000 * i}
+            for i in range(start, start + count)]
+
+
+class TestIngestSession(unittest.TestCase):
+    def setUp(self):
+        self.db_m = FakeDatabaseManager()
+        self.raw = self.db_m.client.collections['raw_messages']
+        self.pointer = self.db_m.client.collections['collector_pointer']
+
+    def test_batches_written_while_page_is_read(self):
+        ingest = IngestSession(self.db_m, SERVER)
+        ingest.insert(get_records(2))
+        self.assertEqual([doc['messageId'] for doc in self.raw.documents], ['m0', 'm1'])
+        ingest.insert(get_records(2, start=2))
+        ingest.commit(SERVER, 1500000004, {'lastSuccess': 1})
+        self.assertEqual([doc['messageId'] for doc in self.raw.documents], ['m0', 'm1', 'm2', 'm3'])
+        self.assertTrue(all('insertTime' in doc for doc in self.raw.documents))
+        self.assertEqual([doc['_id'] for doc in self.raw.documents],
+                         ['{0}/{1}'.format(SERVER, doc['recordHash']) for doc in self.raw.documents])
+        self.assertEqual(self.pointer.documents, [{'server': SERVER, 'records_from': 1500000004, 'lastSuccess': 1}])
+        # Records first, pointer last
+        self.assertEqual([entry[0:2] for entry in self.db_m.client.log],
+                         [('insert_many', 'raw_messages'), ('insert_many', 'raw_messages'),
+                          ('update_one', 'collector_pointer')])
+
+    def test_failed_page_written_again(self):
+        ingest = IngestSession(self.db_m, SERVER)
+        ingest.insert(get_records(2))
+        # Page failed while it was read
+        ingest.abort()
+        self.assertEqual(len(self.raw.documents), 2)
+        self.assertEqual(self.pointer.documents, [])
+
+        # Next run reads the page again, every record is stored once
+        ingest = IngestSession(self.db_m, SERVER)
+        ingest.insert(get_records(2))
+        ingest.insert(get_records(1, start=2))
+        ingest.commit(SERVER, 1500000003)
+        self.assertEqual([doc['messageId'] for doc in self.raw.documents], ['m0', 'm1', 'm2'])
+
+    def test_crash_before_pointer_update(self):
+        ingest = IngestSession(self.db_m, SERVER)
+        ingest.insert(get_records(2))
+        with mock.patch.object(self.pointer, 'update_one', side_effect=IOError('connection lost')):
+            with self.assertRaises(IOError):
+                ingest.commit(SERVER, 1500000002)
+        self.assertEqual(self.pointer.documents, [])
+
+        # Page is fetched again from the old pointer
+        ingest = IngestSession(self.db_m, SERVER)
+        ingest.insert(get_records(3))
+        ingest.commit(SERVER, 1500000003)
+        self.assertEqual([doc['messageId'] for doc in self.raw.documents], ['m0', 'm1', 'm2'])
+        self.assertEqual(self.pointer.documents[0]['records_from'], 1500000003)
+
+    def test_write_error_raised(self):
+        ingest = IngestSession(self.db_m, SERVER)
+        error = BulkWriteError({'writeErrors': [{'index': 0, 'code': 121, 'errmsg': 'validation failed'}]})
+        with mock.patch.object(self.raw, 'insert_many', side_effect=error):
+            with self.assertRaises(BulkWriteError):
+                ingest.insert(get_records(1))
+
+    def test_transaction_commit(self):
+        db_m = FakeDatabaseManager(use_transactions=True)
+        ingest = IngestSession(db_m, SERVER)
+        ingest.insert(get_records(2))
+        ingest.insert(get_records(1, start=2))
+        ingest.commit(SERVER, 1500000003)
+        log = db_m.client.log
+        # Batches are inserted while the page is read, all writes are in the transaction
+        self.assertEqual([entry[0:2] for entry in log],
+                         [('start_transaction',), ('insert_many', 'raw_messages'), ('insert_many', 'raw_messages'),
+                          ('update_one', 'collector_pointer'), ('commit_transaction',), ('end_session',)])
+        self.assertTrue(all(entry[2] is not None for entry in log if len(entry) == 3))
+
+    def test_transaction_abort(self):
+        db_m = FakeDatabaseManager(use_transactions=True)
+        ingest = IngestSession(db_m, SERVER)
+        ingest.insert(get_records(2))
+        ingest.abort()
+        self.assertEqual([entry[0:2] for entry in db_m.client.log],
+                         [('start_transaction',), ('insert_many', 'raw_messages'), ('abort_transaction',),
+                          ('end_session',)])
+
+    def test_lease_lost(self):
+        db_m = FakeDatabaseManager(node_id='node1')
+        pointer = db_m.client.collections['collector_pointer']
+        raw = db_m.client.collections['raw_messages']
+        pointer.documents.append({'server': SERVER, 'records_from': 1, 'leaseNode': 'node1'})
+        ingest = IngestSession(db_m, SERVER)
+        ingest.insert(get_records(1))
+        ingest.commit(SERVER, 1500000001)
+        self.assertEqual(pointer.documents[0]['records_from'], 1500000001)
+
+        # Lease taken over by another node while the page is read
+        ingest = IngestSession(db_m, SERVER)
+        ingest.insert(get_records(1, start=1))
+        pointer.documents[0]['leaseNode'] = 'node2'
+        with self.assertRaises(LeaseLostError):
+            ingest.insert(get_records(1, start=2))
+        ingest.abort()
+        with self.assertRaises(LeaseLostError):
+            IngestSession(db_m, SERVER).commit(SERVER, 1500000003)
+        self.assertEqual(pointer.documents[0]['records_from'], 1500000001)
+        # Records after the lease moved are not written
+        self.assertEqual([doc['messageId'] for doc in raw.documents], ['m0', 'm1'])
+
+    def test_lease_lost_before_chunks(self):
+        db_m = FakeDatabaseManager(node_id='node1', raw_storage=RAW_STORAGE_CHUNKS)
+        db_m.client.collections['collector_pointer'].documents.append(
+            {'server': SERVER, 'records_from': 1, 'leaseNode': 'node2'})
+        ingest = IngestSession(db_m, SERVER)
+        ingest.insert(get_records(2))
+        with self.assertRaises(LeaseLostError):
+            ingest.commit(SERVER, 1500000002)
+        self.assertEqual(db_m.client.collections['raw_messages'].documents, [])
+
+    def test_lease_lost_in_transaction(self):
+        db_m = FakeDatabaseManager(use_transactions=True, node_id='node1')
+        db_m.client.collections['collector_pointer'].documents.append(
+            {'server': SERVER, 'records_from': 1, 'leaseNode': 'node2'})
+        ingest = IngestSession(db_m, SERVER)
+        ingest.insert(get_records(1))
+        with self.assertRaises(LeaseLostError):
+            ingest.commit(SERVER, 1500000001)
+        self.assertEqual([entry[0] for entry in db_m.client.log][-3:],
+                         ['update_one', 'abort_transaction', 'end_session'])
+        self.assertNotIn(('commit_transaction',), db_m.client.log)
+
+    def test_chunks(self):
+        db_m = FakeDatabaseManager(raw_storage=RAW_STORAGE_CHUNKS)
+        raw = db_m.client.collections['raw_messages']
+        ingest = IngestSession(db_m, SERVER)
+        ingest.insert(get_records(3))
+        ingest.abort()
+        self.assertEqual(raw.documents, [])
+
+        ingest = IngestSession(db_m, SERVER)
+        ingest.insert(get_records(3))
+        ingest.commit(SERVER, 1500000003)
+        self.assertEqual(len(raw.documents), 1)
+        self.assertEqual(raw.documents[0]['recordCount'], 3)
+        self.assertEqual(raw.documents[0]['server'], SERVER)
+
+
+class TestReleaseServerLeases(unittest.TestCase):
+    def test_lease_node_removed_from_pointers(self):
+        server_m = DatabaseManager('test', 'localhost', 'user', 'pwd', FakeLogger(), node_id='node1')
+        client = mock.MagicMock()
+        with mock.patch.object(server_m, 'get_client', return_value=client):
+            server_m.release_server_leases('node1', [SERVER])
+            server_m.release_server_leases('node1')
+        collection = client['collector_state_test']['collector_pointer']
+        self.assertEqual(collection.update_many.call_args_list,
+                         [mock.call({'leaseNode': 'node1', 'server': {'$in': [SERVER]}}, {'$unset': {'leaseNode': ''}}),
+                          mock.call({'leaseNode': 'node1'}, {'$unset': {'leaseNode': ''}})])
@@ -0,0 +1,67 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from collector_module.collectorlib.metrics import CollectorMetrics, Histogram, HTTP_LATENCY, PAGE_RECORDS, POINTER_LAG
+
+
+class TestHistogram(unittest.TestCase):
+    def test_observe_and_quantile(self):
+        histogram = Histogram((1, 10, 100))
+        for value in (0.5, 5, 5, 50, 500):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.sum, 560.5)
+        self.assertEqual(histogram.quantile(0.5), 10)
+        self.assertIsNone(histogram.quantile(1.0))
+
+
+class TestCollectorMetrics(unittest.TestCase):
+    def test_merge_worker_metrics(self):
+        metrics = CollectorMetrics()
+        metrics.observe(PAGE_RECORDS, 'a', 100)
+        worker = CollectorMetrics()
+        worker.observe(PAGE_RECORDS, 'a', 200)
+        worker.observe(PAGE_RECORDS, 'b', 10)
+        worker.count_failure('b', 'timeout')
+        # Pool workers return their metrics pickled
+        metrics.merge(pickle.loads(pickle.dumps(worker.drain())))
+        self.assertEqual(metrics.histograms[PAGE_RECORDS]['a'].count, 2)
+        self.assertEqual(metrics.histograms[PAGE_RECORDS]['b'].sum, 10)
+        self.assertEqual(metrics.failures, {'b': {'timeout': 1}})
+        self.assertEqual(worker.histograms[PAGE_RECORDS], {})
+
+    def test_prometheus(self):
+        metrics = CollectorMetrics()
+        metrics.observe(HTTP_LATENCY, 'EE/GOV/"1"/ss', 0.3)
+        metrics.set_gauge(POINTER_LAG, 'EE/GOV/"1"/ss', 120)
+        metrics.count_failure('EE/GOV/"1"/ss', 'timeout')
+        text = metrics.to_prometheus({'seconds': 12.5})
+        self.assertIn('# TYPE xroad_collector_http_latency_seconds histogram', text)
+        self.assertIn('xroad_collector_http_latency_seconds_bucket{server="EE/GOV/\\"1\\"/ss",le="0.25"} 0', text)
+        self.assertIn('xroad_collector_http_latency_seconds_bucket{server="EE/GOV/\\"1\\"/ss",le="0.5"} 1', text)
+        self.assertIn('xroad_collector_http_latency_seconds_count{server="EE/GOV/\\"1\\"/ss"} 1', text)
+        self.assertIn('xroad_collector_pointer_lag_seconds{server="EE/GOV/\\"1\\"/ss"} 120.0', text)
+        self.assertIn('xroad_collector_failures_total{server="EE/GOV/\\"1\\"/ss",class="timeout"} 1', text)
+        self.assertIn('xroad_collector_cycle_seconds 12.5', text)
+        path = tempfile.mkdtemp()
+        try:
+            file_name = os.path.join(path, 'collector.prom')
+            metrics.write_prometheus(file_name)
+            self.assertEqual(os.listdir(path), ['collector.prom'])
+        finally:
+            shutil.rmtree(path)
+
+    def test_summary(self):
+        metrics = CollectorMetrics()
+        metrics.observe(PAGE_RECORDS, 'a', 100)
+        metrics.observe(PAGE_RECORDS, 'a', 300)
+        metrics.set_gauge(POINTER_LAG, 'a', 60)
+        summary = metrics.get_summary()
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]['server'], 'a')
+        self.assertEqual(summary[0][PAGE_RECORDS]['avg'], 200)
+        self.assertEqual(summary[0][POINTER_LAG], 60)
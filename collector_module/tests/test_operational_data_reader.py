@@ -0,0 +1,87 @@
+import gzip
+import json
+import unittest
+
+from collector_module.collectorlib.operational_data_reader import OperationalDataError
+from collector_module.collectorlib.operational_data_reader import OperationalDataReader
+
+BOUNDARY = b'xroadA1b2C3d4'
+SOAP = b'<SOAP-ENV:Envelope><om:nextRecordsFrom>1500000123</om:nextRecordsFrom></SOAP-ENV:Envelope>'
+
+
+def build_response(records, soap=SOAP, attachment=None):
+    if attachment is None:
+        attachment = gzip.compress(json.dumps({'records': records}).encode('utf-8'))
+    return (b'--' + BOUNDARY + b'\r\n'
+            b'content-type: text/xml; charset=UTF-8\r\n\r\n' + soap + b'\r\n'
+            b'--' + BOUNDARY + b'\r\n'
+            b'content-type: application/gzip\r\n'
+            b'content-transfer-encoding: binary\r\n'
+            b'content-id: <operational-monitoring-data.json.gz>\r\n\r\n' + attachment + b'\r\n'
+            b'--' + BOUNDARY + b'--\r\n')
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def read_all(reader, batch_size=1000):
+    batches = list(reader.iter_records(batch_size))
+    return batches, [r for b in batches for r in b]
+
+
+class TestOperationalDataReader(unittest.TestCase):
+    def setUp(self):
+        self.records = [{'messageId': 'id-{0}'.format(i), 'monitoringDataTs': 1500000000 + i,
+                         'soapFaultString': 'brace } and "quote" {', 'text': 'õäöü'} for i in range(300)]
+
+    def test_records_in_any_chunk_size(self):
+        response = build_response(self.records)
+        for size in (1, 7, 64, 4096, len(response)):
+            reader = OperationalDataReader(split(response, size))
+            batches, records = read_all(reader, 100)
+            self.assertEqual(records, self.records)
+            self.assertEqual([len(b) for b in batches], [100, 100, 100])
+            self.assertTrue(reader.attachment_found)
+            self.assertEqual(reader.next_records_from, 1500000123)
+            self.assertEqual(reader.record_count, 300)
+            self.assertEqual(reader.response_bytes, len(response))
+
+    def test_boundary_from_content_type(self):
+        response = build_response(self.records)
+        content_type = 'multipart/related; type="text/xml"; boundary={0}'.format(BOUNDARY.decode('ascii'))
+        reader = OperationalDataReader(split(response, 13), content_type)
+        self.assertEqual(read_all(reader)[1], self.records)
+
+    def test_no_next_records_from(self):
+        reader = OperationalDataReader([build_response(self.records, soap=b'<SOAP-ENV:Envelope/>')])
+        self.assertEqual(len(read_all(reader)[1]), 300)
+        self.assertIsNone(reader.next_records_from)
+
+    def test_empty_records(self):
+        reader = OperationalDataReader([build_response([])])
+        self.assertEqual(read_all(reader), ([], []))
+        self.assertTrue(reader.attachment_found)
+
+    def test_no_attachment(self):
+        fault = b'<SOAP-ENV:Envelope><SOAP-ENV:Fault>error</SOAP-ENV:Fault></SOAP-ENV:Envelope>'
+        reader = OperationalDataReader(split(fault, 10), 'text/xml;charset=UTF-8')
+        self.assertEqual(read_all(reader), ([], []))
+        self.assertFalse(reader.attachment_found)
+
+    def test_broken_attachment(self):
+        reader = OperationalDataReader([build_response([], attachment=b'not gzip data')])
+        with self.assertRaises(OperationalDataError):
+            read_all(reader)
+
+    def test_truncated_json(self):
+        attachment = gzip.compress(json.dumps({'records': self.records}).encode('utf-8')[:-50])
+        reader = OperationalDataReader(split(build_response([], attachment=attachment), 100))
+        with self.assertRaises(OperationalDataError):
+            read_all(reader)
+
+    def test_truncated_response(self):
+        response = build_response(self.records)
+        reader = OperationalDataReader(split(response[:len(response) // 2], 100))
+        with self.assertRaises(OperationalDataError):
+            read_all(reader)
@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# External files are standalone scripts, imported from their own directory
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'external_files'))
+
+import collector_from_file  # noqa: E402
+import opmon_segments  # noqa: E402
+
+# 2017-07-14T02:00:00Z
+SEGMENT_START = 1500000000 - 1500000000 % 3600
+
+
+def read_segment(file_name):
+    with collector_from_file.open_file(file_name) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestSegments(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.writer = opmon_segments.SegmentWriter(self.path, 3600, 'gzip', 'run1')
+        self.segment_dir = os.path.join(self.path, '2017', '07', '14')
+
+    def test_write_segments(self):
+        records = [{'monitoringDataTs': SEGMENT_START + i * 1800, 'messageId': str(i)} for i in range(3)]
+        self.writer.write('ss1', 'EE/GOV/1/ss1', records[0:1])
+        # Next page is appended to the same segment, records of the next hour start a new segment
+        self.writer.write('ss1', 'EE/GOV/1/ss1', records[1:3])
+        first = os.path.join(self.segment_dir, 'ss1.20170714T020000.run1')
+        second = os.path.join(self.segment_dir, 'ss1.20170714T030000.run1')
+        self.assertEqual(sorted(os.listdir(self.segment_dir)),
+                         sorted(os.path.basename(name) + extension for name in (first, second)
+                                for extension in ('.json.gz', '.idx.json')))
+        self.assertEqual(read_segment(first + '.json.gz'), records[0:2])
+        self.assertEqual(read_segment(second + '.json.gz'), records[2:3])
+        with open(first + '.idx.json') as f:
+            index = json.load(f)
+        self.assertEqual(index, {'server': 'EE/GOV/1/ss1', 'file': 'ss1.20170714T020000.run1.json.gz',
+                                 'compression': 'gzip', 'segmentStart': SEGMENT_START,
+                                 'segmentEnd': SEGMENT_START + 3600, 'minMonitoringDataTs': SEGMENT_START,
+                                 'maxMonitoringDataTs': SEGMENT_START + 1800, 'records': 2})
+
+    def test_select_files(self):
+        self.writer.write('ss1', 'EE/GOV/1/ss1', [{'monitoringDataTs': SEGMENT_START + 10}])
+        self.writer.write('ss1', 'EE/GOV/1/ss1', [{'monitoringDataTs': SEGMENT_START + 3610}])
+        first = os.path.join(self.segment_dir, 'ss1.20170714T020000.run1.json.gz')
+        second = os.path.join(self.segment_dir, 'ss1.20170714T030000.run1.json.gz')
+        log_file = os.path.join(self.path, 'opmon.log')
+        file_list = sorted(os.path.join(self.segment_dir, name) for name in os.listdir(self.segment_dir))
+        file_list.append(log_file)
+
+        # Index files are skipped, files without index are always loaded
+        self.assertEqual(collector_from_file.select_files(file_list), [first, second, log_file])
+        self.assertEqual(collector_from_file.select_files(file_list, records_from=SEGMENT_START + 11),
+                         [second, log_file])
+        self.assertEqual(collector_from_file.select_files(file_list, records_to=SEGMENT_START + 3609),
+                         [first, log_file])
+        self.assertEqual(collector_from_file.select_files(file_list, SEGMENT_START + 10, SEGMENT_START + 3610),
+                         [first, second, log_file])
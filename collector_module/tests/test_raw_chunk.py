@@ -0,0 +1,23 @@
+import json
+import unittest
+import zlib
+
+from collector_module.collectorlib.database_manager import CHUNK_FORMAT, RawChunk
+
+
+class TestRawChunk(unittest.TestCase):
+    def test_chunk_document(self):
+        records = [{'messageId': 'a', 'requestInTs': 2000, 'monitoringDataTs': 2},
+                   {'messageId': 'b', 'requestInTs': None, 'monitoringDataTs': 1},
+                   {'messageId': 'c', 'requestInTs': 1000, 'monitoringDataTs': 3}]
+        chunk = RawChunk()
+        for record in records:
+            chunk.add(record)
+        document = chunk.get_document('EE/GOV/1/ss1/ss1', 1500000000.0)
+        self.assertEqual(document['chunkFormat'], CHUNK_FORMAT)
+        self.assertEqual(document['server'], 'EE/GOV/1/ss1/ss1')
+        self.assertEqual(document['recordCount'], 3)
+        self.assertEqual((document['requestInTs'], document['requestInTsTo']), (1000, 2000))
+        self.assertEqual((document['monitoringDataTsFrom'], document['monitoringDataTsTo']), (1, 3))
+        lines = zlib.decompress(document['records']).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], records)
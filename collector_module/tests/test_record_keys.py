@@ -0,0 +1,39 @@
+import collections
+import hashlib
+import unittest
+
+from collector_module.collectorlib.record_keys import MUST_FIELDS, RECORD_HASH_VERSION, add_record_keys
+from collector_module.collectorlib.record_keys import calculate_record_hash, get_service_call_key
+
+
+def get_record(message_id='a'):
+    return {'monitoringDataTs': 1500000000, 'securityServerType': 'Client', 'messageId': message_id,
+            'clientXRoadInstance': 'EE', 'clientMemberClass': 'GOV', 'clientMemberCode': '1',
+            'clientSubsystemCode': 'sub', 'serviceXRoadInstance': 'EE', 'serviceMemberClass': 'COM',
+            'serviceMemberCode': '2', 'serviceSubsystemCode': None, 'serviceCode': 'getData',
+            'serviceVersion': 'v1', 'requestSoapSize': 1000, 'succeeded': True}
+
+
+class TestRecordKeys(unittest.TestCase):
+    def test_hash_equals_corrector_hash(self):
+        record = get_record()
+        # Hash of the corrector: str() of the sorted OrderedDict after adding the must fields
+        document = dict((f, None) for f in MUST_FIELDS)
+        document.update(record)
+        expected = hashlib.md5(str(collections.OrderedDict(sorted(document.items()))).encode('utf-8')).hexdigest()
+        self.assertEqual(calculate_record_hash(record), '1500000000_{0}'.format(expected))
+
+    def test_hash_excludes_stored_fields(self):
+        record = get_record()
+        record_hash = calculate_record_hash(record)
+        add_record_keys(record)
+        record['_id'] = 'id'
+        record['insertTime'] = 1500000100
+        self.assertEqual(calculate_record_hash(record), record_hash)
+        self.assertNotEqual(calculate_record_hash(get_record('b')), record_hash)
+
+    def test_add_record_keys(self):
+        record = add_record_keys(get_record())
+        self.assertEqual(record['recordHashVersion'], RECORD_HASH_VERSION)
+        self.assertEqual(record['serviceCallKey'], 'GOV/1/EE/sub/getData/v1/COM/2/EE/')
+        self.assertEqual(get_service_call_key({}), '/' * 9)
@@ -0,0 +1,94 @@
+import unittest
+
+from collector_module.collectorlib.async_engine import ScheduledCollectorEngine
+from collector_module.collectorlib.scheduler import BacklogScheduler, get_poll_interval, is_poll_due, update_server_stats
+
+
+class TestUpdateServerStats(unittest.TestCase):
+    def test_first_observation(self):
+        stats = update_server_stats(None, 1000, 100, 2.0)
+        self.assertEqual(stats, {'records_per_second': 10.0, 'response_time': 2.0})
+
+    def test_moving_average(self):
+        stats = update_server_stats({'records_per_second': 10.0, 'response_time': 2.0}, 2000, 100, 4.0, alpha=0.5)
+        self.assertEqual(stats, {'records_per_second': 15.0, 'response_time': 3.0})
+
+    def test_empty_span_keeps_rate(self):
+        stats = update_server_stats({'records_per_second': 10.0, 'response_time': 2.0}, 0, 0, 2.0)
+        self.assertEqual(stats['records_per_second'], 10.0)
+
+
+class TestPollCadence(unittest.TestCase):
+    def test_interval_by_traffic(self):
+        # Busy server is polled at the minimum interval, quiet one at the maximum
+        self.assertEqual(get_poll_interval({'records_per_second': 100.0}, 1000, 60, 1800), 60)
+        self.assertEqual(get_poll_interval({'records_per_second': 0.01}, 1000, 60, 1800), 1800)
+        self.assertEqual(get_poll_interval({'records_per_second': 2.0}, 1000, 60, 1800), 500)
+        self.assertEqual(get_poll_interval({'records_per_second': 0.0}, 1000, 60, 1800), 1800)
+        self.assertEqual(get_poll_interval(None, 1000, 60, 1800), 60)
+
+    def test_due(self):
+        self.assertFalse(is_poll_due(1000, 1100 + 59, 100, 60))
+        self.assertTrue(is_poll_due(1000, 1100 + 60, 100, 60))
+
+
+class TestBacklogScheduler(unittest.TestCase):
+    def test_order_by_lag_removed_per_second(self):
+        scheduler = BacklogScheduler(page_records=10000, default_response_time=1.0)
+        # Busy server: one page covers only 100 seconds of lag
+        scheduler.add('busy', 'busy', 86400, {'records_per_second': 100.0, 'response_time': 1.0})
+        # Quiet server: one page removes the whole day of lag
+        scheduler.add('quiet', 'quiet', 86400, {'records_per_second': 0.01, 'response_time': 1.0})
+        # Slow server: same as quiet, but ten times slower to fetch
+        scheduler.add('slow', 'slow', 86400, {'records_per_second': 0.01, 'response_time': 10.0})
+        order = []
+        while True:
+            picked = scheduler.next_server()
+            if picked is None:
+                break
+            order.append(picked[0])
+            scheduler.complete(picked[0], False)
+        self.assertEqual(order, ['quiet', 'slow', 'busy'])
+
+    def test_in_flight_and_repeat(self):
+        scheduler = BacklogScheduler(page_records=10, default_response_time=1.0)
+        scheduler.add('a', {'name': 'a'}, 100)
+        self.assertEqual(scheduler.next_server(), ('a', {'name': 'a'}))
+        self.assertIsNone(scheduler.next_server())
+        self.assertTrue(scheduler.in_flight())
+        scheduler.complete('a', True, lag=50)
+        self.assertEqual(scheduler.total_lag(), 50)
+        self.assertEqual(scheduler.next_server()[0], 'a')
+        scheduler.complete('a', False, lag=0)
+        self.assertFalse(scheduler.has_pending())
+        self.assertIsNone(scheduler.next_server())
+
+
+class TestScheduledCollectorEngine(unittest.TestCase):
+    def test_catch_up_until_done(self):
+        scheduler = BacklogScheduler(page_records=10, default_response_time=1.0)
+        lags = {'a': 30, 'b': 10, 'c': 0}
+        for key, lag in lags.items():
+            scheduler.add(key, key, lag, {'records_per_second': 1.0, 'response_time': 1.0})
+        fetches = []
+
+        def worker(key):
+            fetches.append(key)
+            if key == 'c':
+                return -1
+            lags[key] = max(lags[key] - 10, 0)
+            return 5 if lags[key] else 0
+
+        engine = ScheduledCollectorEngine(scheduler, lambda key: key, worker,
+                                          lambda key: (lags[key], None), 2, 60)
+        self.assertEqual(engine.run(), {'a': 0, 'b': 0, 'c': -1})
+        # Server "a" is fetched until its backlog is gone, no round structure limits it
+        self.assertEqual(fetches.count('a'), 3)
+        self.assertEqual(fetches.count('b'), 1)
+
+    def test_time_budget(self):
+        scheduler = BacklogScheduler(page_records=10, default_response_time=1.0)
+        scheduler.add('a', 'a', 100)
+        engine = ScheduledCollectorEngine(scheduler, lambda key: key, lambda key: 1,
+                                          lambda key: (100, None), 1, 0)
+        self.assertEqual(engine.run(), {})
@@ -0,0 +1,53 @@
+import unittest
+
+from collector_module.collectorlib import server_health
+
+
+class TestServerHealth(unittest.TestCase):
+    def test_unknown_server_is_available(self):
+        self.assertTrue(server_health.is_available(None, 1000))
+        self.assertIsNone(server_health.start_probe(None))
+        self.assertIsNone(server_health.record_success('a', None, 1000))
+
+    def test_exponential_backoff(self):
+        health = None
+        retry_times = []
+        for now in (1000, 2000, 3000, 4000, 5000):
+            health = server_health.record_failure('a', health, server_health.FAILURE_TIMEOUT, now, 100, 500)
+            retry_times.append(health['retry_at'] - now)
+        self.assertEqual(retry_times, [100, 200, 400, 500, 500])
+        self.assertEqual(health['state'], server_health.STATE_OPEN)
+        self.assertEqual(health['failure_counts'], {'timeout': 5})
+
+    def test_open_half_open_closed(self):
+        health = server_health.record_failure('a', None, server_health.FAILURE_NO_ATTACHMENT, 1000, 100, 500)
+        self.assertFalse(server_health.is_available(health, 1099))
+        self.assertTrue(server_health.is_available(health, 1100))
+
+        probe = server_health.start_probe(health)
+        self.assertEqual(probe['state'], server_health.STATE_HALF_OPEN)
+        self.assertEqual(health['state'], server_health.STATE_OPEN)
+
+        # Failed probe doubles the backoff
+        failed = server_health.record_failure('a', probe, server_health.FAILURE_PARSE_ERROR, 1100, 100, 500)
+        self.assertEqual(failed['retry_at'], 1300)
+        self.assertEqual(failed['failure_counts'], {'no_attachment': 1, 'parse_error': 1})
+
+        # Successful probe closes the circuit
+        closed = server_health.record_success('a', probe, 1100)
+        self.assertEqual(closed['state'], server_health.STATE_CLOSED)
+        self.assertEqual(closed['failures'], 0)
+        self.assertTrue(server_health.is_available(closed, 1100))
+        self.assertIsNone(server_health.record_success('a', closed, 1200))
+
+    def test_failure_of_later_page_keeps_history(self):
+        health = server_health.record_failure('a', None, server_health.FAILURE_TIMEOUT, 1000, 100, 500)
+        health = server_health.record_failure('a', health, server_health.FAILURE_TIMEOUT, 2000, 100, 500)
+        probe = server_health.start_probe(health)
+        # First page succeeds, the following pages of the run continue from the stored document
+        after_first = server_health.record_success('a', probe, 3000)
+        self.assertIsNone(server_health.record_success('a', after_first, 3001))
+        health = server_health.record_failure('a', after_first, server_health.FAILURE_HTTP_ERROR, 3002, 100, 500)
+        self.assertEqual(health['failures'], 1)
+        self.assertEqual(health['retry_at'], 3102)
+        self.assertEqual(health['failure_counts'], {'timeout': 2, 'http_error': 1})
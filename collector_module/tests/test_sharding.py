@@ -0,0 +1,178 @@
+import threading
+import unittest
+from unittest import mock
+
+from collector_module.collectorlib.sharding import HashRing, ShardMember, get_assigned_servers
+
+
+class FakeLogger:
+    def log_info(self, activity, msg):
+        pass
+
+    def log_warning(self, activity, msg):
+        pass
+
+
+class FakeServerManager:
+    """ In-memory collector_nodes and server_lease collections shared by the nodes.
+    """
+
+    def __init__(self):
+        self.now = 1000
+        self.nodes = {}
+        self.leases = {}
+        # Every lease upsert is atomic in MongoDB
+        self.lock = threading.Lock()
+
+    def get_timestamp(self):
+        return self.now
+
+    def set_node_heartbeat(self, node_id, expires):
+        self.nodes[node_id] = expires
+
+    def get_live_nodes(self, now):
+        return sorted(node for node, expires in self.nodes.items() if expires > now)
+
+    def remove_node(self, node_id):
+        self.nodes.pop(node_id, None)
+
+    def acquire_server_leases(self, node_id, server_keys, now, expires):
+        acquired = []
+        for server_key in server_keys:
+            with self.lock:
+                lease = self.leases.get(server_key)
+                if lease is None or lease['node'] == node_id or lease['expires'] <= now:
+                    self.leases[server_key] = {'node': node_id, 'expires': expires}
+                    acquired.append(server_key)
+        return acquired
+
+    def renew_server_leases(self, node_id, expires):
+        for lease in self.leases.values():
+            if lease['node'] == node_id:
+                lease['expires'] = expires
+
+    def release_server_leases(self, node_id, server_keys=None):
+        for server_key, lease in list(self.leases.items()):
+            if lease['node'] == node_id and (server_keys is None or server_key in server_keys):
+                del self.leases[server_key]
+
+
+def get_server_list(count):
+    return [{'server': 'EE/GOV/{0}/ss/ss{0}.example.com'.format(i)} for i in range(count)]
+
+
+class TestHashRing(unittest.TestCase):
+    def test_empty_ring(self):
+        self.assertIsNone(HashRing([], 8).get_node('a'))
+
+    def test_all_servers_assigned_once(self):
+        server_list = get_server_list(300)
+        nodes = ['node1', 'node2', 'node3']
+        assigned = [get_assigned_servers(server_list, nodes, node, 64) for node in nodes]
+        self.assertEqual(sorted(s['server'] for part in assigned for s in part),
+                         sorted(s['server'] for s in server_list))
+        for part in assigned:
+            self.assertGreater(len(part), 50)
+
+    def test_new_node_moves_only_its_servers(self):
+        server_list = get_server_list(300)
+        before = HashRing(['node1', 'node2'], 64)
+        after = HashRing(['node1', 'node2', 'node3'], 64)
+        for server in server_list:
+            node = after.get_node(server['server'])
+            if node != 'node3':
+                self.assertEqual(node, before.get_node(server['server']))
+
+
+class TestShardMember(unittest.TestCase):
+    def setUp(self):
+        self.server_m = FakeServerManager()
+        self.server_list = get_server_list(100)
+        self.node1 = ShardMember(self.server_m, 'node1', 120, 64, FakeLogger())
+        self.node2 = ShardMember(self.server_m, 'node2', 120, 64, FakeLogger())
+
+    def test_single_node_owns_all(self):
+        self.assertEqual(self.node1.update(self.server_list), self.server_list)
+
+    def test_join_and_rebalance(self):
+        self.node1.update(self.server_list)
+        # node2 can not take the servers still leased by node1
+        self.assertEqual(self.node2.update(self.server_list), [])
+        owned1 = self.node1.update(self.server_list)
+        owned2 = self.node2.update(self.server_list)
+        self.assertEqual(len(owned1) + len(owned2), len(self.server_list))
+        self.assertFalse(set(s['server'] for s in owned1) & set(s['server'] for s in owned2))
+
+    def test_takeover_of_dead_node(self):
+        self.node1.update(self.server_list)
+        self.node2.update(self.server_list)
+        self.node1.update(self.server_list)
+        self.node2.update(self.server_list)
+        # node2 stops without leaving
+        self.server_m.now += 121
+        self.assertEqual(self.node1.update(self.server_list), self.server_list)
+
+    def test_leave(self):
+        self.node1.update(self.server_list)
+        self.node1.leave()
+        self.assertEqual(self.server_m.leases, {})
+        self.assertEqual(self.node2.update(self.server_list), self.server_list)
+
+    def test_cron_run_keeps_membership(self):
+        for _ in range(2):
+            self.node1.update(self.server_list)
+            self.node2.update(self.server_list)
+        self.node1.leave(keep_membership=True)
+        self.assertEqual(set(lease['node'] for lease in self.server_m.leases.values()), {'node2'})
+        # node1 is still a member, node2 does not take its servers
+        owned2 = self.node2.update(self.server_list)
+        self.assertLess(len(owned2), len(self.server_list))
+        # until the heartbeat of node1 expires
+        self.server_m.now += 121
+        self.node2.renew()
+        self.assertEqual(self.node2.update(self.server_list), self.server_list)
+
+
+class TestConcurrentJoin(unittest.TestCase):
+    def test_nodes_started_at_same_time_split_servers(self):
+        server_m = FakeServerManager()
+        server_list = get_server_list(100)
+        members = [ShardMember(server_m, 'node{0}'.format(i), 120, 64, FakeLogger(), settle_time=0.2)
+                   for i in range(2)]
+        owned = {}
+
+        def update(member):
+            owned[member.node_id] = set(s['server'] for s in member.update(server_list))
+
+        threads = [threading.Thread(target=update, args=(member,)) for member in members]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(owned['node0'])
+        self.assertTrue(owned['node1'])
+        self.assertFalse(owned['node0'] & owned['node1'])
+        self.assertEqual(owned['node0'] | owned['node1'], set(s['server'] for s in server_list))
+
+    def test_known_member_does_not_wait(self):
+        server_m = FakeServerManager()
+        server_m.nodes['node0'] = server_m.now + 60
+        member = ShardMember(server_m, 'node0', 120, 64, FakeLogger(), settle_time=60)
+        self.assertEqual(len(member.update(get_server_list(10))), 10)
+
+    def test_next_cron_run_does_not_wait(self):
+        server_m = FakeServerManager()
+        server_list = get_server_list(10)
+        with mock.patch('time.sleep') as sleep:
+            member = ShardMember(server_m, 'node0', 120, 64, FakeLogger(), settle_time=60, membership_ttl=3600)
+            member.update(server_list)
+            self.assertEqual(sleep.call_count, 1)
+            member.leave(keep_membership=True)
+            # Next run after the leases expired, the node is still a member
+            server_m.now += 1800
+            member = ShardMember(server_m, 'node0', 120, 64, FakeLogger(), settle_time=60, membership_ttl=3600)
+            self.assertEqual(member.update(server_list), server_list)
+            self.assertEqual(sleep.call_count, 1)
+        # Membership ends if the node is not run anymore
+        server_m.now += 3601
+        self.assertEqual(server_m.get_live_nodes(server_m.now), [])
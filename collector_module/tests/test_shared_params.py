@@ -0,0 +1,74 @@
+import unittest
+
+from collector_module.collectorlib import shared_params
+
+INTERNALCONF = (
+    "--partjwwDTRcn\r\n"
+    "Content-Type: application/octet-stream\r\n"
+    "Content-transfer-encoding: base64\r\n"
+    "Content-identifier: SHARED-PARAMETERS; instance=\"EE\"\r\n"
+    "Content-location: /V2/20180101000000000000000/shared-params.xml\r\n"
+    "Hash-algorithm-id: http://www.w3.org/2001/04/xmlenc#sha512\r\n"
+    "\r\n"
+    "dGVzdGhhc2g=\r\n"
+    "--partjwwDTRcn--\r\n")
+
+SHARED_PARAMS = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<conf>
+    <instanceIdentifier>EE</instanceIdentifier>
+    <member id="id1">
+        <memberClass><code>GOV</code></memberClass>
+        <memberCode>70000001</memberCode>
+    </member>
+    <member id="id2">
+        <memberClass><code>COM</code></memberClass>
+        <memberCode>10000002</memberCode>
+    </member>
+    <securityServer>
+        <owner>id2</owner>
+        <serverCode>ss2</serverCode>
+        <address>ss2.example.com</address>
+    </securityServer>
+    <securityServer>
+        <owner>id1</owner>
+        <serverCode>ss1</serverCode>
+        <address>ss1.example.com</address>
+    </securityServer>
+</conf>
+"""
+
+
+class TestSharedParams(unittest.TestCase):
+    def test_location_and_hash(self):
+        location, params_hash = shared_params.get_shared_params_location(INTERNALCONF)
+        self.assertEqual(location, '/V2/20180101000000000000000/shared-params.xml')
+        self.assertEqual(params_hash, 'dGVzdGhhc2g=')
+
+    def test_location_without_hash(self):
+        location, params_hash = shared_params.get_shared_params_location(
+            'Content-location: /V2/1/shared-params.xml\r\n')
+        self.assertEqual(location, '/V2/1/shared-params.xml')
+        self.assertIsNone(params_hash)
+        with self.assertRaises(ValueError):
+            shared_params.get_shared_params_location('')
+
+    def test_parse(self):
+        server_list = shared_params.parse_shared_params(SHARED_PARAMS)
+        self.assertEqual([s['server'] for s in server_list],
+                         ['EE/COM/10000002/ss2/ss2.example.com', 'EE/GOV/70000001/ss1/ss1.example.com'])
+        self.assertEqual(server_list[1], {
+            'ownerId': 'id1', 'instance': 'EE', 'memberClass': 'GOV', 'memberCode': '70000001',
+            'serverCode': 'ss1', 'address': 'ss1.example.com', 'server': 'EE/GOV/70000001/ss1/ss1.example.com'})
+
+    def test_unknown_owner(self):
+        with self.assertRaises(KeyError):
+            shared_params.parse_shared_params(SHARED_PARAMS.replace(b'<owner>id1', b'<owner>id3'))
+
+    def test_diff(self):
+        server_list = shared_params.parse_shared_params(SHARED_PARAMS)
+        self.assertEqual(shared_params.get_server_list_diff(None, server_list),
+                         (['EE/COM/10000002/ss2/ss2.example.com', 'EE/GOV/70000001/ss1/ss1.example.com'], []))
+        self.assertEqual(shared_params.get_server_list_diff(server_list, server_list), ([], []))
+        old_list = [{'server': 'EE/GOV/70000001/ss1/ss1.example.com'}, {'server': 'EE/GOV/70000001/old/old'}]
+        self.assertEqual(shared_params.get_server_list_diff(old_list, server_list),
+                         (['EE/COM/10000002/ss2/ss2.example.com'], ['EE/GOV/70000001/old/old']))
@@ -0,0 +1,118 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from collector_module.collectorlib.spool import Spool, drain_spool
+
+
+class FakeIngest:
+    def __init__(self, server_m):
+        self.server_m = server_m
+
+    def insert(self, data_list):
+        self.server_m.batches.append(len(data_list))
+        self.server_m.records.extend(data_list)
+
+    def commit(self, server_key, records_from, stats=None):
+        pointer = dict(stats or {})
+        pointer['records_from'] = records_from
+        self.server_m.pointers[server_key] = pointer
+
+    def abort(self):
+        pass
+
+
+class FakeServerManager:
+    def __init__(self, pointers=None):
+        self.records = []
+        self.batches = []
+        self.pointers = pointers or {}
+
+    def get_collector_pointers(self):
+        return dict(self.pointers)
+
+    def start_ingest(self, server_key):
+        return FakeIngest(self)
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.spool = Spool(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write_page(self, server_key, records, records_from):
+        ingest = self.spool.start_ingest(server_key)
+        for record in records:
+            ingest.insert([record])
+        ingest.commit(server_key, records_from, {'response_time': 1.0})
+        return ingest.name
+
+    def test_commit_and_read(self):
+        name = self.write_page('A/B/1/ss', [{'id': 1}, {'id': 2}, {'id': 3}], 100.0)
+        self.assertEqual(self.spool.get_records_from('A/B/1/ss'), 100.0)
+        self.assertIsNone(self.spool.get_records_from('A/B/1/other'))
+        segments = self.spool.list_segments()
+        self.assertEqual([s['segment'] for s in segments], [name])
+        self.assertEqual(segments[0]['records'], 3)
+        self.assertEqual(segments[0]['file'], name + '.json.gz')
+        self.assertEqual(segments[0]['compression'], 'gzip')
+        self.assertEqual(segments[0]['records_from'], 100.0)
+        batches = list(self.spool.read_segment(segments[0], 2))
+        self.assertEqual(batches, [[{'id': 1}, {'id': 2}], [{'id': 3}]])
+        # Segments are plain gzip NDJSON files
+        with gzip.open(os.path.join(self.path, name + '.json.gz'), 'rt') as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+    def test_abort(self):
+        ingest = self.spool.start_ingest('A/B/1/ss')
+        ingest.insert([{'id': 1}])
+        ingest.abort()
+        self.assertEqual(self.spool.list_segments(), [])
+        self.assertEqual(sorted(os.listdir(self.path)), ['pointers'])
+
+    def test_drain_in_order(self):
+        self.write_page('a', [{'id': 1}], 100.0)
+        self.write_page('b', [{'id': 2}], 50.0)
+        self.write_page('a', [{'id': 3}, {'id': 4}], 200.0)
+        server_m = FakeServerManager()
+        self.assertEqual(drain_spool(self.spool, server_m, 10, MagicMock()), (3, 4))
+        self.assertEqual([r['id'] for r in server_m.records], [1, 2, 3, 4])
+        self.assertEqual(server_m.pointers['a']['records_from'], 200.0)
+        self.assertEqual(server_m.pointers['b']['records_from'], 50.0)
+        self.assertEqual(self.spool.list_segments(), [])
+
+    def test_drain_skips_loaded_segment(self):
+        name = self.write_page('a', [{'id': 1}], 100.0)
+        server_m = FakeServerManager({'a': {'records_from': 100.0, 'spool_segment': name}})
+        self.assertEqual(drain_spool(self.spool, server_m, 10, MagicMock()), (0, 0))
+        self.assertEqual(server_m.records, [])
+        self.assertEqual(self.spool.list_segments(), [])
+
+    def test_index_time_range(self):
+        name = self.write_page('a', [{'monitoringDataTs': 20}, {'monitoringDataTs': 10}, {'id': 3}], 100.0)
+        with open(os.path.join(self.path, name + '.idx.json')) as f:
+            index = json.load(f)
+        self.assertEqual((index['minMonitoringDataTs'], index['maxMonitoringDataTs']), (10, 20))
+        self.assertEqual(index['server'], 'a')
+
+    def test_drain_in_batches(self):
+        ingest = self.spool.start_ingest('a')
+        ingest.insert([{'id': i} for i in range(5)])
+        ingest.commit('a', 100.0)
+        server_m = FakeServerManager()
+        self.assertEqual(drain_spool(self.spool, server_m, 2, MagicMock()), (1, 5))
+        self.assertEqual(server_m.batches, [2, 2, 1])
+
+    def test_drain_legacy_segment(self):
+        name = self.write_page('a', [{'id': 1}], 100.0)
+        os.rename(os.path.join(self.path, name + '.idx.json'), os.path.join(self.path, name + '.meta.json'))
+        server_m = FakeServerManager()
+        self.assertEqual(drain_spool(self.spool, server_m, 10, MagicMock()), (1, 1))
+        self.assertEqual(sorted(os.listdir(self.path)), ['pointers'])
@@ -0,0 +1,99 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# External files are standalone scripts importing xrdinfo from their own directory
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'external_files'))
+
+import xrdinfo  # noqa: E402
+import xrd_catalog  # noqa: E402
+
+SUBSYSTEMS = [
+    ('INST', 'GOV', '1', 'SUB1', 'INST', 'GOV', '1', 'SS1', 'ss1.local'),
+    ('INST', 'GOV', '2', 'SUB2', 'INST', 'GOV', '2', 'SS2', 'ss2.local'),
+]
+SUB1 = ('INST', 'GOV', '1', 'SUB1')
+SUB2 = ('INST', 'GOV', '2', 'SUB2')
+
+
+class FakeXRoad:
+    def __init__(self):
+        self.methods_calls = []
+        self.failing_methods = set()
+        self.failing_wsdl = set()
+
+    def methods(self, addr, client, producer, method, timeout, verify, cert):
+        self.methods_calls.append(producer)
+        if producer in self.failing_methods:
+            raise xrdinfo.XrdInfoError('methods failed')
+        return [producer + ('service', 'v1')]
+
+    def wsdl(self, addr, client, service, timeout, verify, cert):
+        if tuple(service[0:4]) in self.failing_wsdl:
+            raise xrdinfo.XrdInfoError('wsdl failed')
+        return u'<wsdl>{}</wsdl>'.format(xrdinfo.stringify(service))
+
+
+class TestCatalogCrawler(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.xroad = FakeXRoad()
+        for name, target in (('methods', self.xroad.methods), ('wsdl', self.xroad.wsdl),
+                             ('subsystems_with_server', lambda shared_params: iter(SUBSYSTEMS))):
+            patcher = mock.patch.object(xrdinfo, name, target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def crawl(self, max_age=3600):
+        crawler = xrd_catalog.CatalogCrawler(
+            'http://ss.local', ('INST', 'GOV', '0', 'CLIENT'), xrd_catalog.CatalogCache(self.cache_dir),
+            threads=2, max_age=max_age)
+        return crawler.crawl(u'<shared-params/>')
+
+    def test_fresh_entries_not_queried(self):
+        entries = self.crawl()
+        self.assertTrue(entries[SUB1]['ok'])
+        wsdl_hash = entries[SUB1]['wsdl']['service/v1']
+        self.assertEqual(xrd_catalog.CatalogCache(self.cache_dir).get_wsdl(wsdl_hash),
+                         u'<wsdl>INST/GOV/1/SUB1/service/v1</wsdl>')
+        self.assertEqual(sorted(self.xroad.methods_calls), [SUB1, SUB2])
+
+        self.xroad.methods_calls = []
+        entries = self.crawl()
+        self.assertEqual(self.xroad.methods_calls, [])
+        self.assertEqual(sorted(entries), [SUB1, SUB2])
+
+        # Entries older than max_age are queried again
+        self.crawl(max_age=-1)
+        self.assertEqual(sorted(self.xroad.methods_calls), [SUB1, SUB2])
+
+    def test_failed_methods_keep_cached_entry(self):
+        self.crawl()
+        self.xroad.failing_methods.add(SUB1)
+        entries = self.crawl(max_age=-1)
+        self.assertEqual(entries[SUB1]['methods'], [list(SUB1) + ['service', 'v1']])
+        self.assertEqual(entries[SUB1]['error'], u'methods failed')
+
+    def test_failed_wsdl_queried_again(self):
+        self.xroad.failing_wsdl.add(SUB1)
+        entries = self.crawl()
+        self.assertFalse(entries[SUB1]['ok'])
+        self.assertIsNone(entries[SUB1]['wsdl']['service/v1'])
+        self.assertTrue(entries[SUB2]['ok'])
+
+        self.xroad.methods_calls = []
+        self.xroad.failing_wsdl = set()
+        entries = self.crawl()
+        self.assertEqual(self.xroad.methods_calls, [SUB1])
+        self.assertTrue(entries[SUB1]['ok'])
+
+    def test_cache_error_does_not_drop_entry(self):
+        with mock.patch.object(xrd_catalog.CatalogCache, 'put_wsdl', side_effect=IOError('disk full')):
+            entries = self.crawl()
+        self.assertEqual(sorted(entries), [SUB1, SUB2])
+        self.assertFalse(entries[SUB1]['ok'])
+        self.assertNotIn('pending', entries[SUB1])
@@ -4,6 +4,7 @@
 
 from .collectorlib.database_manager import DatabaseManager
 from .collectorlib.logger_manager import LoggerManager
+from .collectorlib.shared_params import get_server_list_diff
 from . import settings
 
 
@@ -17,11 +18,23 @@ def main():
 
     central_server = settings.CENTRAL_SERVER
     timeout = settings.CENTRAL_SERVER_TIMEOUT
-    server_list = server_m.get_list_from_central_server(central_server, timeout)
+    previous = server_m.get_server_list_database()
+    previous = previous[0] if previous else None
+    known_hash = previous.get('shared_params_hash') if previous else None
+    shared_params_hash, server_list = server_m.get_shared_params(central_server, timeout, known_hash)
 
-    if len(server_list):
-        server_m.stores_server_list_database(server_list)
-        print('- Total of {0} inserted into server_list collection.'.format(len(server_list)))
+    if server_list is None:
+        print('- Shared parameters not changed')
+    elif len(server_list):
+        added, removed = get_server_list_diff(previous['server_list'] if previous else None, server_list)
+        if previous and not added and not removed:
+            # Other shared parameters changed, the collectors do not need to reload the list
+            server_m.set_server_list_hash(previous['_id'], shared_params_hash)
+            print('- Server list not changed')
+        else:
+            server_m.stores_server_list_database(server_list, shared_params_hash, added, removed)
+            print('- Total of {0} inserted into server_list collection ({1} added, {2} removed).'.format(
+                len(server_list), len(added), len(removed)))
     else:
         print('- No servers found')
 
@@ -1,8 +1,11 @@
 import time
-from multiprocessing import Manager, Process
 
 from correctorlib.corrector_batch import CorrectorBatch
+from correctorlib.database_manager import DatabaseManager
+from correctorlib.hash_cache import HashCache
+from correctorlib.insert_stream import InsertStream
 from correctorlib.logger_manager import LoggerManager
+from correctorlib.worker_pool import WorkerPool
 from settings import Settings
 
 if __name__ == '__main__':
@@ -12,19 +15,45 @@ if __name__ == '__main__':
     settings = Settings()
     logger_m = LoggerManager(settings.LOGGER_NAME, settings.MODULE)
     corrector_version = logger_m.__version__
+    # Hashes stored in clean_data by earlier batches
+    hash_cache = HashCache(settings.CORRECTOR_HASH_CACHE_SIZE)
+    # Workers and connections are kept between the batches
+    pool = WorkerPool(settings, settings.THREAD_COUNT, logger_m)
+    pool.start()
+    c_batch = CorrectorBatch(settings, hash_cache, pool)
+    # In stream mode batches are started by the inserts into raw_messages, see InsertStream
+    insert_stream = None
+    if settings.CORRECTOR_MODE == 'stream':
+        insert_stream = InsertStream(DatabaseManager(settings), logger_m, settings.CORRECTOR_ID,
+                                     settings.CORRECTOR_STREAM_MAX_DOCS, settings.CORRECTOR_STREAM_MAX_WAIT)
 
     # Runs Corrector in infinite Loop
     while True:
         try:
-            c_batch = CorrectorBatch(settings)
-            manager = Manager()
-            process_dict = manager.dict()
-            process_dict['doc_len'] = -1
+            process_dict = {'doc_len': -1}
+            if insert_stream is not None and insert_stream.stream is None:
+                # Opened before the batch, inserts during the batch start the next one
+                try:
+                    if not insert_stream.open():
+                        logger_m.log_warning('corrector_main', 'Change streams not supported, using polling mode')
+                        insert_stream = None
+                except Exception as e:
+                    # Not a replica set or connection lost, polling until the stream is opened again
+                    logger_m.log_warning('corrector_main', 'Change stream not opened: {0}'.format(repr(e)))
 
             print('Corrector Service [{0}] - Batch timestamp: {1}'.format(corrector_version, int(time.time())))
-            p = Process(target=c_batch.run, args=(process_dict,))
-            p.start()
-            p.join()
+            try:
+                c_batch.run(process_dict)
+            except Exception:
+                # Logged by CorrectorBatch, doc_len -1 marks the failed batch
+                pass
+
+            if insert_stream is not None and insert_stream.stream is not None and process_dict['doc_len'] != -1:
+                try:
+                    # Inserts read before the batch are handled
+                    insert_stream.save()
+                except Exception as e:
+                    logger_m.log_warning('corrector_main', 'Resume token not saved: {0}'.format(repr(e)))
 
             if process_dict['doc_len'] == -1:
                 logger_m.log_error('corrector_main',
@@ -38,7 +67,18 @@ if __name__ == '__main__':
                 # If number of processed docs is smaller than CORRECTOR_DOCUMENTS_MIN,
                 # waits WAIT_FROM_DONE to restart batch
                 logger_m.log_info('corrector_main', 'Number of processed docs {0} is smaller than {1}. Waits {2} to restart batch'.format(process_dict['doc_len'], settings.CORRECTOR_DOCUMENTS_MIN, settings.WAIT_FROM_DONE))
-                time.sleep(settings.WAIT_FROM_DONE)
+                if insert_stream is not None and insert_stream.stream is not None:
+                    try:
+                        # Restarts at the next micro-batch of inserts, timeout documents are still handled
+                        # at least every WAIT_FROM_DONE seconds
+                        inserts = insert_stream.wait(settings.WAIT_FROM_DONE)
+                        logger_m.log_info('corrector_main', 'Inserted raw documents: {0}'.format(inserts))
+                    except Exception as e:
+                        logger_m.log_warning('corrector_main', 'Change stream failed: {0}'.format(repr(e)))
+                        insert_stream.close()
+                        time.sleep(settings.WAIT_FROM_DONE)
+                else:
+                    time.sleep(settings.WAIT_FROM_DONE)
             else:
                 # Wait just 5 secs to allow process killed from outside ...
                 logger_m.log_info('corrector_main', 'Wait just 5 secs to allow process killed from outside ...')
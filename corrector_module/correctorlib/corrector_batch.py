@@ -1,17 +1,31 @@
-import multiprocessing
 import queue
+import threading
 import time
 import traceback
 
 from . import database_manager
 from . import document_manager
-from .corrector_worker import CorrectorWorker
 from .logger_manager import LoggerManager
+from .worker_pool import WorkerPool
 
 
 class CorrectorBatch:
-    def __init__(self, settings):
+    def __init__(self, settings, hash_cache=None, pool=None):
+        """
+        :param settings: The Corrector settings.
+        :param hash_cache: HashCache of the hashes stored by earlier batches, or None.
+        :param pool: WorkerPool of the service, or None to start workers for every run.
+        """
         self.settings = settings
+        self.hash_cache = hash_cache
+        self.pool = pool
+        self.db_m = None
+        # Guards hash_cache and the claimed hashes used by the pipeline stages
+        self.lock = threading.Lock()
+        # Key of the last fetched page, the next batch of the run is fetched after it
+        self.raw_key = None
+        # Hashes the batches in progress are storing, duplicates for the later batches
+        self.claimed_hashes = set()
 
     def run(self, process_dict):
         """
@@ -33,24 +47,156 @@ class CorrectorBatch:
         """
         Gets raw documents, groups by "messageId", corrects documents' structure, initializes workers,
         updates timeout documents to "done", removes duplicates from raw_messages.
+        With CORRECTOR_PIPELINE_SIZE > 0 the batches are run as a pipeline until the raw documents are processed,
+        see _pipeline_run, otherwise one batch is run.
         :param process_dict:
         :return: Returns the amount of documents still to process.
         """
 
-        doc_len = 0
         start_processing_time = time.time()
         logger_m = LoggerManager(self.settings.LOGGER_NAME, self.settings.MODULE)
         logger_m.log_heartbeat(
             "processing", self.settings.HEARTBEAT_LOGGER_PATH, self.settings.HEARTBEAT_FILE, "SUCCEEDED")
         logger_m.log_info('corrector_batch_start', 'Starting corrector - Version {0}'.format(LoggerManager.__version__))
 
-        # Start Database Manager
-        db_m = database_manager.DatabaseManager(self.settings)
+        # Start Database Manager, the connection is kept between the batches
+        if self.db_m is None:
+            self.db_m = database_manager.DatabaseManager(self.settings)
+        self.raw_key = None
+        self.claimed_hashes = set()
+
+        # Process the groups in the worker pool, a pool is started for this run if the service has none
+        pool = self.pool
+        if pool is None:
+            pool = WorkerPool(self.settings, self.settings.THREAD_COUNT, logger_m)
+            pool.start()
+        try:
+            if self.settings.CORRECTOR_PIPELINE_SIZE > 0:
+                doc_len, duplicates = self._pipeline_run(pool, logger_m)
+            else:
+                batch = self._fetch_batch(logger_m)
+                self._process_batch(batch, pool)
+                self._cleanup_batch(batch, logger_m)
+                doc_len, duplicates = batch['doc_len'], batch['duplicates']
+        finally:
+            if self.pool is None:
+                pool.stop()
+
+        end_processing_time = time.time()
+        total_time = time.strftime("%H:%M:%S", time.gmtime(end_processing_time - start_processing_time))
+        msg = ["Number of duplicates: {0}".format(duplicates),
+               "Documents processed: " + str(doc_len),
+               "Processing time: {0}".format(total_time)]
+
+        logger_m.log_info('corrector_batch_end', ' | '.join(msg))
+        logger_m.log_heartbeat(
+            "finished", self.settings.HEARTBEAT_LOGGER_PATH, self.settings.HEARTBEAT_FILE, "SUCCEEDED")
+        process_dict['doc_len'] = doc_len
+
+    @staticmethod
+    def _put(stage_queue, item, stop):
+        """
+        Puts the item to the bounded stage queue, gives up if the pipeline is stopped.
+        """
+        while not stop.is_set():
+            try:
+                stage_queue.put(item, True, 1)
+                return
+            except queue.Full:
+                pass
+
+    @staticmethod
+    def _get(stage_queue, stop):
+        """
+        Gets the next item from the stage queue, returns None if the pipeline is stopped.
+        """
+        while not stop.is_set():
+            try:
+                return stage_queue.get(True, 1)
+            except queue.Empty:
+                pass
+        return None
+
+    def _pipeline_run(self, pool, logger_m):
+        """
+        Runs the batches as a pipeline of three stages connected by queues of CORRECTOR_PIPELINE_SIZE batches:
+        the fetch of batch N + 1 (thread), the worker processing of batch N (this thread) and the cleanup of batch
+        N - 1 (thread). The batches are processed one at a time in order, so documents of a messageId are paired
+        with the ones stored by the earlier batches. Every batch is fetched after the last raw document of the
+        previous one, so the batches in progress are not fetched again, see _fetch_batch. The run ends after a batch
+        with less than CORRECTOR_DOCUMENTS_LIMIT documents, on error all stages are stopped and the error is raised.
+        :param pool: The WorkerPool.
+        :param logger_m: The LoggerManager.
+        :return: Returns the number of documents processed and the number of duplicates.
+        """
+        fetched = queue.Queue(self.settings.CORRECTOR_PIPELINE_SIZE)
+        processed = queue.Queue(self.settings.CORRECTOR_PIPELINE_SIZE)
+        stop = threading.Event()
+        errors = []
+        totals = {'doc_len': 0, 'duplicates': 0}
+
+        def fetch_stage():
+            try:
+                while not stop.is_set():
+                    batch = self._fetch_batch(logger_m)
+                    self._put(fetched, batch, stop)
+                    if batch['raw_count'] < self.settings.CORRECTOR_DOCUMENTS_LIMIT:
+                        break
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                self._put(fetched, None, stop)
+
+        def cleanup_stage():
+            try:
+                while True:
+                    batch = self._get(processed, stop)
+                    if batch is None:
+                        break
+                    self._cleanup_batch(batch, logger_m)
+                    totals['doc_len'] += batch['doc_len']
+                    totals['duplicates'] += batch['duplicates']
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+        threads = [threading.Thread(target=fetch_stage), threading.Thread(target=cleanup_stage)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                batch = self._get(fetched, stop)
+                if batch is None:
+                    break
+                self._process_batch(batch, pool)
+                self._put(processed, batch, stop)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            self._put(processed, None, stop)
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+        return totals['doc_len'], totals['duplicates']
+
+    def _fetch_batch(self, logger_m):
+        """
+        Fetch stage: gets the raw documents after the previous batch of the run, groups them by messageId,
+        corrects their structure, checks the database duplicates of the batch at once and pairs the Client and
+        Producer documents of the batch. Documents of failed chunks and documents inserted with an older requestInTs
+        are fetched by the next run.
+        :param logger_m: The LoggerManager.
+        :return: Returns the batch, a dict with the messageId groups for the workers.
+        """
+        db_m = self.db_m
         # Start Document Manager
         doc_m = document_manager.DocumentManager(self.settings)
 
         # Get documents from raw collection
-        cursor = db_m.get_raw_documents(limit=self.settings.CORRECTOR_DOCUMENTS_LIMIT)
+        cursor, self.raw_key = db_m.get_raw_page(limit=self.settings.CORRECTOR_DOCUMENTS_LIMIT, after=self.raw_key)
         logger_m.log_info('corrector_batch_raw', 'Processing {0} raw documents'.format(len(cursor)))
 
         # Aggregate documents by message id
@@ -63,41 +209,89 @@ class CorrectorBatch:
             fix_doc = doc_m.correct_structure(_doc)
             doc_map[message_id].append(fix_doc)
 
-        # Build queue to be processed
-        list_to_process = multiprocessing.Queue()
-        duplicates = multiprocessing.Value('i', 0, lock=True)
-
-        m = multiprocessing.Manager()
-        to_remove_queue = m.Queue()
+        # Check database duplicates of the whole batch at once, hashes stored by earlier batches are not queried
+        hash_map = {}
+        for message_id in doc_map:
+            hash_map[message_id] = set(doc_m.get_hash(_doc) for _doc in doc_map[message_id])
+        batch_hashes = set().union(*hash_map.values())
+        with self.lock:
+            if self.hash_cache is not None:
+                known_hashes, unknown_hashes = self.hash_cache.split(batch_hashes)
+            else:
+                known_hashes, unknown_hashes = set(), batch_hashes
+            # Hashes stored by the batches in progress are duplicates too
+            claimed_hashes = unknown_hashes & self.claimed_hashes
+        existing_hashes = known_hashes | claimed_hashes | db_m.get_existing_hashes(unknown_hashes - claimed_hashes)
+        new_hashes = batch_hashes - existing_hashes
+        with self.lock:
+            self.claimed_hashes.update(new_hashes)
+        logger_m.log_info('corrector_batch_hashes', 'Hashes: {0}, cached: {1}, existing: {2}'.format(
+            len(batch_hashes), len(known_hashes), len(existing_hashes)))
 
+        # Build the messageId groups to be processed
+        groups = []
+        pair_count = 0
+        doc_len = 0
         for message_id in doc_map:
-            documents = doc_map[message_id]
+            # Client and Producer documents in the same batch are paired in memory and stored once
+            pairs, documents = doc_m.pair_documents(doc_map[message_id], database_manager.MATCH_WINDOW)
+            pair_count += len(pairs)
             data = dict()
-            data['logger_manager'] = logger_m
-            data['document_manager'] = doc_m
             data['message_id'] = message_id
+            data['pairs'] = pairs
             data['documents'] = documents
-            data['to_remove_queue'] = to_remove_queue
-            list_to_process.put(data)
-            doc_len += len(documents)
-
-        # Sync
-        # time.sleep(5)
-
-        # Create pool of workers
-        pool = []
-        for i in range(self.settings.THREAD_COUNT):
-            # Configure worker
-            worker = CorrectorWorker(self.settings, 'worker_{0}'.format(i))
-            p = multiprocessing.Process(target=worker.run, args=(list_to_process, duplicates))
-            pool.append(p)
-
-        # Starts all pool process
-        for p in pool:
-            p.start()
-        # Wait all processes to finish their jobs
-        for p in pool:
-            p.join()
+            data['existing_hashes'] = hash_map[message_id] & existing_hashes
+            groups.append(data)
+            doc_len += len(documents) + 2 * len(pairs)
+        logger_m.log_info('corrector_batch_pairs', 'Paired {0} Client and Producer documents in batch'.format(pair_count))
+
+        batch = dict()
+        batch['groups'] = groups
+        batch['raw_count'] = len(cursor)
+        # Raw chunk documents are marked corrected after all their records are processed
+        batch['chunk_ids'] = list(set(database_manager.get_chunk_id(_doc) for _doc in cursor) - {None})
+        batch['hashes'] = batch_hashes
+        batch['new_hashes'] = new_hashes
+        batch['doc_len'] = doc_len
+        return batch
+
+    def _process_batch(self, batch, pool):
+        """
+        Process stage: processes the messageId groups of the batch in the worker pool.
+        :param batch: The batch, see _fetch_batch.
+        :param pool: The WorkerPool.
+        :return: None
+        """
+        workers_succeeded, duplicates, to_remove = pool.run_batch(
+            batch['groups'], self.settings.CORRECTOR_PREFETCH_SIZE, self.settings.CORRECTOR_BATCH_TIMEOUT)
+        with self.lock:
+            # Hashes of the batch are in clean_data now, or not stored if the workers failed
+            self.claimed_hashes.difference_update(batch['new_hashes'])
+            if workers_succeeded and self.hash_cache is not None:
+                # Hashes of the batch are kept for the next batches
+                self.hash_cache.add_many(batch['hashes'])
+        batch['workers_succeeded'] = workers_succeeded
+        batch['duplicates'] = duplicates
+        batch['to_remove'] = to_remove
+
+    def _cleanup_batch(self, batch, logger_m):
+        """
+        Cleanup stage: marks the chunks of the batch corrected, updates timeout documents to "done" and removes
+        the duplicates of the batch from raw_messages.
+        :param batch: The batch, see _process_batch.
+        :param logger_m: The LoggerManager.
+        :return: None
+        """
+        # Only this stage uses the bulk writes of the DatabaseManager
+        db_m = self.db_m
+        chunk_ids = batch['chunk_ids']
+        if chunk_ids:
+            if batch['workers_succeeded']:
+                db_m.mark_chunks_as_corrected(chunk_ids)
+            else:
+                # Chunks are processed again, already stored records are found as duplicates
+                logger_m.log_warning('corrector_batch_chunks', 'Worker failed, {0} chunks not marked corrected'.format(
+                    len(chunk_ids)))
 
         logger_m.log_info('corrector_batch_update_timeout',
                           "Updating timed out [{0} days] orphans to done.".format(self.settings.CORRECTOR_TIMEOUT_DAYS))
@@ -115,7 +309,7 @@ class CorrectorBatch:
             logger_m.log_info('corrector_batch_update_client_old_to_done',
                               "No orphans updated to done.")
 
-        doc_len += number_of_updated_docs
+        batch['doc_len'] += number_of_updated_docs
 
         # Update Status of older documents according to producer.requestInTs
         cursor = db_m.get_timeout_documents_producer(self.settings.CORRECTOR_TIMEOUT_DAYS,
@@ -130,18 +324,16 @@ class CorrectorBatch:
             logger_m.log_info('corrector_batch_update_producer_old_to_done',
                               "No orphans updated to done.")
 
-        doc_len += number_of_updated_docs
+        batch['doc_len'] += number_of_updated_docs
 
         # Go through the to_remove list and remove the duplicates
-        element_in_queue = True
+        to_remove = batch['to_remove']
+        db_m.enable_bulk_writes(self.settings.CORRECTOR_BULK_SIZE, self.settings.CORRECTOR_BULK_DELAY)
         total_raw_removed = 0
-        while element_in_queue:
-            try:
-                element = to_remove_queue.get(False)
-                db_m.remove_duplicate_from_raw(element)
-                total_raw_removed += 1
-            except queue.Empty:
-                element_in_queue = False
+        for element in to_remove:
+            db_m.remove_duplicate_from_raw(element)
+            total_raw_removed += 1
+        db_m.flush()
 
         if total_raw_removed > 0:
             logger_m.log_info('corrector_batch_remove_duplicates_from_raw',
@@ -150,15 +342,4 @@ class CorrectorBatch:
             logger_m.log_info('corrector_batch_remove_duplicates_from_raw',
                               "No raw documents marked to removal.")
 
-        doc_len += total_raw_removed
-
-        end_processing_time = time.time()
-        total_time = time.strftime("%H:%M:%S", time.gmtime(end_processing_time - start_processing_time))
-        msg = ["Number of duplicates: {0}".format(duplicates.value),
-               "Documents processed: " + str(doc_len),
-               "Processing time: {0}".format(total_time)]
-
-        logger_m.log_info('corrector_batch_end', ' | '.join(msg))
-        logger_m.log_heartbeat(
-            "finished", self.settings.HEARTBEAT_LOGGER_PATH, self.settings.HEARTBEAT_FILE, "SUCCEEDED")
-        process_dict['doc_len'] = doc_len
+        batch['doc_len'] += total_raw_removed
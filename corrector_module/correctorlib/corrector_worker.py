@@ -1,7 +1,9 @@
 
-import queue
+import traceback
 
 from . import database_manager
+from . import document_manager
+from .logger_manager import LoggerManager
 
 
 class CorrectorWorker:
@@ -11,27 +13,62 @@ class CorrectorWorker:
         self.db_m = None
         self.worker_name = name
 
-    def run(self, to_process, duplicates):
-        """ Process run entry point
-        :param to_process: Queue of documents to be processed
-        :param duplicates: Variable to hold the number of duplicates
+    def serve(self, task_queue, result_queue, current_chunk):
+        """ Process entry point of a WorkerPool worker. Processes chunks until it gets None or has processed
+        CORRECTOR_WORKER_MAX_CHUNKS chunks, the pool then starts a new worker.
+        :param task_queue: Queue of (chunk_id, list of messageId groups) tuples.
+        :param result_queue: Queue of the results, see WorkerPool.run_batch.
+        :param current_chunk: Shared value holding the chunk_id of the latest chunk taken by the worker.
         :return: None
         """
+        # Connections and managers are kept between the batches
         self.db_m = database_manager.DatabaseManager(self.settings)
-        try:
-            # Process queue while is not empty
-            while True:
-                data = to_process.get(True, 1)
-                duplicate_count = self.consume_data(data)
-                with duplicates.get_lock():
-                    duplicates.value += duplicate_count
-        except queue.Empty:
-            pass
+        self.db_m.enable_bulk_writes(self.settings.CORRECTOR_BULK_SIZE, self.settings.CORRECTOR_BULK_DELAY)
+        logger_m = LoggerManager(self.settings.LOGGER_NAME, self.settings.MODULE)
+        doc_m = document_manager.DocumentManager(self.settings)
+        processed = 0
+        while processed < self.settings.CORRECTOR_WORKER_MAX_CHUNKS:
+            task = task_queue.get()
+            if task is None:
+                break
+            chunk_id, chunk = task
+            current_chunk.value = chunk_id
+            try:
+                duplicates, to_remove = self.consume_chunk(chunk, logger_m, doc_m)
+                result_queue.put(('done', self.worker_name, chunk_id, duplicates, to_remove))
+            except Exception as e:
+                msg = '[{0}] Error: {1} {2}'.format(self.worker_name, repr(e), traceback.format_exc()).replace("\n", "")
+                logger_m.log_error('corrector_worker', msg)
+                # Buffered writes of the failed chunk are discarded, its documents are processed again
+                self.db_m.enable_bulk_writes(self.settings.CORRECTOR_BULK_SIZE, self.settings.CORRECTOR_BULK_DELAY)
+                result_queue.put(('failed', self.worker_name, chunk_id))
+            processed += 1
+
+    def consume_chunk(self, chunk, logger_m, doc_m):
+        """
+        Processes a chunk of messageId groups and writes the results.
+        :param chunk: List of messageId groups, see CorrectorBatch.
+        :param logger_m: The LoggerManager.
+        :param doc_m: The DocumentManager.
+        :return: Returns the number of duplicates and the list of raw document _id values to be removed.
+        """
+        duplicates = 0
+        to_remove = []
+        # Pairing candidates of the whole chunk are queried at once
+        self.db_m.prefetch_candidates([data['message_id'] for data in chunk])
+        for data in chunk:
+            data['logger_manager'] = logger_m
+            data['document_manager'] = doc_m
+            data['to_remove'] = to_remove
+            duplicates += self.consume_data(data)
+        # Write the buffered writes, the batch continues after all chunks are written
+        self.db_m.flush()
+        return duplicates, to_remove
 
     def consume_data(self, data):
         """
         The Corrector worker. Processes a batch of documents with the same message_id.
-        :param data: Contains LoggerManager, DatabaseManager, DocumentManager, message_id and documents to be processed.
+        :param data: Contains LoggerManager, DocumentManager, message_id, pairs and documents to be processed.
         :return: Returns number of duplicates found.
         """
         # Get parameters
@@ -39,15 +76,36 @@ class CorrectorWorker:
         doc_m = data['document_manager']
         message_id = data['message_id']
         documents = data['documents']
-        to_remove_queue = data['to_remove_queue']
+        to_remove = data['to_remove']
+        existing_hashes = data['existing_hashes']
         duplicates = no_requestInTs = 0
         hash_set = set()
 
-        for current_document in documents:
+        # Pairs found by CorrectorBatch are stored as done, pairs with duplicates are processed one by one
+        unpaired = []
+        for client_document, producer_document in data.get('pairs', []):
+            client_hash = doc_m.get_hash(client_document)
+            producer_hash = doc_m.get_hash(producer_document)
+            if client_hash == producer_hash or any(h in hash_set or h in existing_hashes
+                                                   for h in (client_hash, producer_hash)):
+                unpaired.extend([client_document, producer_document])
+                continue
+            hash_set.update((client_hash, producer_hash))
+            new_document = doc_m.create_json(client_document, producer_document, client_hash, producer_hash,
+                                             message_id)
+            new_document = doc_m.apply_calculations(new_document)
+            new_document['correctorTime'] = database_manager.get_timestamp()
+            new_document['correctorStatus'] = 'done'
+            new_document['matchingType'] = 'regular_pair'
+            self.db_m.add_to_clean_data(new_document)
+            self.db_m.mark_as_corrected(client_document)
+            self.db_m.mark_as_corrected(producer_document)
+
+        for current_document in unpaired + documents:
 
             # Mark to removal documents without requestInTs immediately (as of bug in xRoad software ver 6.22.0)
             if current_document['requestInTs'] is None and current_document['securityServerType'] is None:
-                to_remove_queue.put(current_document['_id'])
+                to_remove.append(current_document['_id'])
                 no_requestInTs += 1
                 self.db_m.mark_as_corrected(current_document)
                 """
@@ -58,10 +116,10 @@ class CorrectorWorker:
                 continue
 
             # Check if is batch duplicated
-            current_document_hash = doc_m.calculate_hash(current_document)
+            current_document_hash = doc_m.get_hash(current_document)
             if current_document_hash in hash_set:
                 # If yes, mark to removal
-                to_remove_queue.put(current_document['_id'])
+                to_remove.append(current_document['_id'])
                 duplicates += 1
                 self.db_m.mark_as_corrected(current_document)
                 """
@@ -71,8 +129,8 @@ class CorrectorWorker:
                 """
                 continue
 
-            # Check if is database duplicated
-            if self.db_m.check_if_hash_exists(current_document_hash):
+            # Check if is database duplicated, checked for the whole batch by CorrectorBatch
+            if current_document_hash in existing_hashes:
                 # If here, add to batch duplicate cache
                 hash_set.add(current_document_hash)
                 duplicates += 1
@@ -1,15 +1,30 @@
 """ Database Manager - Corrector Module
 """
 
+import collections
+import json
 import time
+import zlib
 from datetime import datetime
 
 import pymongo
+from bson.objectid import ObjectId
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
 
 from .logger_manager import LoggerManager
 
 RAW_DATA_COLLECTION = 'raw_messages'
 CLEAN_DATA_COLLECTION = 'clean_data'
+STATE_COLLECTION = 'corrector_state'
+
+# Format of the chunk documents written by the collector with chunked raw storage
+CHUNK_FORMAT = 'ndjson-zlib'
+
+# Number of hashes in one $in query of get_existing_hashes
+HASH_QUERY_CHUNK = 5000
+
+# Match window of find_by_message_id, in milliseconds
+MATCH_WINDOW = 1 * 60 * 1000
 
 
 def json_serial(obj):
@@ -33,6 +48,113 @@ def get_timestamp():
     return float(time.time())
 
 
+def expand_chunk(chunk):
+    """
+    Returns the records of a raw_messages chunk document as raw documents.
+    The _id of the records refers to the chunk and the position of the record in the chunk.
+    :param chunk: The chunk document.
+    :return: Returns the list of records.
+    """
+    if chunk['chunkFormat'] != CHUNK_FORMAT:
+        raise ValueError('Unknown chunk format: {0}'.format(chunk['chunkFormat']))
+    documents = []
+    lines = zlib.decompress(chunk['records']).decode('utf-8').splitlines()
+    for index, line in enumerate(lines):
+        document = json.loads(line)
+        document['_id'] = {'chunk': chunk['_id'], 'index': index}
+        document['insertTime'] = chunk.get('insertTime')
+        documents.append(document)
+    return documents
+
+
+def get_chunk_id(document):
+    """
+    Returns the _id of the chunk the raw document was expanded from, or None for single raw documents.
+    :param document: The raw document.
+    :return: Returns the chunk _id or None.
+    """
+    doc_id = document.get('_id')
+    if isinstance(doc_id, dict):
+        return doc_id.get('chunk')
+    return None
+
+
+class BulkWriter:
+    """
+    Write buffer of one DatabaseManager. Writes are collected per document _id, so later writes of a document
+    replace its earlier ones (an update of an inserted clean_data document is written as the insert), and are
+    flushed as unordered bulk_write batches. clean_data is flushed before raw_messages, so a raw document is
+    never marked corrected before its clean_data document is stored.
+    """
+
+    def __init__(self, max_ops, max_delay):
+        """
+        :param max_ops: Number of buffered writes that triggers a flush.
+        :param max_delay: Time in seconds from the first buffered write that triggers a flush.
+        """
+        self.max_ops = max_ops
+        self.max_delay = max_delay
+        self.clean_ops = collections.OrderedDict()
+        self.raw_ops = collections.OrderedDict()
+        self.first_time = None
+
+    def __len__(self):
+        return len(self.clean_ops) + len(self.raw_ops)
+
+    def _added(self):
+        if self.first_time is None:
+            self.first_time = time.time()
+
+    def insert_clean(self, document):
+        self.clean_ops[document['_id']] = ('insert', document)
+        self._added()
+
+    def replace_clean(self, document):
+        op = self.clean_ops.get(document['_id'])
+        self.clean_ops[document['_id']] = ('insert' if op is not None and op[0] == 'insert' else 'replace', document)
+        self._added()
+
+    def mark_raw(self, doc_id):
+        if self.raw_ops.get(doc_id) != 'delete':
+            self.raw_ops[doc_id] = 'mark'
+            self._added()
+
+    def delete_raw(self, doc_id):
+        self.raw_ops[doc_id] = 'delete'
+        self._added()
+
+    def get_pending_clean(self, message_id):
+        """
+        Returns the buffered clean_data documents with the messageId.
+        """
+        return [document for _, document in self.clean_ops.values() if document.get('messageId') == message_id]
+
+    def is_full(self):
+        return len(self) >= self.max_ops or (
+            self.first_time is not None and time.time() - self.first_time >= self.max_delay)
+
+    def get_requests(self):
+        """
+        Returns the bulk_write requests of clean_data and raw_messages and empties the buffer.
+        """
+        clean_requests = []
+        for doc_id, (op, document) in self.clean_ops.items():
+            if op == 'insert':
+                clean_requests.append(InsertOne(document))
+            else:
+                clean_requests.append(ReplaceOne({'_id': doc_id}, document))
+        raw_requests = []
+        for doc_id, op in self.raw_ops.items():
+            if op == 'delete':
+                raw_requests.append(DeleteOne({'_id': doc_id}))
+            else:
+                raw_requests.append(UpdateOne({'_id': doc_id}, {'$set': {'corrected': True}}))
+        self.clean_ops = collections.OrderedDict()
+        self.raw_ops = collections.OrderedDict()
+        self.first_time = None
+        return clean_requests, raw_requests
+
+
 class DatabaseManager:
 
     def __init__(self, settings):
@@ -47,6 +169,47 @@ class DatabaseManager:
         self.mdb_database = settings.MONGODB_DATABASE
         uri = "mongodb://{0}:{1}@{2}/auth_db".format(mdb_user, mdb_pwd, mdb_server)
         self.client = pymongo.MongoClient(uri)
+        self.bulk_writer = None
+        self.candidates = None
+
+    def enable_bulk_writes(self, max_ops, max_delay):
+        """
+        Buffers the writes of mark_as_corrected, add_to_clean_data, update_document_clean_data and
+        remove_duplicate_from_raw in a BulkWriter. Buffered clean_data documents are visible to find_by_message_id.
+        flush must be called after the last write.
+        :param max_ops: Number of buffered writes that triggers a flush.
+        :param max_delay: Time in seconds from the first buffered write that triggers a flush.
+        :return: None
+        """
+        self.bulk_writer = BulkWriter(max_ops, max_delay)
+
+    def flush(self):
+        """
+        Writes the buffered writes to the database.
+        :return: None
+        """
+        if self.bulk_writer is None or not len(self.bulk_writer):
+            return
+        clean_requests, raw_requests = self.bulk_writer.get_requests()
+        try:
+            db = self.get_query_db()
+            if clean_requests:
+                db[CLEAN_DATA_COLLECTION].bulk_write(clean_requests, ordered=False)
+            if raw_requests:
+                db[RAW_DATA_COLLECTION].bulk_write(raw_requests, ordered=False)
+        except Exception as e:
+            self.logger_m.log_error('DatabaseManager.flush', '{0}'.format(repr(e)))
+            raise e
+
+    def _buffered(self):
+        """
+        Returns True if the writes are buffered, flushes the buffer if it is full.
+        """
+        if self.bulk_writer is None:
+            return False
+        if self.bulk_writer.is_full():
+            self.flush()
+        return True
 
     def get_query_db(self):
         """
@@ -62,26 +225,79 @@ class DatabaseManager:
         :param document: The input document.
         :return: None
         """
+        if get_chunk_id(document) is not None:
+            # Chunk is marked corrected as a whole, see mark_chunks_as_corrected
+            return
         doc_id = document['_id']
+        if self._buffered():
+            self.bulk_writer.mark_raw(doc_id)
+            return
         db = self.get_query_db()
         raw_data = db[RAW_DATA_COLLECTION]
         raw_data.update_one({"_id": doc_id}, {"$set": {"corrected": True}})
 
+    def mark_chunks_as_corrected(self, chunk_ids):
+        """
+        Marks the chunk documents "corrected" after all their records are processed.
+        :param chunk_ids: List of chunk _id values.
+        :return: None
+        """
+        try:
+            db = self.get_query_db()
+            raw_data = db[RAW_DATA_COLLECTION]
+            raw_data.update_many({"_id": {"$in": chunk_ids}}, {"$set": {"corrected": True}})
+        except Exception as e:
+            self.logger_m.log_error('DatabaseManager.mark_chunks_as_corrected', '{0}'.format(repr(e)))
+            raise e
+
     def get_raw_documents(self, limit=1000):
         """
         Gets number of documents specified by the limit that have not been corrected.
-        Sorted by "requestInTs".
+        Sorted by "requestInTs". Chunk documents are expanded into their records, chunks are not split.
         :param limit: Number of documents to return.
         :return: Returns documents sorted by "requestInTs". Number is specified by the limit.
         """
+        documents, _ = self.get_raw_page(limit)
+        return documents
+
+    def get_raw_page(self, limit=1000, after=None):
+        """
+        Gets the not corrected documents like get_raw_documents, starting after the key of an earlier page.
+        The page is read as a range of the {corrected, requestInTs} index, only the raw documents with the last
+        requestInTs of the earlier page are excluded by _id. Documents inserted with an older requestInTs meanwhile
+        are not returned, they are read by a query without a key.
+        :param limit: Number of documents to return.
+        :param after: Key of the earlier page, None to start from the oldest document.
+        :return: Returns documents sorted by "requestInTs" and the key of the page. The key of an empty page is
+        the after key, so the next page continues from the same position.
+        """
         try:
             db = self.get_query_db()
             raw_data = db[RAW_DATA_COLLECTION]
             q = {"corrected": None}
+            key = None
+            if after is not None:
+                if after['requestInTs'] is not None:
+                    q["requestInTs"] = {"$gte": after['requestInTs']}
+                q["_id"] = {"$nin": after['ids']}
+                key = {'requestInTs': after['requestInTs'], 'ids': list(after['ids'])}
             cursor = raw_data.find(q).sort("requestInTs", 1).limit(limit)
-            return list(cursor)
+            documents = []
+            for document in cursor:
+                request_in_ts = document.get('requestInTs')
+                if key is None or key['requestInTs'] != request_in_ts:
+                    key = {'requestInTs': request_in_ts, 'ids': []}
+                key['ids'].append(document['_id'])
+                if 'chunkFormat' in document:
+                    documents.extend(expand_chunk(document))
+                else:
+                    documents.append(document)
+                if len(documents) >= limit:
+                    break
+            cursor.close()
+            return documents, key
         except Exception as e:
-            self.logger_m.log_error('DatabaseManager.get_raw_documents', '{0}'.format(repr(e)))
+            self.logger_m.log_error('DatabaseManager.get_raw_page', '{0}'.format(repr(e)))
             raise e
 
     def get_timeout_documents_client(self, timeout_days, limit=1000):
@@ -134,9 +350,8 @@ class DatabaseManager:
         request_in_ts = current_doc.get('requestInTs', 0)
 
         # Time window
-        time_1_min = 1 * 60 * 1000
-        start_q_time = request_in_ts - time_1_min
-        end_q_time = request_in_ts + time_1_min
+        start_q_time = request_in_ts - MATCH_WINDOW
+        end_q_time = request_in_ts + MATCH_WINDOW
 
         # Build query
         q = {"messageId": message_id, "correctorStatus": "processing"}
@@ -148,6 +363,78 @@ class DatabaseManager:
             q['client.requestInTs'] = {"$gte": start_q_time, "$lte": end_q_time}
         return q
 
+    @staticmethod
+    def _is_candidate(clean_doc, current_doc):
+        """
+        Checks if the clean_data document matches the query of _build_query.
+        :param clean_doc: The clean_data document.
+        :param current_doc: The input document.
+        :return: Returns True if the document matches.
+        """
+        q = DatabaseManager._build_query(current_doc)
+        if clean_doc.get('messageId') != q['messageId'] or clean_doc.get('correctorStatus') != 'processing':
+            return False
+        if current_doc.get('securityServerType', 'Client') == 'Client':
+            hash_field, other = 'clientHash', 'producer'
+        else:
+            hash_field, other = 'producerHash', 'client'
+        request_in_ts = (clean_doc.get(other) or {}).get('requestInTs')
+        return clean_doc.get(hash_field) is None and request_in_ts is not None and \
+            q[other + '.requestInTs']['$gte'] <= request_in_ts <= q[other + '.requestInTs']['$lte']
+
+    @staticmethod
+    def _candidate_key(document):
+        """
+        Returns the candidate index key of the clean_data document: messageId and the security server type of the
+        missing document, or None if the document is not waiting for a pair.
+        """
+        if document.get('correctorStatus') != 'processing':
+            return None
+        if document.get('clientHash') is None:
+            return document.get('messageId'), 'Client'
+        if document.get('producerHash') is None:
+            return document.get('messageId'), 'Producer'
+        return None
+
+    def _index_candidate(self, document):
+        """
+        Updates the candidate index with the written clean_data document.
+        """
+        if self.candidates is None or document.get('messageId') not in self.candidates['message_ids']:
+            return
+        for side in ('Client', 'Producer'):
+            self.candidates['index'].get((document.get('messageId'), side), {}).pop(document['_id'], None)
+        key = self._candidate_key(document)
+        if key is not None:
+            self.candidates['index'].setdefault(key, collections.OrderedDict())[document['_id']] = document
+
+    def prefetch_candidates(self, message_ids):
+        """
+        Gets the clean_data documents waiting for a pair for all the given messageIds with one query, and keeps them
+        in an index by messageId and the security server type of the missing document. find_by_message_id reads
+        the documents of these messageIds from the index, add_to_clean_data and update_document_clean_data update it.
+        :param message_ids: List of messageId values.
+        :return: None
+        """
+        index = {}
+        try:
+            db = self.get_query_db()
+            clean_data = db[CLEAN_DATA_COLLECTION]
+            q = {"messageId": {"$in": list(set(message_ids))}, "correctorStatus": "processing"}
+            for document in clean_data.find(q):
+                key = self._candidate_key(document)
+                if key is not None:
+                    index.setdefault(key, collections.OrderedDict())[document['_id']] = document
+        except Exception as e:
+            self.logger_m.log_error('DatabaseManager.prefetch_candidates', '{0}'.format(repr(e)))
+            raise e
+        self.candidates = {'message_ids': set(message_ids), 'index': index}
+        if self.bulk_writer is not None:
+            # Buffered versions replace the stored documents
+            for message_id in self.candidates['message_ids']:
+                for document in self.bulk_writer.get_pending_clean(message_id):
+                    self._index_candidate(document)
+
     def find_by_message_id(self, current_doc):
         """
         Get all the documents with given messageId and with correctorStatus "processing".
@@ -156,15 +443,24 @@ class DatabaseManager:
         :param current_doc: The input document.
         :return: Returns a list of all the matching documents.
         """
+        q = self._build_query(current_doc)
+        if self.candidates is not None and q['messageId'] in self.candidates['message_ids']:
+            key = (q['messageId'], current_doc.get('securityServerType', 'Client'))
+            return [dict(doc) for doc in self.candidates['index'].get(key, {}).values()
+                    if self._is_candidate(doc, current_doc)]
         try:
             db = self.get_query_db()
             clean_data = db[CLEAN_DATA_COLLECTION]
-            q = self._build_query(current_doc)
-            curs = clean_data.find(q)
-            return list(curs)
+            documents = list(clean_data.find(q))
         except Exception as e:
             self.logger_m.log_error('DatabaseManager.find_by_message_id', '{0}'.format(repr(e)))
             raise e
+        if self.bulk_writer is not None:
+            # Buffered versions replace the stored documents
+            pending = dict((doc['_id'], doc) for doc in self.bulk_writer.get_pending_clean(q['messageId']))
+            documents = [doc for doc in documents if doc['_id'] not in pending]
+            documents.extend(dict(doc) for doc in pending.values() if self._is_candidate(doc, current_doc))
+        return documents
 
     def add_to_clean_data(self, document):
         """
@@ -172,10 +468,17 @@ class DatabaseManager:
         :param document: The input document.
         :return: None
         """
+        if self._buffered():
+            if '_id' not in document:
+                document['_id'] = ObjectId()
+            self.bulk_writer.insert_clean(document)
+            self._index_candidate(document)
+            return
         try:
             db = self.get_query_db()
             clean_data = db[CLEAN_DATA_COLLECTION]
             clean_data.insert_one(document)
+            self._index_candidate(document)
         except Exception as e:
             self.logger_m.log_error('DatabaseManager.add_to_clean_data', '{0}'.format(repr(e)))
             raise e
@@ -187,10 +490,15 @@ class DatabaseManager:
         :param document: The input document.
         :return: None.
         """
+        if self._buffered():
+            self.bulk_writer.replace_clean(document)
+            self._index_candidate(document)
+            return
         try:
             db = self.get_query_db()
             clean_data = db[CLEAN_DATA_COLLECTION]
             clean_data.update({"_id": document["_id"]}, document)
+            self._index_candidate(document)
         except Exception as e:
             self.logger_m.log_error('DatabaseManager.update_form_clean_data', '{0}'.format(repr(e)))
             raise e
@@ -234,12 +542,40 @@ class DatabaseManager:
             raise e
         return False
 
+    def get_existing_hashes(self, hashes):
+        """
+        Checks which of the given hashes exist in the clean_data, with one query per hash field for every
+        HASH_QUERY_CHUNK hashes.
+        :param hashes: Iterable of document hashes.
+        :return: Returns the set of hashes that exist.
+        """
+        existing = set()
+        hashes = list(hashes)
+        try:
+            db = self.get_query_db()
+            clean_data = db[CLEAN_DATA_COLLECTION]
+            for i in range(0, len(hashes), HASH_QUERY_CHUNK):
+                chunk = hashes[i:i + HASH_QUERY_CHUNK]
+                for field in ('clientHash', 'producerHash'):
+                    for doc in clean_data.find({field: {'$in': chunk}}, {field: 1, '_id': 0}):
+                        existing.add(doc[field])
+        except Exception as e:
+            self.logger_m.log_error('DatabaseManager.get_existing_hashes', '{0}'.format(repr(e)))
+            raise e
+        return existing
+
     def remove_duplicate_from_raw(self, message_id):
         """
         Removes the duplicated document from "raw_messages".
         :param message_id: The document ID. NB: This is not "messageId"!
         :return: None
         """
+        if isinstance(message_id, dict):
+            # Records of chunks are kept in the chunk
+            return
+        if self._buffered():
+            self.bulk_writer.delete_raw(message_id)
+            return
         try:
             db = self.get_query_db()
             raw_messages = db[RAW_DATA_COLLECTION]
@@ -247,3 +583,54 @@ class DatabaseManager:
         except Exception as e:
             self.logger_m.log_error('DatabaseManager.remove_duplicate_from_raw', '{0}'.format(repr(e)))
             raise e
+
+    def watch_raw_inserts(self, resume_token=None, max_await_ms=1000):
+        """
+        Opens a change stream of the documents inserted into "raw_messages". The events contain only the resume
+        token and the operation type. Change streams need a replica set.
+        :param resume_token: The resume token of the last handled event, None to start from now.
+        :param max_await_ms: Time in milliseconds the server waits for new events on a try_next of the stream.
+        :return: Returns the change stream, None if the installed pymongo does not support change streams.
+        """
+        try:
+            db = self.get_query_db()
+            raw_messages = db[RAW_DATA_COLLECTION]
+            if not hasattr(raw_messages, 'watch'):
+                return None
+            pipeline = [{'$match': {'operationType': 'insert'}}, {'$project': {'operationType': 1}}]
+            return raw_messages.watch(pipeline, resume_after=resume_token, max_await_time_ms=max_await_ms)
+        except Exception as e:
+            self.logger_m.log_error('DatabaseManager.watch_raw_inserts', '{0}'.format(repr(e)))
+            raise e
+
+    def get_resume_token(self, corrector_id):
+        """
+        Gets the stored change stream resume token of the corrector.
+        :param corrector_id: The CORRECTOR_ID.
+        :return: Returns the resume token, None if not stored.
+        """
+        try:
+            db = self.get_query_db()
+            state = db[STATE_COLLECTION].find_one({'_id': corrector_id})
+        except Exception as e:
+            self.logger_m.log_error('DatabaseManager.get_resume_token', '{0}'.format(repr(e)))
+            raise e
+        if state is None:
+            return None
+        return state.get('resumeToken')
+
+    def save_resume_token(self, corrector_id, resume_token):
+        """
+        Stores the change stream resume token of the corrector.
+        :param corrector_id: The CORRECTOR_ID.
+        :param resume_token: The resume token, None removes the stored token.
+        :return: None
+        """
+        try:
+            db = self.get_query_db()
+            db[STATE_COLLECTION].update_one(
+                {'_id': corrector_id}, {'$set': {'resumeToken': resume_token, 'updated': get_timestamp()}},
+                upsert=True)
+        except Exception as e:
+            self.logger_m.log_error('DatabaseManager.save_resume_token', '{0}'.format(repr(e)))
+            raise e
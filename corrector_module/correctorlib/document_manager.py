@@ -6,6 +6,18 @@ import hashlib
 
 from .logger_manager import LoggerManager
 
+# Version of recordHash stored by the collector that equals calculate_hash
+RECORD_HASH_VERSION = 1
+
+# Fields that are not part of the document content
+HASH_EXCLUDED_FIELDS = ('_id', 'insertTime', 'corrected', 'recordHash', 'recordHashVersion', 'serviceCallKey')
+
+# Fields identifying a service call, see serviceCallKey
+SERVICE_CALL_FIELDS = (
+    'clientMemberClass', 'clientMemberCode', 'clientXRoadInstance', 'clientSubsystemCode', 'serviceCode',
+    'serviceVersion', 'serviceMemberClass', 'serviceMemberCode', 'serviceXRoadInstance', 'serviceSubsystemCode'
+)
+
 
 class DocumentManager:
     def __init__(self, settings):
@@ -345,6 +357,39 @@ class DocumentManager:
                 return cur_document
         return None
 
+    def pair_documents(self, documents, max_time_diff):
+        """
+        Pairs the Client and Producer documents of one messageId with the regular match rules.
+        :param documents: The documents of one messageId, after correct_structure.
+        :param max_time_diff: Maximum difference of the requestInTs values of a pair, in milliseconds.
+        :return: Returns the list of (client, producer) pairs and the list of documents not paired.
+        """
+        producers = [doc for doc in documents if doc.get('securityServerType') == 'Producer']
+        pairs = []
+        for client in documents:
+            if client.get('securityServerType') != 'Client':
+                continue
+            for producer in producers:
+                if client['requestInTs'] is not None and producer['requestInTs'] is not None \
+                        and abs(client['requestInTs'] - producer['requestInTs']) <= max_time_diff \
+                        and self.match_documents(client, {'producer': producer}):
+                    pairs.append((client, producer))
+                    producers.remove(producer)
+                    break
+        paired = set(id(doc) for pair in pairs for doc in pair)
+        return pairs, [doc for doc in documents if id(doc) not in paired]
+
+    @staticmethod
+    def get_service_call_key(document):
+        """
+        Returns the serviceCallKey stored by the collector, or builds it from the service call fields.
+        :param document: The raw document.
+        :return: Returns the service call fields joined with '/', missing fields are empty.
+        """
+        if document.get('serviceCallKey') is not None:
+            return document['serviceCallKey']
+        return '/'.join(document.get(f) or '' for f in SERVICE_CALL_FIELDS)
+
     @staticmethod
     def create_json(client_document, producer_document, client_hash, producer_hash, message_id):
         """
@@ -359,6 +404,9 @@ class DocumentManager:
         created_document = {'client': client_document, 'producer': producer_document, 'clientHash': client_hash,
                             'producerHash': producer_hash,
                             'messageId': message_id}
+        raw_document = client_document if client_document is not None else producer_document
+        if raw_document is not None:
+            created_document['serviceCallKey'] = DocumentManager.get_service_call_key(raw_document)
         return created_document
 
     def correct_structure(self, doc):
@@ -375,7 +423,8 @@ class DocumentManager:
     @staticmethod
     def calculate_hash(_document):
         """
-        Hash the given document with MD5 and remove _id & insertTime parameters.
+        Hash the given document with MD5 and remove _id, insertTime and the record keys stored by the collector.
+        The hashed string is formatted as str() of the sorted OrderedDict in Python 3.5 - 3.11.
         :param _document: The input documents.
         :return: Returns the monitoringDataTs_document_hash string.
         """
@@ -383,9 +432,18 @@ class DocumentManager:
         doc_hash = None
         if document is not None:
             od = collections.OrderedDict(sorted(document.items()))
-            od.pop('_id', None)
-            od.pop('insertTime', None)
-            od.pop('corrected', None)
-            json_str = str(od)
+            for field in HASH_EXCLUDED_FIELDS:
+                od.pop(field, None)
+            json_str = 'OrderedDict([{0}])'.format(', '.join('({0!r}, {1!r})'.format(k, v) for k, v in od.items()))
             doc_hash = hashlib.md5(json_str.encode('utf-8')).hexdigest()
         return "{0}_{1}".format(document['monitoringDataTs'], doc_hash)
+
+    def get_hash(self, document):
+        """
+        Returns the recordHash calculated by the collector when the documents was inserted, or calculates the hash.
+        :param document: The input document, after correct_structure.
+        :return: Returns the monitoringDataTs_document_hash string.
+        """
+        if document.get('recordHashVersion') == RECORD_HASH_VERSION and document.get('recordHash') is not None:
+            return document['recordHash']
+        return self.calculate_hash(document)
@@ -0,0 +1,56 @@
+""" Hash Cache - Corrector Module
+"""
+
+import collections
+
+
+class HashCache:
+    """
+    Bounded LRU set of document hashes known to exist in clean_data. The cache lives in the corrector service
+    process and is kept across batches, so recently stored hashes are not queried from the database again.
+    Only existing hashes are cached, a hash not in the cache is always checked from the database.
+    """
+
+    def __init__(self, max_size):
+        """
+        :param max_size: Maximum number of hashes kept, the least recently used hashes are dropped first.
+        """
+        self.max_size = max_size
+        self.hashes = collections.OrderedDict()
+
+    def __contains__(self, doc_hash):
+        return doc_hash in self.hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add_many(self, hashes):
+        """
+        Adds the hashes as the most recently used ones.
+        :param hashes: Iterable of hashes.
+        :return: None
+        """
+        if self.max_size <= 0:
+            return
+        for doc_hash in hashes:
+            if doc_hash in self.hashes:
+                self.hashes.move_to_end(doc_hash)
+            else:
+                self.hashes[doc_hash] = None
+        while len(self.hashes) > self.max_size:
+            self.hashes.popitem(last=False)
+
+    def split(self, hashes):
+        """
+        Splits the hashes to the cached ones and the ones to be checked from the database.
+        :param hashes: Iterable of hashes.
+        :return: Returns the set of cached hashes and the set of other hashes.
+        """
+        known = set()
+        unknown = set()
+        for doc_hash in hashes:
+            if doc_hash in self.hashes:
+                known.add(doc_hash)
+            else:
+                unknown.add(doc_hash)
+        return known, unknown
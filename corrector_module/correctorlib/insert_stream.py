@@ -0,0 +1,86 @@
+""" Insert Stream - Corrector Module
+"""
+
+import time
+
+import pymongo.errors
+
+
+class InsertStream:
+    """
+    Micro-batches of the inserts into raw_messages, read from a MongoDB change stream. The corrector batch is started
+    as soon as a micro-batch is complete instead of waiting WAIT_FROM_DONE seconds. The events only trigger the
+    batches, the batch itself still queries the not corrected raw documents, so an event lost or read twice does not
+    change the result. The resume token of the last event handled by a successful batch is stored in the
+    corrector_state collection, a restarted corrector continues from there.
+    """
+
+    def __init__(self, db_m, logger_m, corrector_id, max_docs, max_wait):
+        """
+        :param db_m: The DatabaseManager.
+        :param logger_m: The LoggerManager.
+        :param corrector_id: The CORRECTOR_ID, key of the stored resume token.
+        :param max_docs: Number of inserts that completes a micro-batch.
+        :param max_wait: Time in seconds from the first insert that completes a micro-batch.
+        """
+        self.db_m = db_m
+        self.logger_m = logger_m
+        self.corrector_id = corrector_id
+        self.max_docs = max_docs
+        self.max_wait = max_wait
+        self.stream = None
+        self.resume_token = None
+
+    def open(self):
+        """
+        Opens the change stream from the stored resume token. If the stream can not be resumed, e.g. the token is
+        no longer in the oplog, the stream is opened from now.
+        :return: Returns True if the stream is open, False if change streams are not supported.
+        """
+        self.resume_token = self.db_m.get_resume_token(self.corrector_id)
+        if self.resume_token is not None:
+            try:
+                self.stream = self.db_m.watch_raw_inserts(self.resume_token)
+                return self.stream is not None
+            except pymongo.errors.OperationFailure as e:
+                self.logger_m.log_warning('corrector_insert_stream',
+                                          'Can not resume the change stream: {0}'.format(repr(e)))
+                self.resume_token = None
+        self.stream = self.db_m.watch_raw_inserts()
+        return self.stream is not None
+
+    def close(self):
+        """
+        Closes the change stream.
+        :return: None
+        """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def wait(self, timeout):
+        """
+        Waits for a micro-batch of inserts: returns max_wait seconds after the first insert or after max_docs
+        inserts. The server holds each try_next until an event arrives, so waiting does not poll the database.
+        :param timeout: Time in seconds to wait for the first insert.
+        :return: Returns the number of inserts, 0 if there were none in timeout seconds.
+        """
+        count = 0
+        deadline = time.time() + timeout
+        while count < self.max_docs and time.time() < deadline:
+            change = self.stream.try_next()
+            if change is None:
+                continue
+            if count == 0:
+                deadline = time.time() + self.max_wait
+            count += 1
+            self.resume_token = change['_id']
+        return count
+
+    def save(self):
+        """
+        Stores the resume token of the last insert read, called after the batch handling the inserts succeeded.
+        :return: None
+        """
+        if self.resume_token is not None:
+            self.db_m.save_resume_token(self.corrector_id, self.resume_token)
@@ -0,0 +1,179 @@
+""" Worker Pool - Corrector Module
+"""
+
+import multiprocessing
+import queue
+import time
+import zlib
+
+from .corrector_worker import CorrectorWorker
+
+
+def get_partition(message_id, count):
+    """
+    Returns the partition of the messageId, a messageId is always processed by the same worker.
+    :param message_id: The messageId.
+    :param count: Number of partitions.
+    :return: Returns the partition number from 0 to count - 1.
+    """
+    return zlib.crc32('{0}'.format(message_id or '').encode('utf-8')) % count
+
+
+def get_partition_chunks(groups, count, chunk_size):
+    """
+    Partitions the messageId groups by messageId and splits the partitions into chunks.
+    :param groups: List of messageId groups, dicts with key 'message_id'.
+    :param count: Number of partitions.
+    :param chunk_size: Maximum number of groups in a chunk.
+    :return: Returns the list of (partition, chunk) tuples.
+    """
+    partitions = [[] for _ in range(count)]
+    for data in groups:
+        partitions[get_partition(data['message_id'], count)].append(data)
+    return [(partition, part[i:i + chunk_size]) for partition, part in enumerate(partitions)
+            for i in range(0, len(part), chunk_size)]
+
+
+class WorkerPool:
+    """
+    Long-lived corrector worker processes. The workers keep their database connections and managers between the
+    batches, batches are submitted as chunks of messageId groups to the queue of the worker of their partition,
+    see get_partition. run_batch watches the batch: a worker that died
+    or was killed is replaced and its chunk is reported as failed, and if the batch does not finish in time all
+    workers are replaced.
+    """
+
+    def __init__(self, settings, size, logger_m):
+        """
+        :param settings: The Corrector settings.
+        :param size: Number of worker processes.
+        :param logger_m: The LoggerManager.
+        """
+        self.settings = settings
+        self.size = size
+        self.logger_m = logger_m
+        self.task_queues = {}
+        self.result_queue = None
+        self.workers = {}
+        self.current_chunks = {}
+        # Chunk ids are unique over the batches
+        self.next_chunk_id = 0
+
+    def _start_worker(self, name):
+        # Shared memory is written at once, a message could be lost if the worker is killed
+        self.current_chunks[name] = multiprocessing.Value('q', -1, lock=False)
+        worker = CorrectorWorker(self.settings, name)
+        p = multiprocessing.Process(target=worker.serve,
+                                    args=(self.task_queues[name], self.result_queue, self.current_chunks[name]))
+        p.daemon = True
+        p.start()
+        return p
+
+    def start(self):
+        """
+        Starts the worker processes.
+        :return: None
+        """
+        self.result_queue = multiprocessing.Queue()
+        self.task_queues = dict((self._get_name(i), multiprocessing.Queue()) for i in range(self.size))
+        self.workers = dict((name, self._start_worker(name)) for name in self.task_queues)
+
+    @staticmethod
+    def _get_name(partition):
+        return 'worker_{0}'.format(partition)
+
+    def stop(self, timeout=10):
+        """
+        Stops the worker processes, the workers not stopped in timeout seconds are terminated.
+        :return: None
+        """
+        for name in self.workers:
+            self.task_queues[name].put(None)
+        for p in self.workers.values():
+            p.join(timeout)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        self.workers = {}
+
+    def recycle(self):
+        """
+        Terminates all the workers and starts new ones.
+        :return: None
+        """
+        for p in self.workers.values():
+            p.terminate()
+        for p in self.workers.values():
+            p.join()
+        self.start()
+
+    def _replace_dead_workers(self):
+        """
+        Starts new workers in place of the stopped ones.
+        :return: Returns the names of the replaced workers.
+        """
+        replaced = []
+        for name, p in list(self.workers.items()):
+            if not p.is_alive():
+                p.join()
+                self.workers[name] = self._start_worker(name)
+                replaced.append(name)
+        return replaced
+
+    def run_batch(self, groups, chunk_size, timeout):
+        """
+        Processes the messageId groups and waits for the results.
+        :param groups: List of messageId groups, see CorrectorWorker.consume_data.
+        :param chunk_size: Maximum number of groups given to a worker at a time.
+        :param timeout: Time in seconds the batch may take, after that all workers are replaced.
+        :return: Returns True if all chunks succeeded, the number of duplicates and the list of raw document _id
+        values to be removed.
+        """
+        # Workers stopped after CORRECTOR_WORKER_MAX_CHUNKS chunks or killed between the batches
+        self._replace_dead_workers()
+        pending = set()
+        for partition, chunk in get_partition_chunks(groups, self.size, chunk_size):
+            self.task_queues[self._get_name(partition)].put((self.next_chunk_id, chunk))
+            pending.add(self.next_chunk_id)
+            self.next_chunk_id += 1
+        succeeded = True
+        duplicates = 0
+        to_remove = []
+        deadline = time.time() + timeout
+
+        while pending:
+            if time.time() > deadline:
+                self.logger_m.log_error('corrector_worker_pool', 'Batch not finished in {0} seconds, {1} chunks '
+                                                                 'pending. Restarting workers.'.format(timeout, len(pending)))
+                self.recycle()
+                return False, duplicates, to_remove
+            try:
+                messages = [self.result_queue.get(True, 1)]
+            except queue.Empty:
+                messages = []
+            dead = [name for name, p in self.workers.items() if not p.is_alive()]
+            if dead:
+                # Results sent before the worker stopped are read first
+                while True:
+                    try:
+                        messages.append(self.result_queue.get_nowait())
+                    except queue.Empty:
+                        break
+            for message in messages:
+                status, name, chunk_id = message[0:3]
+                pending.discard(chunk_id)
+                if status == 'done':
+                    duplicates += message[3]
+                    to_remove.extend(message[4])
+                else:
+                    succeeded = False
+            for name in dead:
+                chunk_id = self.current_chunks[name].value
+                if chunk_id in pending:
+                    pending.discard(chunk_id)
+                    succeeded = False
+                    self.logger_m.log_warning('corrector_worker_pool', '{0} stopped while processing chunk {1}'.format(
+                        name, chunk_id))
+            if dead:
+                self._replace_dead_workers()
+        return succeeded, duplicates, to_remove
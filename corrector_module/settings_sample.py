@@ -46,6 +46,29 @@ class Settings:
     # Time window to match documents (in milliseconds)
     # TIME_WINDOW = 1 * 60 * 1000
     TIME_WINDOW = 10 * 60 * 1000
+    # Number of document hashes kept between batches to skip their duplicate check queries
+    CORRECTOR_HASH_CACHE_SIZE = 500000
+    # Writes of a worker are buffered and written with bulk_write of CORRECTOR_BULK_SIZE writes,
+    # or when the first buffered write is older than CORRECTOR_BULK_DELAY seconds
+    CORRECTOR_BULK_SIZE = 1000
+    CORRECTOR_BULK_DELAY = 5
+    # Number of messageId groups in a chunk given to a worker, their pairing candidates are queried with one query
+    CORRECTOR_PREFETCH_SIZE = 100
+    # Worker processes are kept between the batches. A worker is replaced after CORRECTOR_WORKER_MAX_CHUNKS chunks,
+    # all workers are replaced if a batch takes longer than CORRECTOR_BATCH_TIMEOUT seconds
+    CORRECTOR_WORKER_MAX_CHUNKS = 10000
+    CORRECTOR_BATCH_TIMEOUT = 3600
+    # Batches are run as a pipeline: the fetch of the next batch and the cleanup of the previous batch run at the
+    # same time with the workers. Number of batches waiting between the stages, 0 runs one batch at a time
+    CORRECTOR_PIPELINE_SIZE = 1
+    # 'polling': a batch with few documents is followed by WAIT_FROM_DONE seconds of sleep.
+    # 'stream': the next batch is started by the inserts into raw_messages, read from a change stream
+    # (MongoDB replica set needed). The batch starts CORRECTOR_STREAM_MAX_WAIT seconds after the first insert
+    # or after CORRECTOR_STREAM_MAX_DOCS inserts, and at the latest in WAIT_FROM_DONE seconds.
+    # Falls back to polling if the change stream is not available.
+    CORRECTOR_MODE = 'polling'
+    CORRECTOR_STREAM_MAX_DOCS = 1000
+    CORRECTOR_STREAM_MAX_WAIT = 5
 
     CALC_TOTAL_DURATION = True
     CALC_CLIENT_SS_REQUEST_DURATION = True
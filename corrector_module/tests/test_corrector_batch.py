@@ -0,0 +1,143 @@
+import tempfile
+import threading
+import unittest
+
+from corrector_module.correctorlib.corrector_batch import CorrectorBatch
+from corrector_module.correctorlib.document_manager import DocumentManager
+from corrector_module.correctorlib.hash_cache import HashCache
+from corrector_module.tests import unit_helper
+from corrector_module.tests.unit_settings import Settings
+
+
+class FakeDatabaseManager:
+    def __init__(self, documents):
+        self.lock = threading.Lock()
+        self.raw = dict((doc['_id'], doc) for doc in documents)
+        self.stored_hashes = set()
+        self.fetches = []
+
+    def get_raw_page(self, limit=1000, after=None):
+        with self.lock:
+            documents = [doc.copy() for doc in sorted(self.raw.values(), key=lambda d: d['requestInTs'])
+                         if not doc.get('corrected')]
+            if after is not None:
+                documents = [doc for doc in documents if doc['requestInTs'] >= after['requestInTs']
+                             and doc['_id'] not in after['ids']]
+            documents = documents[:limit]
+            self.fetches.append([doc['_id'] for doc in documents])
+        if not documents:
+            return documents, after
+        last = documents[-1]['requestInTs']
+        return documents, {'requestInTs': last, 'ids': [doc['_id'] for doc in documents
+                                                        if doc['requestInTs'] == last]}
+
+    def get_existing_hashes(self, hashes):
+        with self.lock:
+            return set(hashes) & self.stored_hashes
+
+    def mark_corrected(self, doc_id, doc_hash):
+        with self.lock:
+            self.raw[doc_id]['corrected'] = True
+            self.stored_hashes.add(doc_hash)
+
+    def remove_duplicate_from_raw(self, doc_id):
+        with self.lock:
+            del self.raw[doc_id]
+
+    def get_timeout_documents_client(self, timeout_days, limit=1000):
+        return []
+
+    def get_timeout_documents_producer(self, timeout_days, limit=1000):
+        return []
+
+    def update_old_to_done(self, list_of_docs):
+        return 0
+
+    def mark_chunks_as_corrected(self, chunk_ids):
+        pass
+
+    def enable_bulk_writes(self, max_ops, max_delay):
+        pass
+
+    def flush(self):
+        pass
+
+
+class FakePool:
+    # Stores the documents like the workers, a document with an existing hash is a duplicate
+    def __init__(self, db_m, doc_m):
+        self.db_m = db_m
+        self.doc_m = doc_m
+        self.batches = []
+        self.fetches_while_processing = []
+
+    def run_batch(self, groups, chunk_size, timeout):
+        fetches = len(self.db_m.fetches)
+        # Next batch is fetched before this one is stored
+        for _ in range(100):
+            if len(self.db_m.fetches) > fetches:
+                break
+            threading.Event().wait(0.01)
+        self.fetches_while_processing.append(len(self.db_m.fetches) - fetches)
+        self.batches.append(groups)
+        duplicates = 0
+        to_remove = []
+        for data in groups:
+            documents = data['documents'] + [doc for pair in data['pairs'] for doc in pair]
+            for doc in documents:
+                doc_hash = self.doc_m.get_hash(doc)
+                if doc_hash in data['existing_hashes']:
+                    duplicates += 1
+                    to_remove.append(doc['_id'])
+                else:
+                    self.db_m.mark_corrected(doc['_id'], doc_hash)
+        return True, duplicates, to_remove
+
+
+class TestCorrectorBatch(unittest.TestCase):
+    def setUp(self):
+        self.settings = Settings()
+        self.settings.HEARTBEAT_LOGGER_PATH = tempfile.mkdtemp()
+        self.settings.HEARTBEAT_FILE = 'heartbeat.json'
+        self.settings.CORRECTOR_DOCUMENTS_LIMIT = 10
+        documents = []
+        for i in range(20):
+            client, producer = unit_helper.create_raw_document_pair()
+            client['_id'] = 'client_{0}'.format(i)
+            producer['_id'] = 'producer_{0}'.format(i)
+            client['requestInTs'] = i * 100000
+            producer['requestInTs'] = i * 100000 + 1
+            documents.extend([client, producer])
+        # Duplicate of the last document of the first batch, fetched while the first batch is processed
+        duplicate = documents[9].copy()
+        duplicate['_id'] = 'duplicate'
+        documents.append(duplicate)
+        self.db_m = FakeDatabaseManager(documents)
+        self.pool = FakePool(self.db_m, DocumentManager(self.settings))
+
+    def run_batch(self):
+        c_batch = CorrectorBatch(self.settings, HashCache(0), self.pool)
+        c_batch.db_m = self.db_m
+        process_dict = {'doc_len': -1}
+        c_batch.run(process_dict)
+        return c_batch, process_dict['doc_len']
+
+    def test_pipeline(self):
+        c_batch, doc_len = self.run_batch()
+        self.assertEqual(doc_len, 42)
+        # Five batches, the last one is not full
+        self.assertEqual([len(ids) for ids in self.db_m.fetches], [10, 10, 10, 10, 1])
+        fetched = [doc_id for ids in self.db_m.fetches for doc_id in ids]
+        self.assertEqual(len(fetched), len(set(fetched)))
+        self.assertEqual(self.pool.fetches_while_processing[0], 1)
+        self.assertIn('duplicate', self.db_m.fetches[1])
+        self.assertNotIn('duplicate', self.db_m.raw)
+        self.assertTrue(all(doc.get('corrected') for doc in self.db_m.raw.values()))
+        self.assertEqual(c_batch.claimed_hashes, set())
+
+    def test_sequential(self):
+        self.settings.CORRECTOR_PIPELINE_SIZE = 0
+        c_batch, doc_len = self.run_batch()
+        self.assertEqual(doc_len, 10)
+        self.assertEqual(len(self.db_m.fetches), 1)
+        self.assertEqual(self.pool.fetches_while_processing, [0])
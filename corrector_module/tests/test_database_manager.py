@@ -0,0 +1,185 @@
+import json
+import unittest
+import zlib
+
+from bson.objectid import ObjectId
+from pymongo import DeleteOne, InsertOne, UpdateOne
+
+from corrector_module.correctorlib import database_manager
+from corrector_module.tests.unit_settings import Settings
+
+
+def create_chunk(records):
+    data = ''.join(json.dumps(record) + '\n' for record in records)
+    return {'_id': ObjectId(), 'chunkFormat': database_manager.CHUNK_FORMAT, 'recordCount': len(records),
+            'requestInTs': min(record['requestInTs'] for record in records), 'insertTime': 1500000000.0,
+            'records': zlib.compress(data.encode('utf-8'))}
+
+
+class TestRawChunks(unittest.TestCase):
+    def test_expand_chunk(self):
+        records = [{'messageId': 'a', 'requestInTs': 2000, 'monitoringDataTs': 2},
+                   {'messageId': 'b', 'requestInTs': 1000, 'monitoringDataTs': 1}]
+        chunk = create_chunk(records)
+        documents = database_manager.expand_chunk(chunk)
+        self.assertEqual(len(documents), 2)
+        for index, document in enumerate(documents):
+            self.assertEqual(document['_id'], {'chunk': chunk['_id'], 'index': index})
+            self.assertEqual(document['insertTime'], 1500000000.0)
+            self.assertEqual(document['messageId'], records[index]['messageId'])
+            self.assertEqual(database_manager.get_chunk_id(document), chunk['_id'])
+
+    def test_unknown_chunk_format(self):
+        chunk = create_chunk([{'requestInTs': 1000}])
+        chunk['chunkFormat'] = 'unknown'
+        with self.assertRaises(ValueError):
+            database_manager.expand_chunk(chunk)
+
+    def test_single_document(self):
+        self.assertIsNone(database_manager.get_chunk_id({'_id': ObjectId()}))
+
+
+class FakeCollection:
+    def __init__(self, documents=None):
+        self.documents = documents or []
+        self.requests = []
+        self.queries = 0
+
+    def find(self, q):
+        self.queries += 1
+        message_ids = q['messageId']['$in'] if isinstance(q['messageId'], dict) else [q['messageId']]
+        return [dict(doc) for doc in self.documents if doc['messageId'] in message_ids]
+
+    def bulk_write(self, requests, ordered=True):
+        self.requests.append((requests, ordered))
+
+
+class TestBulkWrites(unittest.TestCase):
+    def setUp(self):
+        self.db = {database_manager.CLEAN_DATA_COLLECTION: FakeCollection(),
+                   database_manager.RAW_DATA_COLLECTION: FakeCollection()}
+        self.db_m = database_manager.DatabaseManager(Settings())
+        self.db_m.get_query_db = lambda: self.db
+        self.db_m.enable_bulk_writes(100, 60)
+
+    def test_insert_and_update_written_as_insert(self):
+        client = {'messageId': 'a', 'securityServerType': 'Client', 'requestInTs': 1000}
+        document = {'messageId': 'a', 'correctorStatus': 'processing', 'clientHash': 'h1', 'producerHash': None,
+                    'client': client, 'producer': None}
+        self.db_m.add_to_clean_data(document)
+        self.db_m.mark_as_corrected({'_id': 1})
+
+        # Buffered document is found by the producer
+        producer = {'messageId': 'a', 'securityServerType': 'Producer', 'requestInTs': 1010}
+        candidates = self.db_m.find_by_message_id(producer)
+        self.assertEqual([doc['_id'] for doc in candidates], [document['_id']])
+        merged = candidates[0]
+        merged['producer'] = producer
+        merged['producerHash'] = 'h2'
+        merged['correctorStatus'] = 'done'
+        self.db_m.update_document_clean_data(merged)
+        self.db_m.mark_as_corrected({'_id': 2})
+        self.assertEqual(self.db_m.find_by_message_id(producer), [])
+
+        self.db_m.flush()
+        clean_requests, ordered = self.db[database_manager.CLEAN_DATA_COLLECTION].requests[0]
+        self.assertFalse(ordered)
+        self.assertEqual(clean_requests, [InsertOne(merged)])
+        raw_requests, _ = self.db[database_manager.RAW_DATA_COLLECTION].requests[0]
+        self.assertEqual(raw_requests, [UpdateOne({'_id': 1}, {'$set': {'corrected': True}}),
+                                        UpdateOne({'_id': 2}, {'$set': {'corrected': True}})])
+
+    def test_flush_when_full(self):
+        self.db_m.enable_bulk_writes(2, 60)
+        self.db_m.remove_duplicate_from_raw(1)
+        self.db_m.remove_duplicate_from_raw(2)
+        self.assertEqual(self.db[database_manager.RAW_DATA_COLLECTION].requests, [])
+        self.db_m.remove_duplicate_from_raw(3)
+        raw_requests, _ = self.db[database_manager.RAW_DATA_COLLECTION].requests[0]
+        self.assertEqual(raw_requests, [DeleteOne({'_id': 1}), DeleteOne({'_id': 2})])
+
+    def test_prefetch_candidates(self):
+        clean_data = self.db[database_manager.CLEAN_DATA_COLLECTION]
+        clean_data.documents = [
+            {'_id': 1, 'messageId': 'a', 'correctorStatus': 'processing', 'clientHash': 'h1', 'producerHash': None,
+             'client': {'requestInTs': 1000}, 'producer': None},
+            {'_id': 2, 'messageId': 'b', 'correctorStatus': 'processing', 'clientHash': None, 'producerHash': 'h2',
+             'client': None, 'producer': {'requestInTs': 1000}}]
+        self.db_m.prefetch_candidates(['a', 'b', 'c'])
+        self.assertEqual(clean_data.queries, 1)
+
+        producer_a = {'messageId': 'a', 'securityServerType': 'Producer', 'requestInTs': 1010}
+        client_b = {'messageId': 'b', 'securityServerType': 'Client', 'requestInTs': 1010}
+        self.assertEqual([doc['_id'] for doc in self.db_m.find_by_message_id(producer_a)], [1])
+        self.assertEqual([doc['_id'] for doc in self.db_m.find_by_message_id(client_b)], [2])
+        # Outside the time window or the same side
+        self.assertEqual(self.db_m.find_by_message_id(dict(producer_a, requestInTs=1000 + 2 * 60 * 1000)), [])
+        self.assertEqual(self.db_m.find_by_message_id(dict(producer_a, securityServerType='Client')), [])
+
+        # Index is updated by the writes
+        merged = self.db_m.find_by_message_id(producer_a)[0]
+        merged['producerHash'] = 'h3'
+        merged['correctorStatus'] = 'done'
+        self.db_m.update_document_clean_data(merged)
+        self.assertEqual(self.db_m.find_by_message_id(producer_a), [])
+        client_c = {'messageId': 'c', 'securityServerType': 'Client', 'requestInTs': 1000}
+        self.db_m.add_to_clean_data({'messageId': 'c', 'correctorStatus': 'processing', 'clientHash': 'h4',
+                                     'producerHash': None, 'client': client_c, 'producer': None})
+        self.assertEqual(len(self.db_m.find_by_message_id(dict(client_c, securityServerType='Producer'))), 1)
+        self.assertEqual(clean_data.queries, 1)
+
+
+class FakeRawCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, field, direction):
+        self.documents.sort(key=lambda doc: doc[field])
+        return self
+
+    def limit(self, limit):
+        self.documents = self.documents[:limit]
+        return self
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def close(self):
+        pass
+
+
+class FakeRawCollection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+
+    def find(self, q):
+        self.queries.append(q)
+        documents = [doc for doc in self.documents if not doc.get('corrected')]
+        if 'requestInTs' in q:
+            documents = [doc for doc in documents if doc['requestInTs'] >= q['requestInTs']['$gte']]
+        if '_id' in q:
+            documents = [doc for doc in documents if doc['_id'] not in q['_id']['$nin']]
+        return FakeRawCursor([dict(doc) for doc in documents])
+
+
+class TestRawPages(unittest.TestCase):
+    def test_pages_after_key(self):
+        documents = [{'_id': i, 'messageId': str(i), 'requestInTs': 1000 + i // 3} for i in range(7)]
+        raw_messages = FakeRawCollection(documents)
+        db_m = database_manager.DatabaseManager(Settings())
+        db_m.get_query_db = lambda: {database_manager.RAW_DATA_COLLECTION: raw_messages}
+
+        page, key = db_m.get_raw_page(4)
+        self.assertEqual([doc['_id'] for doc in page], [0, 1, 2, 3])
+        self.assertEqual(key, {'requestInTs': 1001, 'ids': [3]})
+        # Only the documents with the last requestInTs are excluded by _id, the rest by the range
+        page, key = db_m.get_raw_page(4, key)
+        self.assertEqual(raw_messages.queries[-1], {'corrected': None, 'requestInTs': {'$gte': 1001}, '_id': {'$nin': [3]}})
+        self.assertEqual([doc['_id'] for doc in page], [4, 5, 6])
+        self.assertEqual(key, {'requestInTs': 1002, 'ids': [6]})
+        page, key = db_m.get_raw_page(4, key)
+        self.assertEqual(page, [])
+        self.assertEqual(key, {'requestInTs': 1002, 'ids': [6]})
+        # Without a key, the not corrected documents are read from the oldest
+        self.assertEqual([doc['_id'] for doc in db_m.get_raw_documents(2)], [0, 1])
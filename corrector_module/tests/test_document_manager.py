@@ -481,6 +481,44 @@ class TestDocumentManager(unittest.TestCase):
         paired = doc_m.find_orphan_match(producer, clean_orphans)
         self.assertTrue(paired)
 
+    def test_pair_documents(self):
+
+        settings = Settings()
+        doc_m = DocumentManager(settings)
+        client, producer = unit_helper.create_raw_document_pair()
+        other_client, _ = unit_helper.create_raw_document_pair()
+        other_client['messageId'] = client['messageId']
+
+        pairs, rest = doc_m.pair_documents([producer, other_client, client], 60 * 1000)
+        self.assertEqual(len(pairs), 1)
+        self.assertIs(pairs[0][0], client)
+        self.assertIs(pairs[0][1], producer)
+        self.assertEqual(rest, [other_client])
+
+        # Pairs outside the time window are not paired
+        producer['requestInTs'] = client['requestInTs'] + 60 * 1000 + 1
+        pairs, rest = doc_m.pair_documents([client, producer], 60 * 1000)
+        self.assertEqual(pairs, [])
+        self.assertEqual(len(rest), 2)
+
+    def test_get_hash(self):
+
+        settings = Settings()
+        doc_m = DocumentManager(settings)
+        client, _ = unit_helper.create_raw_document_pair()
+        expected = DocumentManager.calculate_hash(client)
+
+        # Hash stored by the collector is used
+        stored = client.copy()
+        stored['recordHash'] = 'stored'
+        stored['recordHashVersion'] = 1
+        self.assertEqual(doc_m.get_hash(stored), 'stored')
+
+        # Unknown version is recalculated, record keys are not part of the hash
+        stored['recordHashVersion'] = 2
+        stored['serviceCallKey'] = 'a/b'
+        self.assertEqual(doc_m.get_hash(stored), expected)
+
     def test_create_json(self):
 
         settings = Settings()
@@ -502,6 +540,10 @@ class TestDocumentManager(unittest.TestCase):
             new_doc['clientHash'] = client_hash
             new_doc['producerHash'] = producer_hash
             new_doc['messageId'] = new_doc['client']['messageId']
+            new_doc['serviceCallKey'] = '/'.join(client[f] or '' for f in (
+                'clientMemberClass', 'clientMemberCode', 'clientXRoadInstance', 'clientSubsystemCode', 'serviceCode',
+                'serviceVersion', 'serviceMemberClass', 'serviceMemberCode', 'serviceXRoadInstance',
+                'serviceSubsystemCode'))
 
             # Generate document with function
             default_doc = doc_m.create_json(client, producer, doc_m.calculate_hash(client),
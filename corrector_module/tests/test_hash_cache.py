@@ -0,0 +1,26 @@
+import unittest
+
+from corrector_module.correctorlib.hash_cache import HashCache
+
+
+class TestHashCache(unittest.TestCase):
+    def test_split(self):
+        cache = HashCache(10)
+        cache.add_many(['a', 'b'])
+        self.assertEqual(cache.split(['a', 'c', 'b', 'd']), ({'a', 'b'}, {'c', 'd'}))
+
+    def test_least_recently_used_dropped(self):
+        cache = HashCache(3)
+        cache.add_many(['a', 'b', 'c'])
+        # 'a' is used again, 'b' is the least recently used
+        cache.add_many(['a', 'd'])
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn('b', cache)
+        for doc_hash in ('a', 'c', 'd'):
+            self.assertIn(doc_hash, cache)
+
+    def test_disabled(self):
+        cache = HashCache(0)
+        cache.add_many(['a'])
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.split(['a']), (set(), {'a'}))
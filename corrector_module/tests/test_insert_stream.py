@@ -0,0 +1,71 @@
+import unittest
+
+import pymongo.errors
+
+from corrector_module.correctorlib.insert_stream import InsertStream
+
+
+class FakeStream:
+    def __init__(self, events):
+        self.events = list(events)
+        self.closed = False
+
+    def try_next(self):
+        if self.events:
+            return self.events.pop(0)
+        return None
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDatabaseManager:
+    def __init__(self, events, resume_token=None, resumable=True):
+        self.events = events
+        self.resume_token = resume_token
+        self.resumable = resumable
+        self.watched = []
+
+    def watch_raw_inserts(self, resume_token=None, max_await_ms=1000):
+        self.watched.append(resume_token)
+        if resume_token is not None and not self.resumable:
+            raise pymongo.errors.OperationFailure('Resume token not found')
+        return FakeStream(self.events)
+
+    def get_resume_token(self, corrector_id):
+        return self.resume_token
+
+    def save_resume_token(self, corrector_id, resume_token):
+        self.resume_token = resume_token
+
+
+class FakeLogger:
+    def log_warning(self, activity, msg):
+        pass
+
+
+class TestInsertStream(unittest.TestCase):
+    def test_micro_batches(self):
+        db_m = FakeDatabaseManager([{'_id': {'_data': i}} for i in range(5)])
+        stream = InsertStream(db_m, FakeLogger(), 'corrector_test', 2, 0.1)
+        self.assertTrue(stream.open())
+        self.assertEqual(stream.wait(1), 2)
+        self.assertEqual(stream.wait(1), 2)
+        # Last micro-batch is complete after max_wait
+        self.assertEqual(stream.wait(1), 1)
+        self.assertEqual(stream.wait(0.1), 0)
+        self.assertIsNone(db_m.resume_token)
+        stream.save()
+        self.assertEqual(db_m.resume_token, {'_data': 4})
+
+    def test_resume(self):
+        db_m = FakeDatabaseManager([], resume_token={'_data': 1})
+        stream = InsertStream(db_m, FakeLogger(), 'corrector_test', 2, 0.1)
+        self.assertTrue(stream.open())
+        self.assertEqual(db_m.watched, [{'_data': 1}])
+
+    def test_resume_token_lost(self):
+        db_m = FakeDatabaseManager([], resume_token={'_data': 1}, resumable=False)
+        stream = InsertStream(db_m, FakeLogger(), 'corrector_test', 2, 0.1)
+        self.assertTrue(stream.open())
+        self.assertEqual(db_m.watched, [{'_data': 1}, None])
@@ -0,0 +1,85 @@
+import os
+import time
+import unittest
+from unittest import mock
+
+from corrector_module.correctorlib.corrector_worker import CorrectorWorker
+from corrector_module.correctorlib.worker_pool import WorkerPool, get_partition, get_partition_chunks
+from corrector_module.tests.unit_settings import Settings
+
+
+class FakeLogger:
+    def __init__(self):
+        self.messages = []
+
+    def log_warning(self, activity, msg):
+        self.messages.append(msg)
+
+    def log_error(self, activity, msg):
+        self.messages.append(msg)
+
+
+def consume_chunk(worker, chunk, logger_m, doc_m):
+    # Fake processing: every group has one duplicate, group 'exit' stops the worker and 'sleep' hangs
+    for data in chunk:
+        if data['message_id'] == 'exit':
+            os._exit(1)
+        if data['message_id'] == 'sleep':
+            time.sleep(60)
+    return len(chunk), [(worker.worker_name, data['message_id']) for data in chunk]
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        # Workers are forked with the fake processing
+        patcher = mock.patch.object(CorrectorWorker, 'consume_chunk', consume_chunk)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.logger = FakeLogger()
+        self.pool = WorkerPool(Settings(), 2, self.logger)
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.stop(timeout=1)
+
+    def test_batches(self):
+        groups = [{'message_id': m} for m in ('a', 'b', 'c', 'd', 'e')]
+        for _ in range(2):
+            succeeded, duplicates, to_remove = self.pool.run_batch(groups, 2, 10)
+            self.assertTrue(succeeded)
+            self.assertEqual(duplicates, 5)
+            self.assertEqual(sorted(m for _, m in to_remove), ['a', 'b', 'c', 'd', 'e'])
+            # messageId is always processed by the worker of its partition
+            for name, message_id in to_remove:
+                self.assertEqual(name, 'worker_{0}'.format(get_partition(message_id, 2)))
+
+    def test_dead_worker_replaced(self):
+        workers = dict(self.pool.workers)
+        succeeded, duplicates, to_remove = self.pool.run_batch([{'message_id': 'exit'}, {'message_id': 'a'}], 1, 10)
+        self.assertFalse(succeeded)
+        self.assertEqual([m for _, m in to_remove], ['a'])
+        self.assertEqual(len(self.pool.workers), 2)
+        self.assertNotEqual(workers, self.pool.workers)
+        # Next batch uses the new worker
+        self.assertEqual(self.pool.run_batch([{'message_id': 'b'}, {'message_id': 'a'}], 1, 10)[0], True)
+
+    def test_batch_timeout(self):
+        start = time.time()
+        succeeded, _, _ = self.pool.run_batch([{'message_id': 'sleep'}], 1, 2)
+        self.assertFalse(succeeded)
+        self.assertLess(time.time() - start, 10)
+        self.assertTrue(all(p.is_alive() for p in self.pool.workers.values()))
+        self.assertEqual(self.pool.run_batch([{'message_id': 'a'}], 1, 10)[0], True)
+
+
+class TestPartitions(unittest.TestCase):
+    def test_partition_chunks(self):
+        groups = [{'message_id': str(i)} for i in range(100)] + [{'message_id': None}]
+        chunks = get_partition_chunks(groups, 4, 10)
+        self.assertEqual(sorted(data['message_id'] or '' for _, chunk in chunks for data in chunk),
+                         sorted(data['message_id'] or '' for data in groups))
+        for partition, chunk in chunks:
+            self.assertLessEqual(len(chunk), 10)
+            for data in chunk:
+                self.assertEqual(get_partition(data['message_id'], 4), partition)
+        self.assertEqual(len(set(partition for partition, _ in chunks)), 4)
@@ -6,6 +6,20 @@ class Settings:
 
     THREAD_COUNT = 4
 
+    # Time window to match documents (in milliseconds)
+    TIME_WINDOW = 1 * 60 * 1000
+
+    CORRECTOR_HASH_CACHE_SIZE = 1000
+    CORRECTOR_BULK_SIZE = 1000
+    CORRECTOR_BULK_DELAY = 5
+    CORRECTOR_PREFETCH_SIZE = 100
+    CORRECTOR_WORKER_MAX_CHUNKS = 10000
+    CORRECTOR_BATCH_TIMEOUT = 3600
+    CORRECTOR_PIPELINE_SIZE = 1
+    CORRECTOR_MODE = 'polling'
+    CORRECTOR_STREAM_MAX_DOCS = 1000
+    CORRECTOR_STREAM_MAX_WAIT = 5
+
     CALC_TOTAL_DURATION = True
     CALC_CLIENT_SS_REQUEST_DURATION = True
     CALC_CLIENT_SS_RESPONSE_DURATION = True
@@ -19,8 +33,14 @@ class Settings:
     CALC_REQUEST_SIZE = True
     CALC_RESPONSE_SIZE = True
 
+    MODULE = "corrector"
     LOGGER_NAME = "test"
 
+    MONGODB_USER = "test"
+    MONGODB_PWD = "test"
+    MONGODB_SERVER = "localhost"
+    MONGODB_DATABASE = "query_db_test"
+
     COMPARISON_LIST = ['clientMemberClass', 'requestMimeSize', 'serviceSubsystemCode', 'requestAttachmentCount',
                        'serviceSecurityServerAddress', 'messageProtocolVersion', 'responseSoapSize', 'succeeded',
                        'clientSubsystemCode', 'responseAttachmentCount', 'serviceMemberClass', 'messageUserId',
@@ -12,9 +12,9 @@ import pymongo
 from tqdm import tqdm
 
 
-def add_index(db, collection_name, index_list):
+def add_index(db, collection_name, index_list, unique=False):
     collection = db[collection_name]
-    r = collection.create_index(index_list, background=True)
+    r = collection.create_index(index_list, background=True, unique=unique)
     return r
 
 
@@ -43,11 +43,18 @@ def main():
 
     mdb_indexes = list()
     mdb_indexes.append(('server_list', [('timestamp', -1)]))
-
-    print('* Creating collector_state.server_list MongoDB indexes:')
+    mdb_indexes.append(('collector_pointer', [('server', 1)]))
+    mdb_indexes.append(('server_health', [('server', 1)]))
+    mdb_indexes.append(('collector_metrics', [('collector_id', 1)]))
+    mdb_indexes.append(('collector_nodes', [('node', 1)], True))
+    # Unique server is required by the lease takeover of sharded collectors
+    mdb_indexes.append(('server_lease', [('server', 1)], True))
+    mdb_indexes.append(('server_lease', [('node', 1)]))
+
+    print('* Creating collector_state MongoDB indexes:')
     i_list = []
     for db_ind in tqdm(mdb_indexes):
-        i_list.append(add_index(db, db_ind[0], db_ind[1]))
+        i_list.append(add_index(db, *db_ind))
 
     print('-- Total of {0} indexes created.'.format(len(i_list)))
     print('-- Index list: {0}'.format(i_list))
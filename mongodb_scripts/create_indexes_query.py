@@ -71,6 +71,7 @@ def main():
     mdb_indexes.append(('clean_data', [('correctorStatus', 1), ('producer.requestInTs', 1)]))
     mdb_indexes.append(('clean_data', [('messageId', 1), ('client.requestInTs', 1)]))
     mdb_indexes.append(('clean_data', [('messageId', 1), ('producer.requestInTs', 1)]))
+    mdb_indexes.append(('clean_data', [('serviceCallKey', 1), ('correctorTime', 1)]))
     #
     # Indexes for 'clean_data' collection, client object
     #